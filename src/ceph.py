@@ -28,6 +28,7 @@ https://github.com/juju/charm-helpers/blob/master/charmhelpers/contrib/storage/l
 """
 
 import collections
+import contextlib
 import enum
 import functools
 import ipaddress
@@ -37,11 +38,12 @@ import math
 import socket
 import subprocess
 from subprocess import CalledProcessError, check_call, check_output
-from typing import Dict, List, Tuple, TypeAlias
+from typing import Dict, List, Optional, Set, Tuple, TypeAlias
 from urllib.parse import urlsplit
 
 from tenacity import retry, stop_after_attempt, wait_fixed
 
+import pool_profiles
 import utils
 
 CRITICAL = "CRITICAL"
@@ -63,6 +65,30 @@ BULK_POOL_WEIGHT_THRESHOLD = 20.0
 LEGACY_PG_COUNT = 200
 DEFAULT_MINIMUM_PGS = 2
 AUTOSCALER_DEFAULT_PGS = 32
+# Hard limit of PGs per OSD, set as mon_max_pg_per_osd.
+MAX_PG_PER_OSD = 400
+# config-key holding the weight requested for each pool, keyed by pool name.
+POOL_WEIGHTS_KEY = "microceph-charm/pool-weights"
+# config-key holding the SIMD instruction set all storage hosts support.
+CLUSTER_SIMD_KEY = "microceph-charm/cluster-simd"
+# config-key prefix recording the OSD flags set on a host, keyed by hostname.
+HOST_OSD_FLAGS_KEY_PREFIX = "microceph-charm/host-osd-flags/"
+
+# Broker request keys of the RBD QoS options, e.g. rbd-qos-read-iops-limit
+# for rbd_qos_read_iops_limit, with their valid type and range. 0 disables
+# a limit or burst.
+RBD_QOS_VALIDATION_MAP = {
+    "rbd-qos-{}{}-{}".format(direction, kind, setting): (
+        int,
+        [1 if setting == "burst-seconds" else 0, 2**63 - 1],
+    )
+    for direction in ("", "read-", "write-")
+    for kind in ("iops", "bps")
+    for setting in ("limit", "burst", "burst-seconds")
+}
+
+# CRUSH map shared by everything running in the current hook, see get_crush_map.
+_crush_map = None
 
 LEADER = "leader"
 PEON = "peon"
@@ -365,6 +391,24 @@ def monitor_key_set(service, key, value):
         raise
 
 
+def monitor_key_delete(service, key):
+    """Delete a key and its value from the monitor cluster.
+
+    Deleting a key which does not exist succeeds.
+
+    :param service: The Ceph user name to run the command under.
+    :type service str
+    :param key: The key to delete.
+    :type key: str
+    :raises: CalledProcessError
+    """
+    try:
+        check_output(["microceph.ceph", "--id", service, "config-key", "rm", str(key)])
+    except CalledProcessError as e:
+        log("Monitor config-key rm failed with message: {}".format(e.output))
+        raise
+
+
 def erasure_profile_exists(service, name):
     """Check to see if an Erasure code profile already exists.
 
@@ -499,6 +543,107 @@ def remove_pool_snapshot(service, request):
     check_call(cmd)
 
 
+def list_rbd_namespaces(service, pool):
+    """List the RBD namespaces of a pool.
+
+    :param service: The Ceph user name to run the command under.
+    :type service: str
+    :param pool: Name of the pool.
+    :type pool: str
+    :returns: list of namespace names.
+    :raises: CalledProcessError
+    """
+    cmd = [
+        "microceph.rbd",
+        "--id",
+        service,
+        "namespace",
+        "ls",
+        "--pool",
+        pool,
+        "--format",
+        "json",
+    ]
+    out = check_output(cmd).decode("UTF-8")
+    return [entry["name"] for entry in json.loads(out or "[]")]
+
+
+def create_rbd_namespace(service, pool, namespace):
+    """Create an RBD namespace in a pool, unless it already exists.
+
+    :param service: The Ceph user name to run the command under.
+    :type service: str
+    :param pool: Name of the pool.
+    :type pool: str
+    :param namespace: Name of the namespace.
+    :type namespace: str
+    :raises: CalledProcessError
+    """
+    if namespace in list_rbd_namespaces(service, pool):
+        log("RBD namespace {}/{} exists, skipping".format(pool, namespace), level=DEBUG)
+        return
+    cmd = [
+        "microceph.rbd",
+        "--id",
+        service,
+        "namespace",
+        "create",
+        "--pool",
+        pool,
+        "--namespace",
+        namespace,
+    ]
+    check_call(cmd)
+
+
+def rbd_qos_settings(op):
+    """Return the RBD QoS options requested by a broker request.
+
+    :param op: Broker request Op.
+    :type op: Dict[str, any]
+    :returns: Dict of RBD config options and their values.
+    :raises: ValueError if a value is invalid.
+    """
+    settings = {}
+    for key, (valid_type, valid_range) in RBD_QOS_VALIDATION_MAP.items():
+        value = op.get(key)
+        if value is None:
+            continue
+        try:
+            validator(value, valid_type, valid_range)
+        except (AssertionError, ValueError) as e:
+            raise ValueError("'{}': {}".format(key, str(e)))
+        settings[key.replace("-", "_")] = value
+    return settings
+
+
+def set_rbd_qos(service, pool, settings):
+    """Set RBD QoS options of a pool.
+
+    Only options whose value changed are set, so that repeated requests do
+    not rewrite the pool's configuration. RBD has no configuration per
+    namespace, ``rbd config pool`` only takes a pool name.
+
+    :param service: The Ceph user name to run the command under.
+    :type service: str
+    :param pool: Name of the pool.
+    :type pool: str
+    :param settings: RBD config options and their values.
+    :type settings: Dict[str, int]
+    :raises: CalledProcessError
+    """
+    cmd = ["microceph.rbd", "--id", service, "config", "pool"]
+    out = check_output(cmd + ["list", pool, "--format", "json"]).decode("UTF-8")
+    current = {
+        entry["name"]: entry["value"]
+        for entry in json.loads(out or "[]")
+        if entry.get("source") == "pool"
+    }
+    for option, value in sorted(settings.items()):
+        if current.get(option) != str(value):
+            check_call(cmd + ["set", pool, option, str(value)])
+
+
 def set_app_name_for_pool(client, pool, name):
     """Calls `osd pool application enable` for the specified pool name.
 
@@ -708,6 +853,36 @@ def get_osds(service, device_class=None):
     return json.loads(out)
 
 
+def get_osd_locations() -> Dict[int, dict]:
+    """Return the host and device class of each OSD in the CRUSH map, keyed by OSD id."""
+    tree = json.loads(utils.run_cmd(["microceph.ceph", "osd", "tree", "--format=json"]))
+    nodes = tree.get("nodes", [])
+    hosts = {
+        child: node["name"]
+        for node in nodes
+        if node.get("type") == "host"
+        for child in node.get("children", [])
+    }
+    return {
+        node["id"]: {
+            "host": hosts.get(node["id"], ""),
+            "device-class": node.get("device_class", ""),
+        }
+        for node in nodes
+        if node.get("type") == "osd"
+    }
+
+
+def osd_bench(osd_id: int, total_bytes: int, block_size: int, timeout: int = 600) -> dict:
+    """Run the OSD's built-in write benchmark.
+
+    :returns: dict with bytes_written, blocksize, elapsed_sec, bytes_per_sec and iops
+    :raises: CalledProcessError if the command fails
+    """
+    cmd = ["microceph.ceph", "tell", f"osd.{osd_id}", "bench", str(total_bytes), str(block_size)]
+    return json.loads(utils.run_cmd(cmd + ["--format=json"], timeout=timeout))
+
+
 def get_osd_weight(osd_id):
     """Returns the weight of the specified OSD.
 
@@ -734,6 +909,195 @@ def get_osd_weight(osd_id):
         raise
 
 
+# PG states in which data is still moving, even if the PG is active+clean.
+_PG_MOVING_STATES = {"remapped", "backfilling", "backfill_wait", "recovering"}
+
+# PG states in which data moves to other OSDs. Recovering PGs only catch up
+# on writes missed while OSDs were down, as expected during an upgrade.
+_PG_REMAPPED_STATES = {"remapped", "backfilling", "backfill_wait"}
+
+# PG states in which a PG is not done peering yet.
+_PG_PEERING_STATES = {"creating", "peering", "activating", "unknown"}
+
+
+def set_osd_crush_weight(osd_id: int, weight: float) -> None:
+    """Set the CRUSH weight of an OSD.
+
+    :raises: CalledProcessError if the command fails
+    """
+    utils.run_cmd(["microceph.ceph", "osd", "crush", "reweight", f"osd.{osd_id}", str(weight)])
+
+
+def destroy_osd(osd_id: int) -> None:
+    """Mark a down OSD destroyed, keeping its id and CRUSH position.
+
+    :raises: CalledProcessError if the command fails, e.g. the OSD is still up
+    """
+    utils.run_cmd(["microceph.ceph", "osd", "destroy", f"osd.{osd_id}", "--yes-i-really-mean-it"])
+
+
+def get_osd_pg_counts() -> Dict[int, int]:
+    """Return the number of PGs mapped to each OSD, keyed by OSD id."""
+    df = json.loads(utils.run_cmd(["microceph.ceph", "osd", "df", "--format=json"]))
+    return {node["id"]: node.get("pgs", 0) for node in df.get("nodes", [])}
+
+
+def get_pg_states() -> Dict[str, int]:
+    """Return the number of PGs in each state, e.g. {"active+clean": 32}."""
+    stat = json.loads(utils.run_cmd(["microceph.ceph", "pg", "stat", "--format=json"]))
+    # Newer releases nest the summary, older ones return it at the top level.
+    summary = stat.get("pg_summary", stat)
+    return {state["name"]: state["num"] for state in summary.get("num_pg_by_state", [])}
+
+
+def get_pg_state_counts() -> Tuple[int, int]:
+    """Return the number of active+clean PGs and the total number of PGs.
+
+    PGs which are only scrubbing count as active+clean.
+    """
+    states = get_pg_states()
+    clean = 0
+    for name, num in states.items():
+        parts = set(name.split("+"))
+        if {"active", "clean"} <= parts and not parts & _PG_MOVING_STATES:
+            clean += num
+    return clean, sum(states.values())
+
+
+def get_remapped_pg_count() -> int:
+    """Return the number of PGs whose data is remapped or backfilled."""
+    return sum(
+        num for name, num in get_pg_states().items() if set(name.split("+")) & _PG_REMAPPED_STATES
+    )
+
+
+def get_peering_pg_count() -> int:
+    """Return the number of PGs which are not done peering yet."""
+    return sum(
+        num for name, num in get_pg_states().items() if set(name.split("+")) & _PG_PEERING_STATES
+    )
+
+
+def get_misplaced_ratio() -> float:
+    """Return the fraction of objects currently misplaced, 0 when none are."""
+    status = json.loads(utils.run_cmd(["microceph.ceph", "status", "--format=json"]))
+    return float(status.get("pgmap", {}).get("misplaced_ratio", 0.0))
+
+
+def get_osd_flags() -> set:
+    """Return the cluster-wide OSD flags currently set, e.g. noout."""
+    dump = json.loads(utils.run_cmd(["microceph.ceph", "osd", "dump", "--format=json"]))
+    return {flag for flag in dump.get("flags", "").split(",") if flag}
+
+
+def set_osd_flag(flag: str) -> None:
+    """Set a cluster-wide OSD flag.
+
+    :raises: CalledProcessError if the command fails
+    """
+    utils.run_cmd(["microceph.ceph", "osd", "set", flag])
+
+
+def unset_osd_flag(flag: str) -> None:
+    """Unset a cluster-wide OSD flag.
+
+    :raises: CalledProcessError if the command fails
+    """
+    utils.run_cmd(["microceph.ceph", "osd", "unset", flag])
+
+
+@contextlib.contextmanager
+def osd_flags(*flags: str):
+    """Set cluster-wide OSD flags for the duration of the block.
+
+    Flags which were already set beforehand are left alone, so an operator's
+    own flags are never cleared on exit.
+    """
+    current = get_osd_flags() if flags else set()
+    added = [flag for flag in flags if flag not in current]
+    for flag in added:
+        set_osd_flag(flag)
+    try:
+        yield
+    finally:
+        for flag in added:
+            try:
+                unset_osd_flag(flag)
+            except CalledProcessError as e:
+                log("Failed to unset osd flag {}: {}".format(flag, e), WARNING)
+
+
+def set_group_flag(flag: str, who: str) -> None:
+    """Set an OSD flag, such as noout, on a CRUSH bucket or OSD only.
+
+    :raises: CalledProcessError if the command fails
+    """
+    utils.run_cmd(["microceph.ceph", "osd", "set-group", flag, who])
+
+
+def unset_group_flag(flag: str, who: str) -> None:
+    """Unset an OSD flag set on a CRUSH bucket or OSD.
+
+    :raises: CalledProcessError if the command fails
+    """
+    utils.run_cmd(["microceph.ceph", "osd", "unset-group", flag, who])
+
+
+def clear_host_osd_flags(host: str) -> List[str]:
+    """Unset the OSD flags recorded for a host by host_osd_flags.
+
+    Flags of a host_osd_flags block which never finished, e.g. as its hook
+    was killed, are recorded in a config-key and cleared here.
+
+    :returns: the flags which were cleared
+    :raises: CalledProcessError if a flag cannot be unset
+    """
+    key = HOST_OSD_FLAGS_KEY_PREFIX + host
+    recorded = monitor_key_get("admin", key)
+    if not recorded:
+        return []
+    flags = json.loads(recorded)
+    for flag in flags:
+        unset_group_flag(flag, host)
+    monitor_key_delete("admin", key)
+    return flags
+
+
+@contextlib.contextmanager
+def host_osd_flags(host: str, *flags: str):
+    """Set OSD flags on the OSDs of a host for the duration of the block.
+
+    The flags are recorded in a config-key before they are set, so that
+    clear_host_osd_flags can still clear them if the block never finishes.
+    """
+    clear_host_osd_flags(host)
+    monitor_key_set("admin", HOST_OSD_FLAGS_KEY_PREFIX + host, json.dumps(list(flags)))
+    for flag in flags:
+        set_group_flag(flag, host)
+    try:
+        yield
+    finally:
+        try:
+            clear_host_osd_flags(host)
+        except CalledProcessError as e:
+            log("Failed to unset osd flags on {}: {}".format(host, e), WARNING)
+
+
+def get_host_down_osds(host: str) -> List[int]:
+    """Return the ids of the OSDs of a CRUSH host which are down."""
+    tree = json.loads(utils.run_cmd(["microceph.ceph", "osd", "tree", "--format=json"]))
+    nodes = tree.get("nodes", [])
+    children = set()
+    for node in nodes:
+        if node.get("type") == "host" and node.get("name") == host:
+            children.update(node.get("children", []))
+    return sorted(
+        node["id"]
+        for node in nodes
+        if node.get("type") == "osd" and node["id"] in children and node.get("status") != "up"
+    )
+
+
 def get_erasure_profile(service, name):
     """Get an existing erasure code profile if it exists.
 
@@ -762,6 +1126,391 @@ def get_erasure_profile(service, name):
         return None
 
 
+def get_pool_weights(service) -> Dict[str, float]:
+    """Return the weight (percent_data) recorded for each pool."""
+    weights = monitor_key_get(service, POOL_WEIGHTS_KEY)
+    return json.loads(weights) if weights else {}
+
+
+def record_pool_weight(service, pool_name: str, weight: float) -> None:
+    """Record the weight of a pool, so the PG budget takes it into account.
+
+    :raises: CalledProcessError
+    """
+    weights = get_pool_weights(service)
+    if weights.get(pool_name) != weight:
+        weights[pool_name] = weight
+        monitor_key_set(service, POOL_WEIGHTS_KEY, json.dumps(weights, sort_keys=True))
+
+
+def get_cluster_simd(service) -> str:
+    """Return the SIMD instruction set all storage hosts support."""
+    return (monitor_key_get(service, CLUSTER_SIMD_KEY) or "none").strip()
+
+
+def record_cluster_simd(service, simd: str) -> None:
+    """Record the SIMD instruction set all storage hosts support.
+
+    :raises: CalledProcessError
+    """
+    if get_cluster_simd(service) != simd:
+        monitor_key_set(service, CLUSTER_SIMD_KEY, simd)
+
+
+def get_crush_map() -> dict:
+    """Return the CRUSH map, dumped once and reused for the rest of the hook."""
+    global _crush_map
+    if _crush_map is None:
+        _crush_map = json.loads(
+            utils.run_cmd(["microceph.ceph", "osd", "crush", "dump", "--format=json"])
+        )
+    return _crush_map
+
+
+def invalidate_crush_map() -> None:
+    """Drop the cached CRUSH map, e.g. after a pool created a CRUSH rule."""
+    global _crush_map
+    _crush_map = None
+
+
+def get_rule_selection(rule) -> Optional[dict]:
+    """Return what a CRUSH rule selects OSDs from.
+
+    :param rule: name or id of the CRUSH rule
+    :returns: dict with the ``root`` bucket, the ``device-class`` ("" for any
+        class) and the ``failure-domain`` bucket type, or None if there is no
+        such rule
+    """
+    for candidate in get_crush_map().get("rules", []):
+        if rule in (candidate.get("rule_name"), candidate.get("rule_id")):
+            break
+    else:
+        return None
+
+    selection = {"root": "default", "device-class": "", "failure-domain": "osd"}
+    for step in candidate.get("steps", []):
+        if step["op"] == "take":
+            # Rules restricted to a device class take from the shadow tree, e.g. default~ssd.
+            root, _, device_class = step["item_name"].partition("~")
+            selection.update({"root": root, "device-class": device_class})
+        elif step["op"].startswith("choose"):
+            selection["failure-domain"] = step.get("type", "osd")
+    return selection
+
+
+def count_selectable_osds(
+    root: str = "default", device_class: str = "", failure_domain: str = "host"
+) -> Tuple[int, int]:
+    """Count the OSDs and failure domains a CRUSH rule can select from.
+
+    :param root: name of the bucket the rule takes from
+    :param device_class: device class the rule is restricted to, "" for any
+    :param failure_domain: bucket type replicas are spread across
+    :returns: the number of OSDs and of failure domains holding any of them
+    """
+    crush = get_crush_map()
+    buckets = {bucket["id"]: bucket for bucket in crush.get("buckets", [])}
+    classes = {device["id"]: device.get("class", "") for device in crush.get("devices", [])}
+    osds, domains = set(), set()
+
+    def walk(bucket: dict, domain):
+        for item in bucket.get("items", []):
+            if item["id"] >= 0:
+                if not device_class or classes.get(item["id"]) == device_class:
+                    osds.add(item["id"])
+                    domains.add(domain if domain is not None else item["id"])
+            elif item["id"] in buckets:
+                child = buckets[item["id"]]
+                walk(child, child["name"] if child.get("type_name") == failure_domain else domain)
+
+    for bucket in buckets.values():
+        if bucket["name"] == root:
+            walk(bucket, bucket["name"] if bucket.get("type_name") == failure_domain else None)
+    return len(osds), len(domains)
+
+
+def get_host_buckets() -> Dict[str, List[Tuple[str, str]]]:
+    """Return the buckets holding each CRUSH host bucket.
+
+    :returns: (type, name) of the host and of each bucket above it, nearest
+        first, keyed by host name
+    """
+    buckets = get_crush_map().get("buckets", [])
+    parents = {item["id"]: bucket for bucket in buckets for item in bucket.get("items", [])}
+    hosts = {}
+    for bucket in buckets:
+        if bucket.get("type_name") != "host":
+            continue
+        chain = [bucket]
+        while chain[-1]["id"] in parents and len(chain) <= len(buckets):
+            chain.append(parents[chain[-1]["id"]])
+        hosts[bucket["name"]] = [(b.get("type_name", ""), b["name"]) for b in chain]
+    return hosts
+
+
+def get_host_failure_domain(chain: List[Tuple[str, str]]) -> Tuple[str, str]:
+    """Return the (type, name) of the failure domain of a host.
+
+    A host's failure domain is the bucket holding it, such as a rack, or the
+    host itself when it sits right under a root.
+
+    :param chain: the buckets holding the host, as for get_host_buckets
+    """
+    if len(chain) < 2 or chain[1][0] == "root":
+        return chain[0]
+    return chain[1]
+
+
+def get_host_failure_domains() -> Dict[str, str]:
+    """Return the failure domain of each CRUSH host bucket."""
+    return {host: get_host_failure_domain(chain)[1] for host, chain in get_host_buckets().items()}
+
+
+def get_pool_failure_domains() -> Set[str]:
+    """Return the bucket types the CRUSH rules of all pools spread data across.
+
+    Pools whose rule cannot be found count as spreading across OSDs.
+
+    :raises: CalledProcessError, TimeoutExpired, ValueError
+    """
+    domains = set()
+    for pool in list_pools_detail():
+        selection = get_rule_selection(pool["crush-rule"]) or {}
+        domains.add(selection.get("failure-domain", "osd"))
+    return domains
+
+
+def get_mon_quorum() -> Tuple[List[str], List[str]]:
+    """Return the names of all mons and of the mons in quorum.
+
+    :raises: CalledProcessError, TimeoutExpired, ValueError
+    """
+    status = json.loads(utils.run_cmd(["microceph.ceph", "quorum_status", "--format", "json"]))
+    mons = [mon["name"] for mon in status.get("monmap", {}).get("mons", [])]
+    return mons, status.get("quorum_names", [])
+
+
+def create_replicated_rule(device_class: str, failure_domain: str, root: str = "default") -> str:
+    """Create a replicated CRUSH rule restricted to a device class.
+
+    Creating a rule which already exists with the same settings succeeds.
+
+    :returns: the name of the rule
+    :raises: CalledProcessError
+    """
+    name = f"replicated-{device_class}-{failure_domain}"
+    utils.run_cmd(
+        [
+            "microceph.ceph",
+            "osd",
+            "crush",
+            "rule",
+            "create-replicated",
+            name,
+            root,
+            failure_domain,
+            device_class,
+        ]
+    )
+    invalidate_crush_map()
+    return name
+
+
+def get_crush_rule_classes() -> Dict[int, str]:
+    """Return the device class each CRUSH rule takes OSDs from, "" for any class."""
+    return {
+        rule["rule_id"]: get_rule_selection(rule["rule_id"])["device-class"]
+        for rule in get_crush_map().get("rules", [])
+    }
+
+
+def list_pools_detail() -> List[dict]:
+    """Return the size, PG count, device class, autoscale mode and quota of every pool."""
+    pools = json.loads(
+        utils.run_cmd(["microceph.ceph", "osd", "pool", "ls", "detail", "--format=json"])
+    )
+    rule_classes = get_crush_rule_classes()
+    return [
+        {
+            "name": pool["pool_name"],
+            "size": pool["size"],
+            "pg_num": pool["pg_num"],
+            "device-class": rule_classes.get(pool["crush_rule"], ""),
+            "crush-rule": pool["crush_rule"],
+            "autoscale": pool.get("pg_autoscale_mode", "on"),
+            "quota-bytes": pool.get("quota_max_bytes", 0),
+            "options": pool.get("options", {}),
+        }
+        for pool in pools
+    ]
+
+
+def target_size_settings(pools: List[dict], weights: Dict[str, float]) -> Dict[str, dict]:
+    """Translate pool weights into the autoscaler's target size settings.
+
+    Pools with a byte quota target that quota. The others target their
+    weight's share of the cluster, with the weights scaled down when they
+    add up to more than 100%, so every new pool renormalizes the others.
+    Pools without a recorded weight are left alone.
+
+    :param pools: pools as returned by list_pools_detail
+    :param weights: weight (percent_data) of the managed pools
+    :returns: the settings to change, keyed by pool name
+    """
+    managed = [pool for pool in pools if pool["name"] in weights]
+    total = max(100.0, sum(weights[p["name"]] for p in managed if not p["quota-bytes"]))
+
+    changes = {}
+    for pool in managed:
+        options = pool["options"]
+        if pool["quota-bytes"]:
+            ratio, size = 0.0, pool["quota-bytes"]
+        else:
+            ratio, size = round(weights[pool["name"]] / total, 4), 0
+        if (
+            abs(float(options.get("target_size_ratio", 0)) - ratio) > 1e-4
+            or int(options.get("target_size_bytes", 0)) != size
+        ):
+            # The two are exclusive, the autoscaler ignores the ratio when both are set.
+            changes[pool["name"]] = {
+                "target_size_ratio": str(ratio),
+                "target_size_bytes": str(size),
+            }
+    return changes
+
+
+def apply_target_sizes(service) -> None:
+    """Align the target size of every managed pool with the recorded weights."""
+    changes = target_size_settings(list_pools_detail(), get_pool_weights(service))
+    for pool_name, settings in changes.items():
+        try:
+            update_pool(service, pool_name, settings)
+        except CalledProcessError as e:
+            log("Could not set target size of pool {}: {}".format(pool_name, e), WARNING)
+
+
+def round_pgs(num_pg: float) -> int:
+    """Round a PG count to a power of two, at least DEFAULT_MINIMUM_PGS.
+
+    The CRUSH algorithm has a slight optimization for placement groups with
+    powers of 2, so the nearest lower power of 2 is used unless it is more
+    than 25% below num_pg, in which case the next higher one is.
+    """
+    # NOTE: ensure a sane minimum number of PGS otherwise we don't get any
+    #       reasonable data distribution in minimal OSD configurations
+    if num_pg < DEFAULT_MINIMUM_PGS:
+        num_pg = DEFAULT_MINIMUM_PGS
+
+    exponent = math.floor(math.log(num_pg, 2))
+    nearest = 2**exponent
+    if (num_pg - nearest) > (num_pg * 0.25):
+        return int(nearest * 2)
+    return int(nearest)
+
+
+def allocate_pgs(
+    pools: List[dict],
+    osd_counts: Dict[str, int],
+    target_pgs_per_osd: int = DEFAULT_PGS_PER_OSD_TARGET,
+    max_pgs_per_osd: int = MAX_PG_PER_OSD,
+) -> Dict[str, int]:
+    """Distribute a per-OSD PG budget over all pools at once.
+
+    Each pool gets its weight's share of ``target_pgs_per_osd`` PG replicas on
+    every OSD it can use, i.e. the OSDs of its device class or all OSDs. The
+    weights are percentages; when they add up to more than 100 they are
+    scaled down so the pools together stay within the budget. Counts are then
+    rounded to powers of two, and the largest pools are halved until no OSD
+    holds more than ``max_pgs_per_osd`` PGs.
+
+    :param pools: dicts with the pool ``name``, ``weight``, ``size`` (replicas
+        or k+m) and ``device-class`` ("" for any class), and optionally the
+        number of ``osds`` its CRUSH rule can select
+    :param osd_counts: number of OSDs per device class
+    :param target_pgs_per_osd: PG replicas per OSD to aim for
+    :param max_pgs_per_osd: hard limit of PG replicas per OSD
+    :returns: PG count keyed by pool name
+    """
+    total_osds = sum(osd_counts.values())
+    total_weight = max(100.0, sum(pool["weight"] for pool in pools))
+
+    def osds_of(pool):
+        if pool.get("osds"):
+            return pool["osds"]
+        return osd_counts.get(pool["device-class"], 0) if pool["device-class"] else total_osds
+
+    pgs = {}
+    for pool in pools:
+        budget = target_pgs_per_osd * osds_of(pool) * pool["weight"] / total_weight
+        pgs[pool["name"]] = round_pgs(budget / pool["size"])
+
+    def load(pool):
+        # PG replicas the pool puts on each of its OSDs.
+        return pgs[pool["name"]] * pool["size"] / max(osds_of(pool), 1)
+
+    for device_class in osd_counts:
+        users = [p for p in pools if p["device-class"] in ("", device_class)]
+        while sum(load(p) for p in users) > max_pgs_per_osd:
+            shrinkable = [p for p in users if pgs[p["name"]] > DEFAULT_MINIMUM_PGS]
+            if not shrinkable:
+                log(f"PG budget of {device_class or 'all'} OSDs exceeded at minimum", WARNING)
+                break
+            pgs[max(shrinkable, key=load)["name"]] //= 2
+
+    return pgs
+
+
+def _rule_osd_count(rule) -> int:
+    """Return the number of OSDs a CRUSH rule can select, 0 if unknown."""
+    selection = get_rule_selection(rule)
+    if not selection:
+        return 0
+    return count_selectable_osds(
+        selection["root"], selection["device-class"], selection["failure-domain"]
+    )[0]
+
+
+def plan_pg_budget(service, requested: Optional[List[dict]] = None) -> List[dict]:
+    """Compare the PG count of every pool against the cluster-wide PG budget.
+
+    :param requested: pools about to be created, as for allocate_pgs
+    :returns: one dict per pool with its ``current`` and ``optimal`` PG count,
+        and its ``autoscale`` mode
+    """
+    weights = get_pool_weights(service)
+    pools = [
+        {
+            **pool,
+            "current": pool["pg_num"],
+            "weight": weights.get(pool["name"], DEFAULT_POOL_WEIGHT),
+            "osds": _rule_osd_count(pool["crush-rule"]),
+        }
+        for pool in list_pools_detail()
+    ]
+    existing = {pool["name"] for pool in pools}
+    pools += [
+        {**pool, "current": 0, "autoscale": "on"}
+        for pool in requested or []
+        if pool["name"] not in existing
+    ]
+
+    osd_counts = collections.Counter(
+        location["device-class"] for location in get_osd_locations().values()
+    )
+    target = config("pgs-per-osd") or DEFAULT_PGS_PER_OSD_TARGET
+    optimal = allocate_pgs(pools, osd_counts, target) if osd_counts else {}
+    return [
+        {
+            "pool": pool["name"],
+            "device-class": pool["device-class"],
+            "current": pool["current"],
+            "optimal": optimal.get(pool["name"], pool["current"]),
+            "autoscale": pool["autoscale"],
+        }
+        for pool in pools
+    ]
+
+
 class PoolCreationError(Exception):
     """A custom exception to inform the caller that a pool creation failed.
 
@@ -794,6 +1543,7 @@ class BasePool(object):
         "compression-max-blob-size-hdd": (int, None),
         "compression-max-blob-size-ssd": (int, None),
         "rbd-mirroring-mode": (str, ("image", "pool")),
+        **RBD_QOS_VALIDATION_MAP,
     }
 
     def __init__(self, service, name=None, percent_data=None, app_name=None, op=None):
@@ -813,9 +1563,14 @@ class BasePool(object):
         :param app_name: Ceph application name, usually one of:
                          ('cephfs', 'rbd', 'rgw') (default: 'unknown')
         :type app_name: Optional[str]
-        :param op: Broker request Op to compile pool data from.
+        :param op: Broker request Op to compile pool data from. Its
+                   ``workload-profile``, or the profile inferred from the
+                   application and pool name, tunes the pool when it is
+                   created. Only a requested profile places the pool on a
+                   device class and retunes pools which already exist.
         :type op: Optional[Dict[str,any]]
         :raises: KeyError
+        :raises: ValueError if the requested workload profile does not exist
         """
         # NOTE: Do not perform initialization steps that require live data from
         # a running cluster here. The *Pool classes may be used for validation.
@@ -836,6 +1591,12 @@ class BasePool(object):
         # Set defaults for these if they are not provided
         self.percent_data = self.percent_data or 10.0
         self.app_name = self.app_name or "unknown"
+        self.workload_profile = None
+        self.workload_profile_requested = bool(self.op.get("workload-profile"))
+        if op:
+            self.workload_profile = pool_profiles.resolve_profile(
+                op.get("workload-profile"), self.app_name, self.name
+            )
 
     def validate(self):
         """Check that value of supplied operation parameters are valid.
@@ -889,6 +1650,9 @@ class BasePool(object):
                     "Could not configure auto scaling for pool {}: {}".format(self.name, e),
                     level=WARNING,
                 )
+        if not self.workload_profile_requested:
+            # update() only applies requested profiles.
+            self.set_workload_profile()
 
     def create(self):
         """Create pool and perform any post pool creation tasks.
@@ -903,6 +1667,8 @@ class BasePool(object):
         if not pool_exists(self.service, self.name):
             self.validate()
             self._create()
+            # The pool may have come with a new CRUSH rule.
+            invalidate_crush_map()
             self._post_create()
             self.update()
 
@@ -946,6 +1712,20 @@ class BasePool(object):
         if compression_properties:
             update_pool(self.service, self.name, compression_properties)
 
+    def set_rbd_qos(self):
+        """Set RBD QoS limits if requested or part of the workload profile.
+
+        Limits explicitly requested by the client take precedence over the
+        requested workload profile's.
+
+        :raises: CalledProcessError
+        """
+        profile = self._requested_profile()
+        settings = dict(profile.rbd_qos) if profile else {}
+        settings.update(rbd_qos_settings(self.op))
+        if settings:
+            set_rbd_qos(self.service, self.name, settings)
+
     def update(self):
         """Update properties for an already existing pool.
 
@@ -955,8 +1735,58 @@ class BasePool(object):
         self.validate()
         self.set_quota()
         self.set_compression()
+        self.set_rbd_qos()
+        if self.workload_profile_requested:
+            self.set_workload_profile()
+        self.set_target_size()
+
+    def _requested_profile(self):
+        """Return the workload profile if the client requested it, else None."""
+        return self.workload_profile if self.workload_profile_requested else None
+
+    def set_target_size(self):
+        """Record the pool's weight and renormalize the target size of all pools.
+
+        The autoscaler then sizes pools for the data they are expected to
+        hold, rather than splitting PGs again and again as data grows. The
+        target_size_ratio of a requested workload profile takes the place of
+        the weight.
 
-    def get_pgs(self, pool_size, percent_data=DEFAULT_POOL_WEIGHT, device_class=None):
+        :raises: CalledProcessError
+        """
+        weight = self.percent_data
+        profile = self._requested_profile()
+        if profile and profile.target_size_ratio is not None:
+            weight = profile.target_size_ratio * 100
+        record_pool_weight(self.service, self.name, weight)
+        apply_target_sizes(self.service)
+
+    def set_workload_profile(self):
+        """Apply the settings of the pool's workload profile.
+
+        Placement is only chosen when the pool is created, so existing pools
+        are not moved to other OSDs. Pools which already exist are only
+        retuned when the client requests a profile.
+
+        :raises: CalledProcessError
+        """
+        if self.workload_profile:
+            update_pool(self.service, self.name, self._workload_profile_settings())
+
+    def _workload_profile_settings(self):
+        """Return the pool settings of the workload profile."""
+        profile = self.workload_profile
+        settings = {"pg_autoscale_bias": str(profile.autoscale_bias)}
+        if profile.pg_num_min:
+            settings["pg_num_min"] = str(profile.pg_num_min)
+        # Compression explicitly requested by the client takes precedence.
+        if profile.compression_mode and not self.op.get("compression-mode"):
+            settings["compression_mode"] = profile.compression_mode
+        return settings
+
+    def get_pgs(
+        self, pool_size, percent_data=DEFAULT_POOL_WEIGHT, device_class=None, crush_rule=None
+    ):
         """Return the number of placement groups to use when creating the pool.
 
         Returns the number of placement groups which should be specified when
@@ -972,13 +1802,10 @@ class BasePool(object):
 
         Per the upstream guidelines, the OSD # should really be considered
         based on the number of OSDs which are eligible to be selected by the
-        pool. Since the pool creation doesn't specify any of CRUSH set rules,
-        the default rule will be dependent upon the type of pool being
-        created (replicated or erasure).
-
-        This code makes no attempt to determine the number of OSDs which can be
-        selected for the specific rule, rather it is left to the user to tune
-        in the form of 'expected-osd-count' config option.
+        pool. When the pool's CRUSH rule is given, the OSDs under the rule's
+        root and of its device class are counted in the CRUSH map. Otherwise
+        all OSDs, or those of the device class, are counted, and it is left to
+        the user to tune in the form of 'expected-osd-count' config option.
 
         :param pool_size: pool_size is either the number of replicas for
             replicated pools or the K+M sum for erasure coded pools
@@ -995,6 +1822,9 @@ class BasePool(object):
             calculation; ceph supports nvme, ssd and hdd by default based
             on presence of devices of each type in the deployment.
         :type device_class: str
+        :param crush_rule: name or id of the pool's CRUSH rule, or what the
+            rule selects as returned by get_rule_selection
+        :type crush_rule: Optional[Union[str, int, dict]]
         :returns: The number of pgs to use.
         :rtype: int
         """
@@ -1007,6 +1837,42 @@ class BasePool(object):
         if percent_data is None:
             percent_data = DEFAULT_POOL_WEIGHT
 
+        osd_count = self._rule_osd_count(crush_rule, pool_size)
+        if not osd_count:
+            osd_count = self._listed_osd_count(device_class)
+        if not osd_count:
+            # NOTE(james-page): Default to 200 for older ceph versions
+            # which don't support OSD query from cli
+            return LEGACY_PG_COUNT
+
+        percent_data /= 100.0
+        target_pgs_per_osd = config("pgs-per-osd") or DEFAULT_PGS_PER_OSD_TARGET
+        num_pg = (target_pgs_per_osd * osd_count * percent_data) // pool_size
+        return round_pgs(num_pg)
+
+    def _rule_osd_count(self, crush_rule, pool_size) -> int:
+        """Count the OSDs the CRUSH rule can select, 0 if there is no rule."""
+        if crush_rule is None:
+            return 0
+        selection = crush_rule if isinstance(crush_rule, dict) else get_rule_selection(crush_rule)
+        if not selection:
+            log("CRUSH rule {} not found".format(crush_rule), WARNING)
+            return 0
+
+        osds, domains = count_selectable_osds(
+            selection["root"], selection["device-class"], selection["failure-domain"]
+        )
+        if osds and domains < pool_size:
+            log(
+                "Only {} {} failure domains for pool {} of size {}".format(
+                    domains, selection["failure-domain"], self.name, pool_size
+                ),
+                WARNING,
+            )
+        return osds
+
+    def _listed_osd_count(self, device_class) -> int:
+        """Count all OSDs, or those of the device class, 0 if none are known."""
         # If the expected-osd-count is specified, then use the max between
         # the expected-osd-count and the actual osd_count
         osd_list = get_osds(self.service, device_class)
@@ -1028,37 +1894,39 @@ class BasePool(object):
                     "Using the actual count instead",
                     INFO,
                 )
-        elif expected:
-            # Use the expected-osd-count in older ceph versions to allow for
-            # a more accurate pg calculations
-            osd_count = expected
-        else:
-            # NOTE(james-page): Default to 200 for older ceph versions
-            # which don't support OSD query from cli
-            return LEGACY_PG_COUNT
+            return osd_count
+        # Use the expected-osd-count in older ceph versions to allow for
+        # a more accurate pg calculations
+        return expected
 
-        percent_data /= 100.0
-        target_pgs_per_osd = config("pgs-per-osd") or DEFAULT_PGS_PER_OSD_TARGET
-        num_pg = (target_pgs_per_osd * osd_count * percent_data) // pool_size
+    def get_budgeted_pgs(self, pool_size, crush_rule=None):
+        """Return this pool's share of the cluster-wide PG budget.
 
-        # NOTE: ensure a sane minimum number of PGS otherwise we don't get any
-        #       reasonable data distribution in minimal OSD configurations
-        if num_pg < DEFAULT_MINIMUM_PGS:
-            num_pg = DEFAULT_MINIMUM_PGS
-
-        # The CRUSH algorithm has a slight optimization for placement groups
-        # with powers of 2 so find the nearest power of 2. If the nearest
-        # power of 2 is more than 25% below the original value, the next
-        # highest value is used. To do this, find the nearest power of 2 such
-        # that 2^n <= num_pg, check to see if its within the 25% tolerance.
-        exponent = math.floor(math.log(num_pg, 2))
-        nearest = 2**exponent
-        if (num_pg - nearest) > (num_pg * 0.25):
-            # Choose the next highest power of 2 since the nearest is more
-            # than 25% below the original value.
-            return int(nearest * 2)
-        else:
-            return int(nearest)
+        Unlike get_pgs, the count accounts for every other pool, so pools
+        created later are not squeezed against mon_max_pg_per_osd. Falls back
+        to get_pgs while no OSD is known.
+
+        :param pool_size: number of replicas, or k+m for erasure coded pools
+        :type pool_size: int
+        :param crush_rule: as for get_pgs
+        :type crush_rule: Optional[Union[str, int, dict]]
+        :returns: The number of pgs to use.
+        :rtype: int
+        """
+        selection = crush_rule if isinstance(crush_rule, dict) else None
+        if crush_rule is not None and selection is None:
+            selection = get_rule_selection(crush_rule)
+        requested = {
+            "name": self.name,
+            "weight": self.percent_data,
+            "size": pool_size,
+            "device-class": (selection or {}).get("device-class", ""),
+            "osds": self._rule_osd_count(selection, pool_size) if selection else 0,
+        }
+        for entry in plan_pg_budget(self.service, requested=[requested]):
+            if entry["pool"] == self.name and entry["optimal"]:
+                return entry["optimal"]
+        return self.get_pgs(pool_size, self.percent_data, crush_rule=crush_rule)
 
 
 class ErasurePool(BasePool):
@@ -1126,7 +1994,13 @@ class ErasurePool(BasePool):
 
         k = int(erasure_profile["k"])
         m = int(erasure_profile["m"])
-        pgs = self.get_pgs(k + m, self.percent_data)
+        # The pool's CRUSH rule is only created along with the pool.
+        selection = {
+            "root": erasure_profile.get("crush-root", "default"),
+            "device-class": erasure_profile.get("crush-device-class", ""),
+            "failure-domain": erasure_profile.get("crush-failure-domain", "host"),
+        }
+        pgs = self.get_budgeted_pgs(k + m, crush_rule=selection)
         cmd = [
             "microceph.ceph",
             "--id",
@@ -1145,9 +2019,16 @@ class ErasurePool(BasePool):
 
     def _post_create(self):
         super(ErasurePool, self)._post_create()
-        if self.allow_ec_overwrites:
+        profile = self.workload_profile
+        if self.allow_ec_overwrites or (profile and profile.ec_overwrites):
             update_pool(self.service, self.name, {"allow_ec_overwrites": "true"})
 
+    def _workload_profile_settings(self):
+        settings = super(ErasurePool, self)._workload_profile_settings()
+        if self.workload_profile.fast_read:
+            settings["fast_read"] = "1"
+        return settings
+
 
 class ReplicatedPool(BasePool):
     """Handles Replicated Pool."""
@@ -1219,11 +2100,43 @@ class ReplicatedPool(BasePool):
         if self.percent_data > BULK_POOL_WEIGHT_THRESHOLD:
             cmd.append("--bulk")
 
-        if self.profile_name:
-            cmd.append(self.profile_name)
+        crush_rule = self.profile_name or self._workload_crush_rule()
+        if crush_rule:
+            cmd.append(crush_rule)
 
         check_call(cmd)
 
+    def _workload_crush_rule(self):
+        """Return a CRUSH rule placing the pool on its profile's device class.
+
+        Only a requested workload profile places the pool. Replicas are
+        always spread over hosts, so the default rule is used unless enough
+        hosts hold OSDs of the device class.
+
+        :returns: the rule name, or None to use the default rule
+        :rtype: Optional[str]
+        """
+        profile = self._requested_profile()
+        if not profile:
+            return None
+        available = {device.get("class") for device in get_crush_map().get("devices", [])}
+        for device_class in profile.device_classes:
+            if device_class in available:
+                break
+        else:
+            return None
+
+        _, hosts = count_selectable_osds("default", device_class, "host")
+        if hosts < self.replicas:
+            log(
+                "Only {} hosts hold {} OSDs, {} needs {}; using the default rule".format(
+                    hosts, device_class, self.name, self.replicas
+                ),
+                level=WARNING,
+            )
+            return None
+        return create_replicated_rule(device_class, "host")
+
     def _post_create(self):
         # Set the pool replica size
         update_pool(client=self.service, pool=self.name, settings={"size": str(self.replicas)})
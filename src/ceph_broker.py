@@ -27,16 +27,21 @@ import os
 from subprocess import CalledProcessError, check_call, check_output
 from tempfile import NamedTemporaryFile
 
+import erasure_profiles
 from ceph import (
     DEBUG,
     ERROR,
     INFO,
+    RBD_QOS_VALIDATION_MAP,
     WARNING,
     ErasurePool,
     ReplicatedPool,
+    count_selectable_osds,
     create_fs_volume,
+    create_rbd_namespace,
     delete_pool,
     erasure_profile_exists,
+    get_cluster_simd,
     get_osd_weight,
     get_osds,
     list_fs_volumes,
@@ -44,13 +49,19 @@ from ceph import (
     monitor_key_get,
     monitor_key_set,
     pool_exists,
+    rbd_qos_settings,
     remove_pool_snapshot,
     rename_pool,
+    set_rbd_qos,
     snapshot_pool,
 )
+from pool_profiles import resolve_profile
 
 DEFAULT_CEPHFS_NAME = "cephfs"
 
+# rbd config only applies to pools and images, not to RBD namespaces.
+RBD_NAMESPACE_QOS_MSG = "RBD QoS limits can only be set per pool, not per RBD namespace."
+
 
 def decode_req_encode_rsp(f):
     """Decorator to decode incoming requests and encode responses."""
@@ -163,8 +174,7 @@ def pool_permission_list_for_service(service):
     for permission, groups in permission_types.items():
         permission = "allow {}".format(permission)
         for group in groups:
-            for pool in service["groups"][group].get("pools", []):
-                permissions.append("{} pool={}".format(permission, pool))
+            permissions.extend(_group_permissions(permission, service["groups"][group]))
     for permission, prefixes in sorted(service.get("object_prefix_perms", {}).items()):
         for prefix in prefixes:
             permissions.append("allow {} object_prefix {}".format(permission, prefix))
@@ -176,6 +186,15 @@ def pool_permission_list_for_service(service):
     ]
 
 
+def _group_permissions(permission, group):
+    """Build the OSD caps granting a permission on the pools of a group."""
+    permissions = ["{} pool={}".format(permission, pool) for pool in group.get("pools", [])]
+    for pool, rbd_namespaces in sorted(group.get("rbd-namespaces", {}).items()):
+        for rbd_namespace in rbd_namespaces:
+            permissions.append("{} pool={} namespace={}".format(permission, pool, rbd_namespace))
+    return permissions
+
+
 def update_service_permissions(service, service_obj=None, namespace=None):
     """Update the key permissions for the named client in Ceph."""
     if not service_obj:
@@ -201,6 +220,24 @@ def add_pool_to_group(pool, group, namespace=None):
         update_service_permissions(service, namespace=namespace)
 
 
+def add_rbd_namespace_to_group(pool, rbd_namespace, group, namespace=None):
+    """Add an RBD namespace of a pool to a named group.
+
+    Services of the group are only granted access to the RBD namespace, not
+    to the rest of the pool.
+    """
+    group_name = group
+    if namespace:
+        group_name = "{}-{}".format(namespace, group_name)
+    group = get_group(group_name=group_name)
+    rbd_namespaces = group.setdefault("rbd-namespaces", {}).setdefault(pool, [])
+    if rbd_namespace not in rbd_namespaces:
+        rbd_namespaces.append(rbd_namespace)
+    save_group(group, group_name=group_name)
+    for service in group["services"]:
+        update_service_permissions(service, namespace=namespace)
+
+
 @decode_req_encode_rsp
 def process_requests(reqs):
     """Process Ceph broker request(s).
@@ -249,6 +286,8 @@ def _get_broker_jump_table():
         "create-pool": handle_create_pool,
         "create-cephfs": handle_create_cephfs,
         "create-erasure-profile": handle_create_erasure_profile,
+        "create-rbd-namespace": handle_create_rbd_namespace,
+        "set-rbd-qos": handle_set_rbd_qos,
         "delete-pool": delete_pool,
         "rename-pool": rename_pool,
         "snapshot-pool": snapshot_pool,
@@ -321,14 +360,18 @@ def handle_erasure_pool(request, service):
     group_name = request.get("group")
 
     if erasure_profile is None:
-        erasure_profile = "default-canonical"
+        try:
+            erasure_profile = _default_erasure_profile(request, service)
+        except ValueError as e:
+            log(str(e), level=ERROR)
+            return {"exit-code": 1, "stderr": str(e)}
+        request = dict(request, **{"erasure-profile": erasure_profile})
 
     if group_name:
         group_namespace = request.get("group-namespace")
         # Add the pool to the group named "group_name"
         add_pool_to_group(pool=pool_name, group=group_name, namespace=group_namespace)
 
-    # TODO: Default to 3/2 erasure coding. I believe this requires min 5 osds
     if not erasure_profile_exists(service=service, name=erasure_profile):
         # TODO: Fail and tell them to create the profile or default
         msg = (
@@ -344,6 +387,9 @@ def handle_erasure_pool(request, service):
         msg = "Missing parameter."
         log(msg, level=ERROR)
         return {"exit-code": 1, "stderr": msg}
+    except ValueError as e:
+        log(str(e), level=ERROR)
+        return {"exit-code": 1, "stderr": str(e)}
 
     # Ok make the erasure pool
     if not pool_exists(service=service, name=pool_name):
@@ -390,6 +436,9 @@ def handle_replicated_pool(request, service):
         msg = "Missing parameter."
         log(msg, level=ERROR)
         return {"exit-code": 1, "stderr": msg}
+    except ValueError as e:
+        log(str(e), level=ERROR)
+        return {"exit-code": 1, "stderr": str(e)}
 
     if not pool_exists(service=service, name=pool_name):
         log("Creating pool '{}' (replicas={})".format(pool.name, replicas), level=INFO)
@@ -404,6 +453,95 @@ def handle_replicated_pool(request, service):
 # Ceph broker implementation.
 
 
+def handle_create_rbd_namespace(request, service):
+    """Create an RBD namespace in a shared pool.
+
+    Unlike a pool per client, namespaces isolate clients sharing a pool
+    without adding placement groups. The namespace is added to the group
+    named "group", "<pool>-<namespace>" by default, whose services are only
+    granted access to the namespace. The client named by "name", if any,
+    joins the group as with add-permissions-to-key. RBD has no QoS limits
+    per namespace, requests for them are refused.
+
+    :param request: dict of request operations and params.
+    :param service: The ceph client to run the command under.
+    :returns: dict. exit-code and reason if not 0.
+    """
+    pool_name = request.get("pool")
+    rbd_namespace = request.get("namespace")
+    if not pool_name or not rbd_namespace:
+        msg = "Missing parameter."
+        log(msg, level=ERROR)
+        return {"exit-code": 1, "stderr": msg}
+
+    if any(key in request for key in RBD_QOS_VALIDATION_MAP):
+        log(RBD_NAMESPACE_QOS_MSG, level=ERROR)
+        return {"exit-code": 1, "stderr": RBD_NAMESPACE_QOS_MSG}
+
+    if not pool_exists(service=service, name=pool_name):
+        msg = "Pool {} does not exist.  Please create it with: create-pool".format(pool_name)
+        log(msg, level=ERROR)
+        return {"exit-code": 1, "stderr": msg}
+
+    try:
+        create_rbd_namespace(service, pool_name, rbd_namespace)
+    except CalledProcessError as e:
+        msg = "Failed to create RBD namespace {}/{}: {}".format(pool_name, rbd_namespace, e)
+        log(msg, level=ERROR)
+        return {"exit-code": 1, "stderr": msg}
+
+    group_name = request.get("group") or "{}-{}".format(pool_name, rbd_namespace)
+    add_rbd_namespace_to_group(
+        pool=pool_name,
+        rbd_namespace=rbd_namespace,
+        group=group_name,
+        namespace=request.get("group-namespace"),
+    )
+    if request.get("name"):
+        return handle_add_permissions_to_key(dict(request, group=group_name), service)
+    return {"exit-code": 0}
+
+
+def handle_set_rbd_qos(request, service):
+    """Set RBD QoS limits of a pool.
+
+    Limits are requested with the rbd-qos-* keys, e.g. rbd-qos-iops-limit or
+    rbd-qos-write-bps-burst, and apply to each image. Pools created through
+    create-pool accept the same keys. RBD has no QoS limits per namespace,
+    requests naming one are refused.
+
+    :param request: dict of request operations and params.
+    :param service: The ceph client to run the command under.
+    :returns: dict. exit-code and reason if not 0.
+    """
+    pool_name = request.get("pool")
+    if request.get("namespace"):
+        log(RBD_NAMESPACE_QOS_MSG, level=ERROR)
+        return {"exit-code": 1, "stderr": RBD_NAMESPACE_QOS_MSG}
+    try:
+        qos = rbd_qos_settings(request)
+    except ValueError as e:
+        log(str(e), level=ERROR)
+        return {"exit-code": 1, "stderr": str(e)}
+    if not pool_name or not qos:
+        msg = "Missing parameter."
+        log(msg, level=ERROR)
+        return {"exit-code": 1, "stderr": msg}
+
+    if not pool_exists(service=service, name=pool_name):
+        msg = "Pool {} does not exist.".format(pool_name)
+        log(msg, level=ERROR)
+        return {"exit-code": 1, "stderr": msg}
+
+    try:
+        set_rbd_qos(service, pool_name, qos)
+    except CalledProcessError as e:
+        msg = "Failed to set RBD QoS of {}: {}".format(pool_name, e)
+        log(msg, level=ERROR)
+        return {"exit-code": 1, "stderr": msg}
+    return {"exit-code": 0}
+
+
 def handle_create_cephfs(request, service):
     """Create a new cephfs.
 
@@ -456,16 +594,13 @@ def handle_create_erasure_profile(request, service):
     :param service: The ceph client to run the command under.
     :returns: dict. exit-code and reason if not 0
     """
-    # "isa" | "lrc" | "shec" | "clay" or it defaults to "jerasure"
-    erasure_type = request.get("erasure-type")
+    # The plugin ("erasure-type"), k and m default to the recommended ones,
+    # see recommend_erasure_profile.
     # dependent on erasure coding type
     erasure_technique = request.get("erasure-technique")
     # "host" | "rack" | ...
     failure_domain = request.get("failure-domain")
     name = request.get("name")
-    # Binary Distribution Matrix (BDM) parameters
-    bdm_k = request.get("k")
-    bdm_m = request.get("m")
     # LRC parameters
     bdm_l = request.get("l")
     crush_locality = request.get("crush-locality")
@@ -477,25 +612,112 @@ def handle_create_erasure_profile(request, service):
     # Device Class
     device_class = request.get("device-class")
 
+    try:
+        recommended = recommend_erasure_profile(request, service)
+    except ValueError as e:
+        log(str(e), level=ERROR)
+        return {"exit-code": 1, "stderr": str(e)}
+
     create_erasure_profile(
         service=service,
-        erasure_plugin_name=erasure_type,
+        erasure_plugin_name=recommended["plugin"],
         profile_name=name,
         failure_domain=failure_domain,
-        data_chunks=bdm_k,
-        coding_chunks=bdm_m,
+        data_chunks=recommended["k"],
+        coding_chunks=recommended["m"],
         locality=bdm_l,
         durability_estimator=bdm_d,
         helper_chunks=bdm_c,
         scalar_mds=scalar_mds,
         crush_locality=crush_locality,
         device_class=device_class,
-        erasure_plugin_technique=erasure_technique,
+        erasure_plugin_technique=erasure_technique or recommended["technique"],
+        stripe_unit=recommended.get("stripe_unit"),
     )
 
     return {"exit-code": 0}
 
 
+def recommend_erasure_profile(request, service):
+    """Fill in the erasure profile settings a request leaves out.
+
+    The plugin defaults to isa when the CPUs of all storage hosts support
+    AVX2, and k and m default to what the failure domains the profile places
+    chunks in can hold. The stripe unit suits the workload profile.
+
+    :param request: dict of the erasure profile's params.
+    :param service: The ceph client to run the command under.
+    :returns: dict. plugin, technique, k, m and optionally stripe_unit.
+    :raises: ValueError if k or m must be chosen but there are too few
+             failure domains, or the workload profile does not exist.
+    """
+    plugin = request.get("erasure-type")
+    if plugin is None and request.get("erasure-technique"):
+        # Techniques were always requested for the jerasure default.
+        plugin = "jerasure"
+    failure_domain = request.get("failure-domain") or "host"
+    _, domains = count_selectable_osds(
+        device_class=request.get("device-class") or "", failure_domain=failure_domain
+    )
+    profile = resolve_profile(request.get("workload-profile"), "", request.get("name"))
+    recommended = erasure_profiles.recommend_erasure_profile(
+        get_cluster_simd(service),
+        domains,
+        plugin=plugin,
+        data_chunks=request.get("k"),
+        coding_chunks=request.get("m"),
+        stripe_unit=request.get("stripe-unit") or (profile and profile.stripe_unit),
+    )
+    if int(recommended["k"]) + int(recommended["m"]) > domains:
+        log(
+            "EC profile {} needs {} {}s but only {} hold OSDs".format(
+                request.get("name"),
+                int(recommended["k"]) + int(recommended["m"]),
+                failure_domain,
+                domains,
+            ),
+            level=WARNING,
+        )
+    return recommended
+
+
+def _default_erasure_profile(request, service):
+    """Return the erasure profile of a pool which requested none.
+
+    The profile is created with the recommended settings if it does not exist
+    yet. Pools whose workload profile tunes the stripe unit share a profile
+    per stripe unit.
+
+    :param request: dict of the pool's params.
+    :param service: The ceph client to run the command under.
+    :returns: str. Name of the erasure profile.
+    :raises: ValueError if the profile cannot be recommended.
+    """
+    profile = resolve_profile(
+        request.get("workload-profile"), request.get("app-name"), request.get("name")
+    )
+    name = "default-canonical"
+    params = {"name": name}
+    if profile and profile.stripe_unit:
+        name = "{}-{}k".format(name, profile.stripe_unit // 1024)
+        params = {"name": name, "stripe-unit": profile.stripe_unit}
+
+    if not erasure_profile_exists(service=service, name=name):
+        recommended = recommend_erasure_profile(params, service)
+        log("Creating EC profile {}: {}".format(name, recommended), level=INFO)
+        create_erasure_profile(
+            service=service,
+            profile_name=name,
+            erasure_plugin_name=recommended["plugin"],
+            failure_domain="host",
+            data_chunks=recommended["k"],
+            coding_chunks=recommended["m"],
+            erasure_plugin_technique=recommended["technique"],
+            stripe_unit=recommended.get("stripe_unit"),
+        )
+    return name
+
+
 def create_erasure_profile(  # noqa: C901
     service,
     profile_name,
@@ -510,6 +732,7 @@ def create_erasure_profile(  # noqa: C901
     crush_locality=None,
     device_class=None,
     erasure_plugin_technique=None,
+    stripe_unit=None,
 ):
     """Create a new erasure code profile if one does not already exist for it.
 
@@ -550,6 +773,8 @@ def create_erasure_profile(  # noqa: C901
     :type crush_locaity: str
     :param erasure_plugin_technique: Coding technique for EC plugin
     :type erasure_plugin_technique: str
+    :param stripe_unit: Bytes of a stripe written to each chunk.
+    :type stripe_unit: int
     :return: None.  Can raise CalledProcessError, ValueError or AssertionError
     """
     if erasure_profile_exists(service, profile_name):
@@ -578,6 +803,9 @@ def create_erasure_profile(  # noqa: C901
     if device_class:
         cmd.append("crush-device-class={}".format(device_class))
 
+    if stripe_unit:
+        cmd.append("stripe_unit={}".format(stripe_unit))
+
     # Add plugin specific information
     if erasure_plugin_name == "lrc":
         # LRC mandatory configuration
@@ -17,10 +17,13 @@
 
 """Handle Charm's NFS Client Events."""
 
+import collections
+import contextlib
 import itertools
 import json
 import logging
-from typing import Callable
+import time
+from typing import Callable, Iterator
 
 import ops_sunbeam.compound_status as compound_status
 from ops.charm import CharmBase, RelationEvent
@@ -40,6 +43,20 @@ from microceph_client import Client
 
 logger = logging.getLogger(__name__)
 
+# Default number of nodes an NFS cluster is spread over.
+DEFAULT_NFS_CLUSTER_SIZE = 3
+
+# Relative cost of the services a host already runs, used to rank hosts for
+# NFS placement. Services not listed here weigh 1.
+SERVICE_LOAD_WEIGHTS = {"nfs": 4, "rgw": 3, "mds": 2, "mgr": 2}
+
+# Peer app data key of the last NFS member move of each cluster, as
+# {cluster_id: [old_host, new_host, time]}.
+NFS_MOVES_KEY = "nfs-moves"
+# Seconds between two moves of an NFS cluster's members, letting clients fail
+# over and reclaim their state within the NFS-Ganesha grace period.
+NFS_MOVE_SETTLE_TIME = 300
+
 
 class CephNfsConnectedEvent(RelationEvent):
     """ceph-nfs connected event."""
@@ -150,6 +167,7 @@ class CephNfsProviderHandler(RelationHandler):
         relation_name: str,
         callback_f: Callable,
     ):
+        self._peer_index = None
         super().__init__(charm, relation_name, callback_f)
 
     def setup_event_handler(self) -> Object:
@@ -203,15 +221,17 @@ class CephNfsProviderHandler(RelationHandler):
         # Mon addrs might have changed, update the relation data if needed.
         # Additionally, new nodes may have been added, which could be added to
         # NFS clusters.
-        for relation in self.model.relations.get(self.relation_name, []):
-            logger.debug("Reconciling ceph-nfs relation with app '%s'", relation.app.name)
-            if not self._service_relation(relation):
-                logger.error("A ceph-nfs relation could not be serviced.")
-                self.status.set(
-                    BlockedStatus("A ceph-nfs relation could not be serviced. Check logs.")
-                )
-                event.defer()
-                return
+        relations = self.model.relations.get(self.relation_name, [])
+        with self._snapshot() as snapshot:
+            serviced = self._reconcile_relations(relations, snapshot)
+
+        if not serviced:
+            logger.error("A ceph-nfs relation could not be serviced.")
+            self.status.set(
+                BlockedStatus("A ceph-nfs relation could not be serviced. Check logs.")
+            )
+            event.defer()
+            return
 
         self.status.set(ActiveStatus(""))
 
@@ -220,7 +240,10 @@ class CephNfsProviderHandler(RelationHandler):
             return
 
         logger.info("Processing ceph-nfs connected")
-        if not self._service_relation(event.relation):
+        with self._snapshot() as snapshot:
+            serviced = self._reconcile_relations([event.relation], snapshot)
+
+        if not serviced:
             logger.error("An error occurred while handling the ceph-nfs relation, deferring.")
             self.status.set(
                 BlockedStatus("A ceph-nfs relation could not be serviced. Check logs.")
@@ -228,120 +251,343 @@ class CephNfsProviderHandler(RelationHandler):
             event.defer()
             return
 
-    def _service_relation(self, relation) -> bool:
-        cluster_id = self._cluster_id(relation)
-        relation_data = relation.data[self.model.app]
-
-        if not self._ensure_nfs_cluster(cluster_id):
-            # If we can't ensure even 1 node for the NFS cluster, clear the
-            # relation data, as it wouldn't be usable.
-            relation_data.clear()
-            return False
+    @contextlib.contextmanager
+    def _snapshot(self) -> Iterator["NfsSnapshot"]:
+        """Gather the cluster state needed to reconcile ceph-nfs relations.
 
+        The peer data index is also exposed to ``_get_peer_value`` while the
+        snapshot is in use, so host lookups do not rescan the peer units.
+        """
+        client = Client.from_socket()
+        snapshot = NfsSnapshot(client.cluster.list_services(), self._index_peer_data())
+        self._peer_index = snapshot.peers
         try:
-            ceph.enable_mgr_module("microceph")
-            ceph.set_orch_backend("microceph")
-        except Exception as ex:
-            # If the following commands fail, some clients (e.g.: manila) may
-            # not be able to properly provision shares.
-            logger.error("Encountered exception: %s", ex)
-            relation_data.clear()
-            return False
+            yield snapshot
+        finally:
+            self._peer_index = None
 
-        volume_name = f"{cluster_id}-vol"
-        self._ensure_fs_volume(volume_name)
+    def _reconcile_relations(self, relations: list, snapshot: "NfsSnapshot") -> bool:
+        """Reconcile the given ceph-nfs relations against a single snapshot.
 
-        client_name = f"client.{relation.app.name}"
-        caps = {"mon": ["allow r"], "mgr": ["allow rw"]}
-        client_key = ceph.get_named_key(client_name, caps)
-        addrs = utils.get_mon_addresses()
-
-        relation_data.update(
-            {
-                "client": client_name,
-                "keyring": client_key,
-                "mon_hosts": json.dumps(addrs),
-                "cluster-id": cluster_id,
-                "volume": volume_name,
-                "fsid": utils.get_fsid(),
-            }
+        NFS placement is computed for all the relations' clusters together, and
+        only the missing NFS services and changed relation data are applied.
+
+        Returns False if any of the relations could not be serviced.
+        """
+        cluster_ids = [self._cluster_id(relation) for relation in relations]
+        placement = self._plan_nfs_placement(snapshot, cluster_ids)
+        self._apply_nfs_placement(snapshot, placement)
+
+        serviced = True
+        for relation in relations:
+            logger.debug("Reconciling ceph-nfs relation with app '%s'", relation.app.name)
+            if not self._service_relation(relation, snapshot):
+                serviced = False
+
+        return serviced
+
+    @property
+    def cluster_size(self) -> int:
+        """Number of hosts each NFS cluster should be spread over."""
+        return max(int(self.model.config.get("nfs-cluster-size", DEFAULT_NFS_CLUSTER_SIZE)), 1)
+
+    def _plan_nfs_placement(
+        self, snapshot: "NfsSnapshot", cluster_ids: list[str]
+    ) -> dict[str, dict[str, list[str]]]:
+        """Compute the hosts to add to and remove from each NFS cluster.
+
+        Hosts are handed out from the shared pool of hosts without an NFS
+        service, so clusters never compete for the same host. Clusters are
+        filled in the given order, each picking the best ranked candidate (see
+        ``_nfs_candidate_rank``) until it reaches ``cluster_size``. A full
+        cluster with several members in one availability zone is moved, one
+        host per reconcile, onto a candidate in an unused zone. A cluster
+        larger than ``cluster_size`` sheds its worst placed members.
+
+        A move is only planned once the previous move of the cluster
+        converged, see ``_nfs_move_settled``.
+        """
+        moves = self._nfs_moves()
+        candidates = [h for h in snapshot.free_hosts() if self._get_nfs_bind_address(h)]
+        for host in set(snapshot.free_hosts()) - set(candidates):
+            logger.warning(
+                "Could not find the NFS bind address of '%s' in the peer relation data.", host
+            )
+
+        size = self.cluster_size
+        placement = {}
+        for cluster_id in cluster_ids:
+            members = snapshot.nfs_hosts(cluster_id)
+            add, remove = [], []
+            if len(members) > size:
+                remove = self._pick_nfs_surplus(snapshot, members, len(members) - size)
+            while len(members) + len(add) < size and candidates:
+                host = min(
+                    candidates, key=lambda h: self._nfs_candidate_rank(snapshot, h, members + add)
+                )
+                candidates.remove(host)
+                add.append(host)
+            move = None
+            if len(members) == size and self._nfs_move_settled(
+                cluster_id, moves.get(cluster_id), members
+            ):
+                move = self._plan_nfs_move(snapshot, candidates, members)
+                if move:
+                    candidates.remove(move[1])
+
+            placement[cluster_id] = {"add": add, "remove": remove, "move": move}
+
+        snapshot.spare_hosts = candidates
+        return placement
+
+    def _nfs_candidate_rank(
+        self, snapshot: "NfsSnapshot", host: str, members: list[str]
+    ) -> tuple[int, bool, int, str]:
+        """Sort key ranking a host as a new member of an NFS cluster.
+
+        Prefers, in order: a zone the cluster is not in yet, a dedicated NFS
+        binding, and the lowest current service load.
+        """
+        zone = snapshot.zone(host)
+        zone_members = len([m for m in members if zone and snapshot.zone(m) == zone])
+        return (
+            zone_members,
+            not snapshot.has_dedicated_binding(host),
+            snapshot.host_load(host),
+            host,
         )
 
-        return True
+    def _nfs_moves(self) -> dict[str, list]:
+        """Return the last member move of each NFS cluster."""
+        return json.loads(self.charm.peers.get_app_data(NFS_MOVES_KEY) or "{}")
 
-    def _ensure_nfs_cluster(self, cluster_id) -> bool:
-        client = Client.from_socket()
-        services = client.cluster.list_services()
+    def _record_nfs_move(self, cluster_id: str, old_host: str, new_host: str) -> None:
+        moves = self._nfs_moves()
+        moves[cluster_id] = [old_host, new_host, int(time.time())]
+        self.charm.peers.set_app_data({NFS_MOVES_KEY: json.dumps(moves)})
 
-        all_nfs_services = [s for s in services if s["service"] == "nfs"]
-        nfs_services = [s for s in all_nfs_services if s.get("group_id") == cluster_id]
-        nodes_in_cluster = len(nfs_services)
+    def _nfs_move_settled(self, cluster_id: str, move: list | None, members: list[str]) -> bool:
+        """Whether the last move of a cluster converged, allowing another one.
 
-        if nodes_in_cluster >= 3:
-            # We're only adding up to 3 nodes in the cluster.
+        A move converged once its old member is disabled and the clients had
+        ``NFS_MOVE_SETTLE_TIME`` to fail over to the new one.
+        """
+        if not move:
+            return True
+        old_host, new_host, moved_at = move
+        if old_host in members:
             logger.info(
-                "NFS Cluster '%s' already exists, and there are >= 3 nodes in it.", cluster_id
+                "Holding back NFS moves of '%s' until '%s' is disabled.", cluster_id, old_host
             )
-            return True
+            return False
+        if new_host in members and time.time() - moved_at < NFS_MOVE_SETTLE_TIME:
+            logger.debug("Holding back NFS moves of '%s' while clients fail over.", cluster_id)
+            return False
+        return True
 
-        # Find potential candidates for the NFS cluster. We can only enable
-        # NFS once per host.
-        exclude_hosts = [s["location"] for s in all_nfs_services]
+    @staticmethod
+    def _zone_imbalance(snapshot: "NfsSnapshot", hosts: list[str]) -> int:
+        """Number of hosts sharing their availability zone with another host."""
+        zones = collections.Counter(snapshot.zone(h) for h in hosts if snapshot.zone(h))
+        return sum(count - 1 for count in zones.values())
 
-        all_hosts = set([s["location"] for s in services])
-        candidates = [h for h in all_hosts if h not in exclude_hosts]
+    def _plan_nfs_move(
+        self, snapshot: "NfsSnapshot", candidates: list[str], members: list[str]
+    ) -> tuple[str, str] | None:
+        """Find a member to move to a candidate in an unused availability zone.
 
-        for candidate in candidates:
-            try:
-                bind_addr = self._get_nfs_bind_address(candidate)
-                if not bind_addr:
-                    logger.warning(
-                        "Could not find the NFS bind address of '%s' in the peer relation data.",
-                        candidate,
-                    )
-                    continue
+        Returns an ``(old_host, new_host)`` tuple, or None if the cluster is
+        already spread as well as the candidates allow, or no move reduces
+        the number of members sharing a zone.
+        """
+        zones = collections.Counter(snapshot.zone(m) for m in members if snapshot.zone(m))
+        if not zones or zones.most_common(1)[0][1] < 2:
+            return None
+
+        new_zone_candidates = [c for c in candidates if snapshot.zone(c) not in ("", *zones)]
+        if not new_zone_candidates:
+            return None
+
+        crowded_zone = zones.most_common(1)[0][0]
+        old_host = max(
+            (m for m in members if snapshot.zone(m) == crowded_zone),
+            key=lambda m: (snapshot.host_load(m), m),
+        )
+        new_host = min(
+            new_zone_candidates, key=lambda h: self._nfs_candidate_rank(snapshot, h, members)
+        )
+        moved = [m for m in members if m != old_host] + [new_host]
+        if self._zone_imbalance(snapshot, moved) >= self._zone_imbalance(snapshot, members):
+            return None
+        logger.info("Moving NFS service from '%s' to '%s' to spread zones.", old_host, new_host)
+        return old_host, new_host
+
+    def _pick_nfs_surplus(
+        self, snapshot: "NfsSnapshot", members: list[str], count: int
+    ) -> list[str]:
+        """Pick the members to drop when a cluster is larger than needed."""
+        zones = collections.Counter(snapshot.zone(m) for m in members)
+        ranked = sorted(
+            members,
+            key=lambda m: (-zones[snapshot.zone(m)], -snapshot.host_load(m), m),
+        )
+        return ranked[:count]
 
-                microceph.enable_nfs(candidate, cluster_id, bind_addr)
+    def _apply_nfs_placement(self, snapshot: "NfsSnapshot", placement: dict) -> None:
+        """Apply the placement, enabling new members before removing old ones.
 
-                nodes_in_cluster += 1
-                if nodes_in_cluster == 3:
+        Hosts that fail to enable NFS are replaced with spare hosts. Members are
+        only removed while the cluster stays at or above ``cluster_size``. A
+        member is only moved once its new host serves the cluster.
+        """
+        size = self.cluster_size
+        for cluster_id, changes in placement.items():
+            if changes.get("move"):
+                self._apply_nfs_move(snapshot, cluster_id, *changes["move"])
+            self._enable_nfs_members(snapshot, cluster_id, changes["add"])
+
+            for host in changes["remove"]:
+                if len(snapshot.nfs_hosts(cluster_id)) <= size:
                     break
+                try:
+                    microceph.disable_nfs(host, cluster_id)
+                    snapshot.remove_nfs(host, cluster_id)
+                except Exception as ex:
+                    logger.error(
+                        "Could not disable nfs (cluster_id '%s') on host '%s': %s",
+                        cluster_id,
+                        host,
+                        ex,
+                    )
+
+            nodes_in_cluster = len(snapshot.nfs_hosts(cluster_id))
+            log = logger.warning if nodes_in_cluster < size else logger.info
+            log(
+                "NFS cluster '%s' is enabled on %d / %d nodes.",
+                cluster_id,
+                nodes_in_cluster,
+                size,
+            )
+
+    def _enable_nfs_members(
+        self, snapshot: "NfsSnapshot", cluster_id: str, hosts: list[str]
+    ) -> None:
+        """Enable NFS on the hosts, replacing the ones failing with spare hosts."""
+        pending = list(hosts)
+        while pending:
+            host = pending.pop(0)
+            try:
+                microceph.enable_nfs(host, cluster_id, self._get_nfs_bind_address(host))
+                snapshot.add_nfs(host, cluster_id)
             except Exception as ex:
                 logger.error(
                     "Could not enable nfs (cluster_id '%s') on host '%s': %s",
                     cluster_id,
-                    candidate,
+                    host,
                     ex,
                 )
+                if snapshot.spare_hosts:
+                    pending.append(snapshot.spare_hosts.pop(0))
+
+    def _apply_nfs_move(
+        self, snapshot: "NfsSnapshot", cluster_id: str, old_host: str, new_host: str
+    ) -> None:
+        """Move a member of an NFS cluster, keeping it where it is if the new host fails."""
+        try:
+            microceph.enable_nfs(new_host, cluster_id, self._get_nfs_bind_address(new_host))
+        except Exception as ex:
+            logger.error(
+                "Could not enable nfs (cluster_id '%s') on host '%s', keeping '%s': %s",
+                cluster_id,
+                new_host,
+                old_host,
+                ex,
+            )
+            return
+        snapshot.add_nfs(new_host, cluster_id)
+        self._record_nfs_move(cluster_id, old_host, new_host)
+
+        try:
+            microceph.disable_nfs(old_host, cluster_id)
+            snapshot.remove_nfs(old_host, cluster_id)
+        except Exception as ex:
+            logger.error(
+                "Could not disable nfs (cluster_id '%s') on host '%s': %s",
+                cluster_id,
+                old_host,
+                ex,
+            )
 
-        if nodes_in_cluster == 0:
+    def _service_relation(self, relation, snapshot: "NfsSnapshot") -> bool:
+        cluster_id = self._cluster_id(relation)
+        relation_data = relation.data[self.model.app]
+
+        if not snapshot.nfs_hosts(cluster_id):
+            # If we can't ensure even 1 node for the NFS cluster, clear the
+            # relation data, as it wouldn't be usable.
             logger.error("Could not create NFS Cluster '%s' on any host", cluster_id)
+            relation_data.clear()
             return False
 
-        if nodes_in_cluster < 3:
-            logger.warning(
-                "NFS cluster '%s' is enabled only on %d / 3 nodes.", cluster_id, nodes_in_cluster
-            )
-            return True
+        if not self._ensure_orch_backend(snapshot):
+            # Without the orch backend, some clients (e.g.: manila) may not be
+            # able to properly provision shares.
+            relation_data.clear()
+            return False
+
+        volume_name = f"{cluster_id}-vol"
+        self._ensure_fs_volume(volume_name, snapshot)
+
+        client_name = f"client.{relation.app.name}"
+        caps = {"mon": ["allow r"], "mgr": ["allow rw"]}
+        client_key = ceph.get_named_key(client_name, caps)
+
+        expected_data = {
+            "client": client_name,
+            "keyring": client_key,
+            "mon_hosts": json.dumps(snapshot.mon_addrs),
+            "cluster-id": cluster_id,
+            "volume": volume_name,
+            "fsid": snapshot.fsid,
+        }
+        if any(relation_data.get(k) != v for k, v in expected_data.items()):
+            relation_data.update(expected_data)
 
-        logger.info("NFS cluster '%s' is enabled on 3 / 3 nodes.", cluster_id)
         return True
 
-    def _get_peer_value(self, hostname: str, key: str) -> str:
-        """Read a value from the peer databag of the unit running on `hostname`."""
+    def _ensure_orch_backend(self, snapshot: "NfsSnapshot") -> bool:
+        """Enable the microceph mgr module and orch backend once per snapshot."""
+        if snapshot.orch_ready is None:
+            try:
+                ceph.enable_mgr_module("microceph")
+                ceph.set_orch_backend("microceph")
+                snapshot.orch_ready = True
+            except Exception as ex:
+                logger.error("Encountered exception: %s", ex)
+                snapshot.orch_ready = False
+
+        return snapshot.orch_ready
+
+    def _index_peer_data(self) -> dict[str, dict]:
+        """Index the peer databags by the hostname of the unit owning them."""
         rel = self.model.get_relation("peers")
         if rel is None:
-            return ""
+            return {}
 
+        index = {}
         for unit in itertools.chain(rel.units, [self.model.unit]):
             rel_data = rel.data[unit]
             # Each unit stores its own hostname keyed by its unit name.
             unit_hostname = rel_data.get(unit.name)
+            if unit_hostname:
+                index.setdefault(unit_hostname, dict(rel_data))
 
-            if hostname == unit_hostname:
-                return rel_data.get(key) or ""
+        return index
 
-        return ""
+    def _get_peer_value(self, hostname: str, key: str) -> str:
+        """Read a value from the peer databag of the unit running on `hostname`."""
+        peers = self._peer_index if self._peer_index is not None else self._index_peer_data()
+        return peers.get(hostname, {}).get(key) or ""
 
     def _get_nfs_bind_address(self, hostname: str) -> str:
         """Resolve the NFS bind address for a host.
@@ -357,14 +603,13 @@ class CephNfsProviderHandler(RelationHandler):
 
         return self._get_peer_value(hostname, "public-address")
 
-    def _ensure_fs_volume(self, volume_name: str) -> None:
+    def _ensure_fs_volume(self, volume_name: str, snapshot: "NfsSnapshot") -> None:
         """Create the FS Volume if it doesn't exist."""
-        fs_volumes = ceph.list_fs_volumes()
-        for fs_volume in fs_volumes:
-            if fs_volume["name"] == volume_name:
-                return
+        if volume_name in snapshot.fs_volumes:
+            return
 
         ceph.create_fs_volume(volume_name)
+        snapshot.fs_volumes.add(volume_name)
 
     def _on_ceph_nfs_departed(self, event: EventBase) -> None:
         if utils.is_departing(self.charm.app):
@@ -376,12 +621,6 @@ class CephNfsProviderHandler(RelationHandler):
 
         logger.info("Processing ceph-nfs departed")
 
-        cluster_id = self._cluster_id(event.relation)
-        self._remove_nfs_cluster(cluster_id)
-
-        client_name = f"client.{event.relation.app.name}"
-        ceph.remove_named_key(client_name)
-
         # Because a relation departed, that means the nodes associated with it
         # are now free, which means that we can allocate them to the other NFS
         # clusters as needed.
@@ -389,29 +628,29 @@ class CephNfsProviderHandler(RelationHandler):
             r for r in self.model.relations.get(self.relation_name, []) if r != event.relation
         ]
 
-        error = False
-        for relation in other_relations:
-            if not self._service_relation(relation):
-                logger.error("An error occurred while handling the ceph-nfs relation, deferring.")
-                self.status.set(
-                    BlockedStatus("A ceph-nfs relation could not be serviced. Check logs.")
-                )
-                error = True
+        with self._snapshot() as snapshot:
+            cluster_id = self._cluster_id(event.relation)
+            self._remove_nfs_cluster(cluster_id, snapshot)
 
-        if not error:
-            self.status.set(ActiveStatus(""))
+            client_name = f"client.{event.relation.app.name}"
+            ceph.remove_named_key(client_name)
 
-    def _remove_nfs_cluster(self, cluster_id):
-        client = Client.from_socket()
-        services = client.cluster.list_services()
-        nfs_services = [
-            s for s in services if s["service"] == "nfs" and s.get("group_id") == cluster_id
-        ]
+            serviced = self._reconcile_relations(other_relations, snapshot)
+
+        if not serviced:
+            logger.error("An error occurred while handling the ceph-nfs relation, deferring.")
+            self.status.set(
+                BlockedStatus("A ceph-nfs relation could not be serviced. Check logs.")
+            )
+            return
+
+        self.status.set(ActiveStatus(""))
 
-        for service in nfs_services:
-            host = service["location"]
+    def _remove_nfs_cluster(self, cluster_id: str, snapshot: "NfsSnapshot"):
+        for host in snapshot.nfs_hosts(cluster_id):
             try:
                 microceph.disable_nfs(host, cluster_id)
+                snapshot.remove_nfs(host, cluster_id)
             except Exception as ex:
                 logger.error(
                     "Could not disable nfs (cluster_id '%s') on host '%s': %s",
@@ -420,3 +659,86 @@ class CephNfsProviderHandler(RelationHandler):
                     ex,
                 )
                 raise
+
+
+class NfsSnapshot:
+    """Point-in-time view of the cluster used to reconcile ceph-nfs relations.
+
+    The MicroCeph services and the peer data are captured once, and the FS
+    volumes, mon addresses and fsid are fetched at most once, on first use.
+    NFS services enabled or disabled during the reconcile are recorded here
+    so the view stays accurate without querying MicroCeph again.
+    """
+
+    def __init__(self, services: list[dict], peers: dict[str, dict]):
+        self.services = [dict(s) for s in services]
+        self.peers = peers
+        self.orch_ready = None
+        self.spare_hosts = []
+        self._fs_volumes = None
+        self._mon_addrs = None
+        self._fsid = None
+
+    def nfs_hosts(self, cluster_id: str) -> list[str]:
+        """Hosts running an NFS service for the given cluster."""
+        return [
+            s["location"]
+            for s in self.services
+            if s["service"] == "nfs" and s.get("group_id") == cluster_id
+        ]
+
+    def free_hosts(self) -> list[str]:
+        """Hosts without any NFS service. NFS can only be enabled once per host."""
+        nfs_hosts = {s["location"] for s in self.services if s["service"] == "nfs"}
+        return sorted({s["location"] for s in self.services} - nfs_hosts)
+
+    def add_nfs(self, host: str, cluster_id: str) -> None:
+        """Record an NFS service enabled on the host."""
+        self.services.append({"service": "nfs", "group_id": cluster_id, "location": host})
+
+    def remove_nfs(self, host: str, cluster_id: str) -> None:
+        """Record an NFS service disabled on the host."""
+        self.services = [
+            s
+            for s in self.services
+            if not (
+                s["service"] == "nfs" and s.get("group_id") == cluster_id and s["location"] == host
+            )
+        ]
+
+    def host_load(self, host: str) -> int:
+        """Weighted count of the services running on the host."""
+        return sum(
+            SERVICE_LOAD_WEIGHTS.get(s["service"], 1)
+            for s in self.services
+            if s["location"] == host
+        )
+
+    def zone(self, host: str) -> str:
+        """Availability zone of the host, as recorded in the peer data."""
+        return self.peers.get(host, {}).get("availability-zone", "")
+
+    def has_dedicated_binding(self, host: str) -> bool:
+        """Whether the host advertises an address on the NFS binding."""
+        return bool(self.peers.get(host, {}).get("nfs-address"))
+
+    @property
+    def fs_volumes(self) -> set[str]:
+        """Names of the existing FS volumes."""
+        if self._fs_volumes is None:
+            self._fs_volumes = {v["name"] for v in ceph.list_fs_volumes()}
+        return self._fs_volumes
+
+    @property
+    def mon_addrs(self) -> list[str]:
+        """Current mon addresses."""
+        if self._mon_addrs is None:
+            self._mon_addrs = utils.get_mon_addresses()
+        return self._mon_addrs
+
+    @property
+    def fsid(self) -> str:
+        """Cluster fsid."""
+        if self._fsid is None:
+            self._fsid = utils.get_fsid()
+        return self._fsid
@@ -41,6 +41,7 @@ from ops.model import ActiveStatus, BlockedStatus
 
 import ceph
 import cluster
+import erasure_profiles
 import maintenance
 import microceph
 import utils
@@ -59,13 +60,15 @@ from relation_handlers import (
     MicroClusterPeerHandler,
     UpgradeNodeDoneEvent,
     UpgradeNodeRequestEvent,
+    UpgradePrefetchRequestEvent,
+    UpgradeStartEvent,
     collect_peer_data,
 )
 from storage import StorageHandler
 
 logger = logging.getLogger(__name__)
 CACERT_FILE = "/usr/local/share/ca-certificates/receive-keystone-ca-bundle.crt"
-MAX_PG_PER_OSD = 400
+MAX_PG_PER_OSD = ceph.MAX_PG_PER_OSD
 PUBLIC_NETWORK_CONFIG = "ceph-public-network"
 CLUSTER_NETWORK_CONFIG = "ceph-cluster-network"
 
@@ -82,6 +85,7 @@ class MicroCephCharm(sunbeam_charm.OSBaseOperatorCharm):
         super().__init__(framework)
 
         # Initialise Modules.
+        self.osd_admission = cluster.OsdEnrollAdmission(self)
         self.storage = StorageHandler(self)
         self.cluster_nodes = cluster.ClusterNodes(self)
         self.cluster_upgrades = cluster.ClusterUpgrades(self)
@@ -101,6 +105,8 @@ class MicroCephCharm(sunbeam_charm.OSBaseOperatorCharm):
         self.framework.observe(self.on.stop, self._on_stop)
         self.framework.observe(self.on.update_status, self._on_update_status)
         self.framework.observe(self.on.set_pool_size_action, self._set_pool_size_action)
+        self.framework.observe(self.on.plan_pgs_action, self._plan_pgs_action)
+        self.framework.observe(self.on.upgrade_status_action, self._upgrade_status_action)
         self.framework.observe(self.on.peers_relation_created, self._on_peer_relation_created)
         self.framework.observe(self.on["peers"].relation_departed, self._on_peer_relation_departed)
 
@@ -113,7 +119,9 @@ class MicroCephCharm(sunbeam_charm.OSBaseOperatorCharm):
             "--channel",
             config("snap-channel"),
         ]
-        utils.run_cmd(cmd, timeout=900)
+        utils.run_cmd_streaming(
+            cmd, timeout=900, on_line=lambda line: logger.info("snap install: %s", line)
+        )
 
         cmd = ["sudo", "snap", "alias", "microceph.ceph", "ceph"]
         utils.run_cmd(cmd)
@@ -186,11 +194,14 @@ class MicroCephCharm(sunbeam_charm.OSBaseOperatorCharm):
         snap_chan = self.model.config.get("snap-channel")
         # Cleanup can run on all units, including units that are no longer leader.
         self._clear_resolved_upgrade_blocked_status(snap_chan)
+        if self.ready_for_service():
+            self.cluster_upgrades.clear_stale_upgrade_flags()
 
         if not self.unit.is_leader():
             logger.debug(f"Unit {self.unit.name} is not leader, skipping rgw readiness update")
             return
 
+        self.cluster_upgrades.check_prefetch_deadline()
         self._reconcile_pending_upgrade(snap_chan)
 
         if not self.ready_for_service():
@@ -396,6 +407,44 @@ class MicroCephCharm(sunbeam_charm.OSBaseOperatorCharm):
             event.set_results({"message": "set-pool-size failed"})
             event.fail()
 
+    def _plan_pgs_action(self, event: ops.framework.EventBase) -> None:
+        """Report the current and budgeted PG count of every pool."""
+        try:
+            plan = ceph.plan_pg_budget("admin")
+        except (CalledProcessError, TimeoutExpired, ValueError) as e:
+            logger.warning("Failed to plan the PG budget: %s", e)
+            event.set_results({"message": "plan-pgs failed"})
+            event.fail()
+            return
+        event.set_results({"pools": plan})
+
+    def _upgrade_status_action(self, event: ops.framework.EventBase) -> None:
+        """Report the progress of the current, or else the last, snap upgrade."""
+        event.set_results(self.cluster_upgrades.upgrade_status())
+
+    def apply_pg_budget(self) -> None:
+        """Resize the pools the autoscaler does not manage to their PG budget."""
+        try:
+            plan = ceph.plan_pg_budget("admin")
+        except (CalledProcessError, TimeoutExpired, ValueError) as e:
+            # Retried on the next config-changed.
+            logger.warning("Failed to plan the PG budget: %s", e)
+            return
+
+        for entry in plan:
+            if entry["autoscale"] == "on" or entry["optimal"] == entry["current"]:
+                continue
+            logger.info(
+                "Resizing pool %s from %d to %d PGs",
+                entry["pool"],
+                entry["current"],
+                entry["optimal"],
+            )
+            try:
+                ceph.update_pool("admin", entry["pool"], {"pg_num": str(entry["optimal"])})
+            except CalledProcessError as e:
+                logger.warning("Failed to resize pool %s: %s", entry["pool"], e)
+
     @property
     def channel(self) -> str:
         """Get the saved snap channel."""
@@ -646,6 +695,8 @@ class MicroCephCharm(sunbeam_charm.OSBaseOperatorCharm):
         dispatch = {
             UpgradeNodeRequestEvent: self.cluster_upgrades.upgrade_node_request,
             UpgradeNodeDoneEvent: self.cluster_upgrades.upgrade_node_done,
+            UpgradePrefetchRequestEvent: self.cluster_upgrades.prefetch_node_request,
+            UpgradeStartEvent: self.cluster_upgrades.start_upgrade,
         }
         hdlr = dispatch.get(type(event))
         if not hdlr:
@@ -682,6 +733,7 @@ class MicroCephCharm(sunbeam_charm.OSBaseOperatorCharm):
         self.handle_config_leader_set_ready()
         self.handle_config_leader_cluster_network(event)
         self.handle_config_leader_ceph_pool_pgs(event)
+        self.handle_config_leader_cluster_simd()
         self.handle_config_rgw_service(event)
         self.handle_config_leader_charm_upgrade()
         self.handle_config_leader_new_node(event)
@@ -1129,6 +1181,33 @@ class MicroCephCharm(sunbeam_charm.OSBaseOperatorCharm):
                 return
             raise e
 
+        if self.model.config.get("enforce-pg-budget"):
+            self.apply_pg_budget()
+
+    def handle_config_leader_cluster_simd(self) -> None:
+        """Record the SIMD instruction set all units' CPUs support.
+
+        Broker requests for erasure code profiles default to the plugin
+        suiting it, so it is only recorded once every unit published its own.
+        """
+        relation = self.model.get_relation("peers")
+        if relation is None or not self.ready_for_service():
+            return
+        levels = [
+            level
+            for level in self.peers.get_all_unit_values(key="cpu-simd", include_local_unit=True)
+            if level
+        ]
+        if len(levels) <= len(relation.units):
+            logger.debug("Waiting for all units to publish their CPU features")
+            return
+
+        try:
+            ceph.record_cluster_simd("admin", erasure_profiles.lowest_simd(levels))
+        except CalledProcessError as e:
+            # Retried on the next peer or config change.
+            logger.warning("Failed to record the CPU features of the cluster: %s", e)
+
     def handle_config_rgw_service(self, event: ops.framework.EventBase) -> None:
         """Enable/Disable RGW service."""
         logger.debug("Configuring RGW service")
@@ -15,26 +15,105 @@
 
 """The cluster module manages cluster-wide operations."""
 
+import contextlib
+import glob
 import json
 import logging
+import os
 import subprocess
+import time
 import uuid
 from socket import gethostname
-from typing import Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
 import ops.charm
 import ops_sunbeam.guard as sunbeam_guard
 import tenacity
 from charms.operator_libs_linux.v2 import snap
 
+import ceph
 import charm
+import health_policy
 import microceph
 import relation_handlers
+import upgrade_timeline
 import utils
-from ceph import CephHealth, CephStatus
+from ceph import CephStatus
 
 logger = logging.getLogger(__name__)
 UPGRADE_HEALTH_BLOCKED_MSG_PREFIX = "Cannot upgrade, ceph health not ok"
+# Directory the snap revision of an upgrade is downloaded to ahead of time.
+UPGRADE_STAGING_DIR = "/var/cache/microceph-charm"
+# Seconds a snap download may take.
+SNAP_DOWNLOAD_TIMEOUT = 1800
+# Seconds the peers get to stage the snap, after which the upgrade starts and
+# nodes which did not acknowledge the prefetch download it when upgrading.
+PREFETCH_TIMEOUT = 3600
+
+# Peer app data key of the current OSD enrollment wave, see OsdEnrollAdmission.
+OSD_ENROLL_WAVE_KEY = "osd-enroll-wave"
+# OSD flags which may be held while a wave enrolls.
+OSD_ENROLL_FLAGS = ("norebalance", "nobackfill")
+
+
+def plan_upgrade_batches(
+    domains: Dict[str, str], mon_nodes: Iterable[str], max_mons_down: int
+) -> List[List[str]]:
+    """Group the nodes to upgrade into batches upgraded concurrently.
+
+    Every batch holds nodes of a single failure domain, so a batch going down
+    takes at most one copy of any data with it. A failure domain holding more
+    mons than may be down at once is split over several batches.
+
+    Args:
+        domains: failure domain of each node to upgrade.
+        mon_nodes: nodes running a mon.
+        max_mons_down: number of mons which may be down without losing
+            quorum. A batch holds at least one mon node regardless.
+
+    Returns:
+        Batches of node names, in upgrade order.
+    """
+    mon_nodes = set(mon_nodes)
+    by_domain = {}
+    for node, domain in sorted(domains.items()):
+        by_domain.setdefault(domain, []).append(node)
+
+    batches = []
+    for domain in sorted(by_domain):
+        batch, mons = [], 0
+        for node in by_domain[domain]:
+            if node in mon_nodes:
+                if mons >= max(1, max_mons_down):
+                    batches.append(batch)
+                    batch, mons = [], 0
+                mons += 1
+            batch.append(node)
+        batches.append(batch)
+    return batches
+
+
+def _upgrade_domain(
+    chain: Optional[List[Tuple[str, str]]], zone: Optional[str], node: str
+) -> Optional[Tuple[str, str]]:
+    """Return the (type, name) of the CRUSH bucket a node upgrades along with.
+
+    Args:
+        chain: the buckets holding the node's host, as for
+            ceph.get_host_buckets, None for a host without OSDs.
+        zone: availability zone of the node, to upgrade along with the
+            bucket of that name.
+        node: name of the node's unit.
+
+    Returns:
+        The bucket, None if the zone has no bucket above the host. A node
+        without OSDs holds no data and upgrades on its own.
+    """
+    if not chain:
+        return ("", node)
+    if not zone:
+        return ceph.get_host_failure_domain(chain)
+    return next((bucket for bucket in chain[1:] if bucket[1] == zone), None)
 
 
 class ClusterNodes(ops.framework.Object):
@@ -108,6 +187,8 @@ class ClusterUpgrades(ops.framework.Object):
 
     charm = None
     _stored = ops.framework.StoredState()
+    # Nonce of the upgrade whose prefetch phase was set in this hook.
+    _prefetch_published = ""
 
     def __init__(self, charm: "charm.MicroCephCharm"):
         super().__init__(charm, "cluster-upgrade")
@@ -135,6 +216,11 @@ class ClusterUpgrades(ops.framework.Object):
             c = self.model.config["snap-channel"]
         return c.split("/")[0]
 
+    @property
+    def health_policy(self) -> health_policy.HealthPolicy:
+        """Get the policy of health checks gating upgrades."""
+        return health_policy.HealthPolicy.from_config(self.model.config)
+
     def upgrade_requested(self, chan: str) -> bool:
         """Check if a snap upgrade was requested."""
         logger.debug(f"Requested, current channel: {chan}, {self.channel}")
@@ -146,15 +232,20 @@ class ClusterUpgrades(ops.framework.Object):
             msg = f"Cannot upgrade from {self.channel} to {snap_chan}"
             logger.warning(msg)
             return False, msg
-        health, det = CephStatus().ceph_health()
-        if health != CephHealth.Ok:
-            msg = f"{UPGRADE_HEALTH_BLOCKED_MSG_PREFIX}: {health}, {det}"
+        verdict = self.health_policy.evaluate(*CephStatus().ceph_health())
+        if not verdict.ok:
+            msg = f"{UPGRADE_HEALTH_BLOCKED_MSG_PREFIX}: {verdict.reason}"
             logger.warning(msg)
             return False, msg
+        logger.debug(f"Upgrade health check passed: {verdict.reason}")
         return True, ""
 
-    def perform_upgrade(self, channel: str) -> None:
-        """Perform the snap upgrade on this node."""
+    def perform_upgrade(self, channel: str, nonce: str = "") -> None:
+        """Perform the snap upgrade on this node.
+
+        The phases of the upgrade are recorded in the node's timeline of the
+        upgrade with the given nonce.
+        """
         node = self.model.unit.name
         logger.debug(f"Upgrading {node} to {channel}")
 
@@ -173,11 +264,97 @@ class ClusterUpgrades(ops.framework.Object):
             # pgrep didn't find the command and returned non-zero
             logger.debug("check running programs: none running")
 
-        # TODO(peter) possibly set noout, noin for cases where upgrades take longer
+        # Nodes of a failure domain upgrade concurrently, keep mon quorum.
+        self._wait_mon_quorum_safe()
+
+        hostname = gethostname()
+        report = {"node": node, "channel": channel, "nonce": nonce, "noout": False}
+        try:
+            # Keep the host's OSDs in while they restart, a refresh taking
+            # longer than mon_osd_down_out_interval would rebalance their data.
+            with self._upgrade_noout(hostname) as noout:
+                report["noout"] = noout
+                # let loose the dogs of upgrade
+                self._record_phase(nonce, "refresh-start")
+                self._install_staged(channel)
+                mc_snap = snap.SnapCache()["microceph"]
+                mc_snap.ensure(snap.SnapState.Present, channel=channel)
+                self._clear_staged()
+                self._record_phase(nonce, "refresh-end")
+                self._wait_host_osds_up(hostname, report)
+            self._record_phase(nonce, "health-wait")
+            self._wait_healthy(node, channel, report)
+        finally:
+            self._report_upgrade(report)
+        self._record_phase(nonce, "done")
+
+        logger.debug(f"Upgrade on {node} to {channel} done")
+
+    @contextlib.contextmanager
+    def _upgrade_noout(self, hostname: str):
+        """Set noout on the OSDs of a host for the duration of the block.
+
+        Yields whether noout was set, it is not on hosts without OSDs.
+        """
+        try:
+            has_osds = hostname in ceph.get_host_failure_domains()
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, ValueError) as e:
+            logger.warning(f"Failed to read the CRUSH map, not setting noout: {e}")
+            has_osds = False
+        if not has_osds:
+            yield False
+            return
+        with ceph.host_osd_flags(hostname, "noout"):
+            yield True
+
+    @staticmethod
+    def _sample_data_movement(report: dict) -> None:
+        """Record the most data moved so far in an upgrade report.
+
+        Only misplaced objects and remapped PGs count, recovery of the writes
+        the OSDs missed while down is expected.
+        """
+        try:
+            misplaced = ceph.get_misplaced_ratio()
+            remapped = ceph.get_remapped_pg_count()
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, ValueError) as e:
+            logger.debug(f"Failed to sample data movement: {e}")
+            return
+        report["max-misplaced-ratio"] = max(report.get("max-misplaced-ratio", 0.0), misplaced)
+        report["max-remapped-pgs"] = max(report.get("max-remapped-pgs", 0), remapped)
+
+    def _wait_host_osds_up(self, hostname: str, report: dict) -> None:
+        """Wait for the OSDs of this host to be up again after the refresh."""
+
+        @tenacity.retry(
+            wait=tenacity.wait_fixed(8),
+            stop=tenacity.stop_after_delay(900),
+            retry=tenacity.retry_if_result(lambda down: down),
+        )
+        def down_osds():
+            self._sample_data_movement(report)
+            try:
+                down = ceph.get_host_down_osds(hostname)
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired, ValueError) as e:
+                logger.debug(f"Failed to get the OSDs of {hostname}: {e}")
+                return [None]
+            logger.debug(f"Down OSDs on {hostname}: {down}")
+            return down
+
+        try:
+            down_osds()
+        except tenacity.RetryError:
+            msg = f"Upgrade on {self.model.unit.name}: OSDs of {hostname} did not come up"
+            logger.error(msg)
+            raise sunbeam_guard.BlockedExceptionError(msg)
 
-        # let loose the dogs of upgrade
-        mc_snap = snap.SnapCache()["microceph"]
-        mc_snap.ensure(snap.SnapState.Present, channel=channel)
+    def _wait_healthy(self, node: str, channel: str, report: dict) -> None:
+        """Wait for ceph to be healthy after upgrading a node.
+
+        Health checks are weighed by the upgrade health policy: ignored checks
+        count as healthy and aborting checks fail the upgrade right away.
+        """
+        policy = self.health_policy
 
         @tenacity.retry(
             wait=tenacity.wait_fixed(8),
@@ -189,52 +366,313 @@ class ClusterUpgrades(ops.framework.Object):
 
             Needs 3 'Ok' checks in a row before succeeding.
             """
-            health, _ = CephStatus().ceph_health()
+            self._sample_data_movement(report)
+            verdict = policy.evaluate(*CephStatus().ceph_health())
+            if verdict.decision == health_policy.ABORT:
+                msg = f"Upgrade on {node} to {channel} aborted: {verdict.reason}"
+                logger.error(msg)
+                raise sunbeam_guard.BlockedExceptionError(msg)
 
             # initialize
             if not hasattr(poll_ok, "consecutive_ok"):
                 poll_ok.consecutive_ok = 0
 
-            if health == CephHealth.Ok:
+            if verdict.ok:
                 poll_ok.consecutive_ok += 1
             else:
                 poll_ok.consecutive_ok = 0
 
-            logger.debug(f"Consecutive healthy checks: {poll_ok.consecutive_ok}")
+            logger.debug(f"Consecutive healthy checks: {poll_ok.consecutive_ok}, {verdict.reason}")
             return poll_ok.consecutive_ok >= 3
 
-        poll_ok()  # wait for ceph to be healthy
+        try:
+            poll_ok()  # wait for ceph to be healthy
+        except tenacity.RetryError:
+            logger.warning(f"Timed out waiting for ceph health after upgrading {node}")
 
-        health, det = CephStatus().ceph_health()  # check again, get details
-        if health != CephHealth.Ok:
-            msg = f"Upgrade on {node} to {channel} failed: {health}, {det}"
+        verdict = policy.evaluate(*CephStatus().ceph_health())  # check again, get details
+        if not verdict.ok:
+            msg = f"Upgrade on {node} to {channel} failed: {verdict.reason}"
             logger.error(msg)
             # don't continue on a failed upgrade
             raise sunbeam_guard.BlockedExceptionError(msg)
 
-        logger.debug(f"Upgrade on {node} to {channel} done")
+    def _report_upgrade(self, report: dict) -> None:
+        """Publish the report of this node's upgrade in its peer unit data."""
+        report["data-movement"] = bool(
+            report.get("max-misplaced-ratio", 0.0) or report.get("max-remapped-pgs", 0)
+        )
+        logger.info(f"Upgrade report: {report}")
+        self.peer_int.set_unit_data({"upgrade-report": json.dumps(report, sort_keys=True)})
+
+    def _record_phase(self, nonce: str, phase: str) -> None:
+        """Stamp a phase in this node's timeline of an upgrade.
+
+        The timeline goes to peer data, and to a config-key which shows it
+        before the hook ends.
+        """
+        relation = self.model.get_relation("peers")
+        if not nonce or relation is None:
+            return
+        value = upgrade_timeline.encode(*self._node_timeline(relation, self.model.unit))
+        value = upgrade_timeline.record(value, nonce, phase)
+        self.peer_int.set_unit_data({upgrade_timeline.TIMELINE_KEY: value})
+        try:
+            ceph.monitor_key_set("admin", upgrade_timeline.live_key(self.model.unit.name), value)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            logger.warning(f"Failed to record upgrade phase {phase}: {e}")
+
+    def _node_timeline(self, relation: ops.model.Relation, unit: ops.model.Unit) -> tuple:
+        """Return the nonce and phase stamps of a unit's last upgrade."""
+        live = ceph.monitor_key_get("admin", upgrade_timeline.live_key(unit.name))
+        return upgrade_timeline.merge(relation.data[unit].get(upgrade_timeline.TIMELINE_KEY), live)
+
+    def upgrade_status(self) -> dict:
+        """Summarize the progress of the current, or else the last, upgrade."""
+        relation = self.model.get_relation("peers")
+        if relation is None:
+            return upgrade_timeline.summarize({}, {})
+        upgrade_info = self.peer_int.get_upgrade_info()
+        timelines = {}
+        for unit in [self.model.unit, *relation.units]:
+            nonce, stamps = self._node_timeline(relation, unit)
+            if nonce and stamps:
+                timelines.setdefault(nonce, {})[unit.name] = stamps
+
+        nonce = upgrade_info.get("nonce")
+        if not nonce and timelines:
+            # The last upgrade is the one which started last.
+            nonce = max(
+                timelines,
+                key=lambda n: min(min(stamps.values()) for stamps in timelines[n].values()),
+            )
+        summary = upgrade_timeline.summarize(upgrade_info, timelines.get(nonce, {}))
+        summary["nonce"] = nonce or ""
+        summary["channel"] = upgrade_info.get("channel", self.channel)
+        return summary
+
+    def clear_stale_upgrade_flags(self) -> None:
+        """Clear the noout left behind by an upgrade which never finished."""
+        hostname = gethostname()
+        try:
+            cleared = ceph.clear_host_osd_flags(hostname)
+        except (
+            subprocess.CalledProcessError,
+            subprocess.TimeoutExpired,
+            OSError,
+            ValueError,
+        ) as e:
+            logger.debug(f"Failed to clear stale OSD flags of {hostname}: {e}")
+            return
+        if cleared:
+            logger.warning(f"Cleared OSD flags {cleared} left behind on {hostname}")
+
+    @staticmethod
+    def _staging_basename(channel: str) -> str:
+        """Return the basename the snap of a channel is staged under."""
+        return "microceph_" + channel.replace("/", "_")
+
+    def prefetch(self, channel: str) -> bool:
+        """Download the snap revision of a channel to the staging directory.
+
+        Best effort: on failure the upgrade downloads the snap itself.
+        """
+        basename = self._staging_basename(channel)
+        if os.path.exists(os.path.join(UPGRADE_STAGING_DIR, f"{basename}.snap")):
+            logger.debug(f"Snap for {channel} already staged")
+            return True
+        try:
+            os.makedirs(UPGRADE_STAGING_DIR, exist_ok=True)
+            self._clear_staged()
+            utils.run_cmd(
+                [
+                    "snap",
+                    "download",
+                    "microceph",
+                    f"--channel={channel}",
+                    f"--target-directory={UPGRADE_STAGING_DIR}",
+                    f"--basename={basename}",
+                ],
+                timeout=SNAP_DOWNLOAD_TIMEOUT,
+            )
+        except (OSError, subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            logger.warning(f"Failed to prefetch microceph from {channel}: {e}")
+            return False
+        logger.info(f"Staged microceph from {channel}")
+        return True
+
+    def _install_staged(self, channel: str) -> None:
+        """Install the snap staged for a channel, if any."""
+        path = os.path.join(UPGRADE_STAGING_DIR, self._staging_basename(channel))
+        if not os.path.exists(f"{path}.snap"):
+            return
+        try:
+            utils.run_cmd(["snap", "ack", f"{path}.assert"])
+            utils.run_cmd(["snap", "install", f"{path}.snap"], timeout=900)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            # The refresh below downloads the snap instead.
+            logger.warning(f"Failed to install staged microceph: {e}")
+
+    def _clear_staged(self) -> None:
+        """Remove staged snaps."""
+        for path in glob.glob(os.path.join(UPGRADE_STAGING_DIR, "microceph_*")):
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Failed to remove {path}: {e}")
+
+    def _wait_mon_quorum_safe(self) -> None:
+        """Wait until restarting this node's mon leaves a quorum of mons."""
+        hostname = gethostname()
+
+        @tenacity.retry(
+            wait=tenacity.wait_fixed(8),
+            stop=tenacity.stop_after_delay(900),
+            retry=tenacity.retry_if_result(lambda is_safe: not is_safe),
+        )
+        def quorum_safe():
+            try:
+                mons, quorum = ceph.get_mon_quorum()
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired, ValueError) as e:
+                logger.warning(f"Failed to get mon quorum: {e}")
+                return False
+            # Clusters of one or two mons cannot lose any, as before.
+            if hostname not in mons or len(mons) < 3:
+                return True
+            down = set(mons) - set(quorum) - {hostname}
+            logger.debug(f"Mons out of quorum: {sorted(down)}")
+            return len(down) + 1 <= (len(mons) - 1) // 2
+
+        try:
+            quorum_safe()
+        except tenacity.RetryError:
+            msg = f"Cannot upgrade {self.model.unit.name}, too many mons out of quorum"
+            logger.warning(msg)
+            raise sunbeam_guard.BlockedExceptionError(msg)
+
+    def plan_upgrade(self, nodes: List[str]) -> List[List[str]]:
+        """Return the batches the nodes upgrade in.
+
+        Nodes upgrade one at a time, unless upgrade-by-failure-domain is set:
+        then all nodes of the CRUSH bucket holding their host upgrade at once,
+        or of their availability zone if the cluster was deployed with them.
+        Batches are only formed when every pool spreads its data across that
+        type of bucket, so a batch never holds two copies of any data.
+        """
+        sequential = [[node] for node in nodes]
+        relation = self.model.get_relation("peers")
+        if not self.model.config.get("upgrade-by-failure-domain") or relation is None:
+            return sequential
+
+        try:
+            host_buckets = ceph.get_host_buckets()
+            pool_domains = ceph.get_pool_failure_domains()
+            mons, _ = ceph.get_mon_quorum()
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, ValueError) as e:
+            logger.warning(f"Cannot plan upgrade by failure domain, upgrading sequentially: {e}")
+            return sequential
+
+        uses_az = bool(self.charm.peers.get_app_data("cluster_uses_az"))
+        unit_data = {unit.name: relation.data[unit] for unit in relation.units}
+        domains, mon_nodes = {}, set()
+        for node in nodes:
+            data = unit_data.get(node, {})
+            # Units publish their hostname under their own name.
+            hostname = data.get(node, node)
+            zone = data.get("availability-zone") if uses_az else None
+            domain = _upgrade_domain(host_buckets.get(hostname), zone, node)
+            if domain is None or (domain[0] and pool_domains and pool_domains != {domain[0]}):
+                logger.warning(
+                    f"Pools spread data across {', '.join(sorted(pool_domains))}, "
+                    f"not the failure domain of {node}; upgrading sequentially"
+                )
+                return sequential
+            domains[node] = f"{domain[0]}:{domain[1]}"
+            if hostname in mons:
+                mon_nodes.add(node)
+        return plan_upgrade_batches(domains, mon_nodes, (len(mons) - 1) // 2)
 
     def init_upgrade(self, snap_chan: str):
         """Kick off the snap upgrade."""
         logger.debug(f"Preparing upgrade from {self.channel} to {snap_chan}")
         self.channel = snap_chan
-
-        # first upgrade this node. upgrade synchronously as we're still in
-        # the config handler
-        self.perform_upgrade(snap_chan)
-
-        # then initialise peer upgrade upgrade by setting upgrade info on the
-        # peer relation
         nonce = str(uuid.uuid4())
+        self._record_phase(nonce, "queued")
+
         peers = self.peer_int.all_joined_units()
+        if not peers:
+            self.perform_upgrade(snap_chan, nonce)
+            return
+
+        # Have all peers download the snap before any node upgrades, the
+        # upgrade starts once they acknowledged it or the deadline passed.
         upgrade_nodes = sorted([u.name for u in peers])
-        logger.debug(f"Upgrade init: {upgrade_nodes}, {snap_chan}, {nonce}")
+        logger.debug(f"Upgrade prefetch: {upgrade_nodes}, {snap_chan}, {nonce}")
         self.peer_int.set_upgrade_info(
             nonce,
             snap_chan,
             upgrade_nodes,
+            phase="prefetch",
+            deadline=int(time.time()) + PREFETCH_TIMEOUT,
+        )
+        # This node stages its copy in the next hook, while the peers
+        # download theirs.
+        self._prefetch_published = nonce
+        self.peer_int.on.upgrade_prefetch.emit(
+            node=self.model.unit.name, channel=snap_chan, nonce=nonce
+        )
+
+    def check_prefetch_deadline(self) -> None:
+        """Start an upgrade whose prefetch timed out, on the leader."""
+        relation = self.model.get_relation("peers")
+        if relation is not None:
+            self.peer_int.check_prefetch(relation)
+
+    def start_upgrade(self, event: relation_handlers.UpgradeStartEvent):
+        """Upgrade this node, then the peers, once they staged the snap."""
+        channel = event.channel
+        nonce = event.nonce
+        upgrade_info = self.peer_int.get_upgrade_info()
+        if not upgrade_info or upgrade_info.get("nonce") != nonce:
+            logger.debug(f"Upgrade {nonce} is not pending, ignoring")
+            return
+
+        if upgrade_info.get("phase") == "prefetch":
+            # Peer data is only committed once the hook ends: leave the
+            # prefetch phase, then upgrade this node in the next hook.
+            self.peer_int.set_upgrade_info(nonce, channel, upgrade_info["nodes"], phase="leader")
+            event.defer()
+            return
+
+        # first upgrade this node. upgrade synchronously, the peers only start
+        # once the upgrade info is updated
+        self.perform_upgrade(channel, nonce)
+
+        batches = self.plan_upgrade(upgrade_info["nodes"])
+        logger.debug(f"Upgrade start: {batches}, {channel}, {nonce}")
+        self.peer_int.set_upgrade_info(
+            nonce,
+            channel,
+            [node for batch in batches for node in batch],
+            batches,
         )
 
+    def prefetch_node_request(self, event: relation_handlers.UpgradePrefetchRequestEvent):
+        """Stage the snap for this node and acknowledge it."""
+        logger.debug(f"Prefetching for {event.node}, {event.channel}, {event.nonce}")
+        if event.node != self.model.unit.name:
+            return
+        if event.nonce == self._prefetch_published:
+            # Peer data is only committed once the hook ends: let the peers
+            # see the prefetch phase before downloading.
+            event.defer()
+            return
+        # Acknowledge failed downloads too, the upgrade then downloads the snap.
+        self._record_phase(event.nonce, "queued")
+        self.prefetch(event.channel)
+        self._record_phase(event.nonce, "prefetched")
+        self.peer_int.set_unit_data({"upgrade-prefetched": event.nonce})
+
     def upgrade_node_request(self, event: relation_handlers.UpgradeNodeRequestEvent):
         """Handle upgrade request for this node."""
         node = event.node
@@ -243,10 +681,222 @@ class ClusterUpgrades(ops.framework.Object):
         logger.debug(f"Upgrading node {node}, {channel}, {nonce}")
 
         if node == self.model.unit.name:
-            self.perform_upgrade(channel)  # raise exception on failure
+            self.perform_upgrade(channel, nonce)  # raise exception on failure
             self.peer_int.on.upgrade_done.emit(node=node, channel=channel, nonce=nonce)
 
     def upgrade_node_done(self, event: relation_handlers.UpgradeNodeDoneEvent):
         """Signal upgrade done for this node."""
         logger.debug(f"Handle upgrade done {event.nonce}")
         self.peer_int.set_unit_data({"upgrade-done": event.nonce})
+
+
+class OsdEnrollAdmittedEvent(ops.framework.EventBase):
+    """This unit may enroll its pending config-driven OSDs."""
+
+
+class OsdEnrollAdmissionEvents(ops.framework.ObjectEvents):
+    """Events emitted by OsdEnrollAdmission."""
+
+    admitted = ops.framework.EventSource(OsdEnrollAdmittedEvent)
+
+
+class OsdEnrollAdmission(ops.framework.Object):
+    """OsdEnrollAdmission throttles config-driven OSD enrollment across the cluster.
+
+    With osd-enroll-concurrency set, a unit with OSDs to enroll posts a request
+    in its peer unit data. The leader admits at most that many units at a time
+    as a wave in the peer app data, holding the osd-enroll-flags while the wave
+    enrolls. Once every unit of the wave reported back, the flags are released
+    and the next wave starts when PG peering settled.
+    """
+
+    on = OsdEnrollAdmissionEvents()
+
+    def __init__(self, charm: "charm.MicroCephCharm"):
+        super().__init__(charm, "osd-enroll-admission")
+        self.charm = charm
+        self.framework.observe(charm.on["peers"].relation_changed, self._on_peers_changed)
+        self.framework.observe(charm.on.update_status, self._on_peers_changed)
+
+    @property
+    def enabled(self) -> bool:
+        """Whether enrollment is throttled."""
+        return self.model.config.get("osd-enroll-concurrency", 0) > 0
+
+    @property
+    def _relation(self):
+        return self.model.get_relation("peers")
+
+    def _wave(self) -> dict:
+        return json.loads(self.charm.peers.get_app_data(OSD_ENROLL_WAVE_KEY) or "{}")
+
+    def _unit_value(self, unit, key: str) -> str:
+        return self._relation.data[unit].get(key, "")
+
+    def _admitted(self, wave: dict) -> bool:
+        """Whether this unit is part of the enrolling wave and not done yet."""
+        unit = self.model.unit
+        return (
+            wave.get("state") == "enrolling"
+            and unit.name in wave["units"]
+            and self._unit_value(unit, "osd-enroll-done") != str(wave["id"])
+        )
+
+    def acquire(self, request: str) -> bool:
+        """Return whether this unit may enroll OSDs now, else queue a request.
+
+        Args:
+            request: non-empty description of what the unit wants to enroll.
+        """
+        if not self.enabled or not self._relation:
+            return True
+        if self._admitted(self._wave()):
+            return True
+
+        logger.info("Requesting admission to enroll OSDs")
+        self.charm.peers.set_unit_data({"osd-enroll-request": request})
+        if self.model.unit.is_leader():
+            self.reconcile()
+            return self._admitted(self._wave())
+        return False
+
+    def release(self) -> None:
+        """Report this unit done with its wave."""
+        if not self.enabled or not self._relation:
+            return
+        wave = self._wave()
+        if not self._admitted(wave):
+            return
+
+        logger.info("Done enrolling OSDs in wave %s", wave["id"])
+        self.charm.peers.set_unit_data(
+            {"osd-enroll-done": str(wave["id"]), "osd-enroll-request": ""}
+        )
+        if self.model.unit.is_leader():
+            self.reconcile()
+
+    def _on_peers_changed(self, _event: ops.framework.EventBase) -> None:
+        if not self._relation:
+            return
+        if not self.enabled:
+            self._drop_wave()
+            return
+        if self.model.unit.is_leader():
+            self.reconcile()
+        if self._admitted(self._wave()) and self._unit_value(
+            self.model.unit, "osd-enroll-request"
+        ):
+            self.on.admitted.emit()
+
+    def _units(self) -> list:
+        return [self.model.unit, *self._relation.units]
+
+    def reconcile(self) -> None:
+        """Finish the current wave and start the next one, on the leader."""
+        wave = self._wave()
+        if wave.get("state") == "enrolling":
+            pending = [
+                unit.name
+                for unit in self._units()
+                if unit.name in wave["units"]
+                and self._unit_value(unit, "osd-enroll-done") != str(wave["id"])
+            ]
+            if pending:
+                logger.debug("OSD enrollment wave %s waiting for %s", wave["id"], pending)
+                return
+            self._release_flags(wave["flags"])
+            wave = {"id": wave["id"], "state": "settling"}
+            self._set_wave(wave)
+
+        if wave.get("state") == "settling" and not self._peering_settled():
+            return
+
+        requests = sorted(
+            unit.name for unit in self._units() if self._unit_value(unit, "osd-enroll-request")
+        )
+        if not requests:
+            if wave.get("state") == "settling":
+                self._set_wave({"id": wave["id"], "state": "idle"})
+            return
+
+        units = requests[: self.model.config["osd-enroll-concurrency"]]
+        wave = {
+            "id": wave.get("id", 0) + 1,
+            "state": "enrolling",
+            "units": units,
+            "flags": self._hold_flags(),
+        }
+        logger.info("Starting OSD enrollment wave %s for %s", wave["id"], units)
+        self._set_wave(wave)
+
+    def _drop_wave(self) -> None:
+        """Clean up after enrollment stopped being throttled.
+
+        The leader releases the flags held by a wave which was still enrolling
+        and clears the wave, units drop their pending requests.
+        """
+        if self._unit_value(self.model.unit, "osd-enroll-request"):
+            self.charm.peers.set_unit_data({"osd-enroll-request": ""})
+        if not self.model.unit.is_leader():
+            return
+        wave = self._wave()
+        if not wave:
+            return
+        if wave.get("state") == "enrolling":
+            failed = self._release_flags(wave["flags"])
+            if failed:
+                # Retried on the next update-status.
+                self._set_wave({**wave, "flags": failed})
+                return
+        logger.info("OSD enrollment is no longer throttled, dropping wave %s", wave["id"])
+        self.charm.peers.set_app_data({OSD_ENROLL_WAVE_KEY: ""})
+
+    def _set_wave(self, wave: dict) -> None:
+        self.charm.peers.set_app_data({OSD_ENROLL_WAVE_KEY: json.dumps(wave)})
+
+    def _hold_flags(self) -> list:
+        """Set the configured osd-enroll-flags, returning the ones which were set."""
+        flags = [
+            flag
+            for flag in utils.split_space_or_comma(self.model.config.get("osd-enroll-flags", ""))
+            if flag in OSD_ENROLL_FLAGS
+        ]
+        if not flags:
+            return []
+        added = []
+        try:
+            current = ceph.get_osd_flags()
+            for flag in flags:
+                if flag not in current:
+                    ceph.set_osd_flag(flag)
+                    added.append(flag)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            logger.warning("Failed to set osd flags %s for OSD enrollment: %s", flags, e)
+        return added
+
+    def _release_flags(self, flags: list) -> list:
+        """Unset the flags held by a wave, returning the ones which failed."""
+        failed = []
+        for flag in flags:
+            try:
+                ceph.unset_osd_flag(flag)
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+                logger.warning("Failed to unset osd flag %s: %s", flag, e)
+                failed.append(flag)
+        return failed
+
+    def _peering_settled(self) -> bool:
+        """Check whether PG peering settled.
+
+        Hooks do not wait for it, a settling wave is checked again on the next
+        peers relation-changed or update-status.
+        """
+        try:
+            peering = ceph.get_peering_pg_count()
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, ValueError) as e:
+            logger.warning("Failed to get PG states: %s", e)
+            return False
+        if peering:
+            logger.info("%s PGs still peering, holding the next OSD enrollment wave", peering)
+            return False
+        return True
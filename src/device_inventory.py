@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+# Copyright 2025 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Host block device inventory."""
+
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+
+import utils
+
+logger = logging.getLogger(__name__)
+
+BY_ID_DIR = "/dev/disk/by-id"
+SYS_BLOCK_DIR = "/sys/block"
+
+# Virtual block devices which never back a config-driven OSD.
+_VIRTUAL_DEVICE_PREFIXES = ("loop", "ram", "zram", "dm-", "md", "sr", "nbd")
+
+# Inventory shared by everything running in the current hook, see get_inventory.
+_inventory: Optional["DeviceInventory"] = None
+
+
+class DeviceInventory:
+    """Index of the host's block devices.
+
+    Built from a single ``lsblk`` call, the inventory resolves a device by
+    kernel name (``sdb``), device path (``/dev/sdb``), ``/dev/disk/by-id``
+    path, serial or WWN. Partitions and other child devices are indexed as
+    well, and are also reachable through their parent's ``children``.
+    """
+
+    def __init__(self, devices: List[dict], by_id: Optional[Dict[str, List[str]]] = None):
+        """Index the lsblk devices.
+
+        Args:
+            devices: top level ``blockdevices`` from ``lsblk --json``.
+            by_id: ``/dev/disk/by-id`` links keyed by the device path they
+                resolve to.
+        """
+        self.devices = devices
+        self._index: Dict[str, dict] = {}
+        by_id = by_id or {}
+
+        for device in self._walk(devices):
+            path = device.get("path") or f"/dev/{device.get('kname') or device.get('name')}"
+            keys = [device.get("kname"), device.get("name"), path, *by_id.get(path, [])]
+            # Serial and WWN only identify whole disks, partitions share them.
+            if not device.get("pkname"):
+                keys += [device.get("serial"), device.get("wwn")]
+            for key in keys:
+                if key:
+                    self._index.setdefault(key, device)
+
+    @classmethod
+    def from_host(cls) -> "DeviceInventory":
+        """Build the inventory of the local host."""
+        output = utils.run_cmd(["lsblk", "--json", "--bytes", "-O"])
+        return cls(json.loads(output).get("blockdevices", []), _read_by_id_links())
+
+    @staticmethod
+    def _walk(devices: List[dict]):
+        for device in devices:
+            yield device
+            yield from DeviceInventory._walk(device.get("children") or [])
+
+    def get(self, disk: str) -> dict:
+        """Return the lsblk entry for the disk, or {} if it is not a block device."""
+        device = self._index.get(disk)
+        if device is None and disk.startswith("/"):
+            # Any other symlink to a block device, e.g. /dev/disk/by-path.
+            device = self._index.get(os.path.realpath(disk))
+        return device or {}
+
+    def disks(self) -> List[dict]:
+        """Return the whole disks on the host."""
+        return [d for d in self._walk(self.devices) if d.get("type") == "disk"]
+
+
+def _read_by_id_links() -> Dict[str, List[str]]:
+    """Map device paths to the /dev/disk/by-id links pointing at them."""
+    links: Dict[str, List[str]] = {}
+    try:
+        entries = list(os.scandir(BY_ID_DIR))
+    except OSError as e:
+        logger.debug("Could not read %s: %s", BY_ID_DIR, e)
+        return links
+
+    for entry in entries:
+        links.setdefault(os.path.realpath(entry.path), []).append(entry.path)
+    return links
+
+
+def fingerprint() -> str:
+    """Return a cheap fingerprint of the host's physical disks.
+
+    Built from the serial (or kernel name) and size of every disk in
+    /sys/block without forking any command, so it can be polled on
+    update-status to notice hot-plugged or removed disks.
+    """
+    try:
+        names = sorted(os.listdir(SYS_BLOCK_DIR))
+    except OSError as e:
+        logger.debug("Could not read %s: %s", SYS_BLOCK_DIR, e)
+        return ""
+
+    entries = []
+    for name in names:
+        if name.startswith(_VIRTUAL_DEVICE_PREFIXES):
+            continue
+        base = os.path.join(SYS_BLOCK_DIR, name)
+        serial = _read_sysfs(base, "device/serial") or _read_sysfs(base, "device/wwid") or name
+        entries.append(f"{serial}:{_read_sysfs(base, 'size')}")
+
+    return hashlib.sha256("\n".join(entries).encode()).hexdigest()
+
+
+def _read_sysfs(base: str, attr: str) -> str:
+    try:
+        with open(os.path.join(base, attr)) as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def get_inventory() -> DeviceInventory:
+    """Return the host inventory, built once and reused for the rest of the hook."""
+    global _inventory
+    if _inventory is None:
+        _inventory = DeviceInventory.from_host()
+    return _inventory
+
+
+def invalidate_inventory() -> None:
+    """Drop the cached inventory, e.g. after devices were consumed as OSDs."""
+    global _inventory
+    _inventory = None
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+# Copyright 2025 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Erasure code profiles suiting the cluster's CPUs and failure domains."""
+
+import logging
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+CPUINFO = "/proc/cpuinfo"
+
+# SIMD instruction sets the erasure code plugins make use of, slowest first.
+# "none" stands for a CPU with none of them, or one that could not be probed.
+SIMD_LEVELS = ("none", "avx2", "avx512")
+
+# Largest number of data chunks recommended: wider stripes spread every
+# read and write over more OSDs.
+MAX_DATA_CHUNKS = 8
+
+# The isa plugin's Vandermonde matrix is only guaranteed to be invertible up
+# to this many coding chunks, Ceph reverts larger profiles to it.
+ISA_VANDERMONDE_MAX_CODING_CHUNKS = 4
+
+
+def probe_simd(path: str = CPUINFO) -> str:
+    """Return the widest SIMD instruction set every CPU of the host supports.
+
+    Args:
+        path: file in the format of /proc/cpuinfo.
+
+    Returns:
+        One of SIMD_LEVELS.
+    """
+    try:
+        with open(path) as f:
+            lines = f.readlines()
+    except OSError as e:
+        logger.debug("Could not read %s: %s", path, e)
+        return "none"
+
+    # Hybrid CPUs may differ between cores, keep what all of them support.
+    cpus = [set(line.split(":", 1)[1].split()) for line in lines if line.startswith("flags")]
+    if not cpus:
+        return "none"
+    flags = set.intersection(*cpus)
+    if {"avx512f", "avx512bw"} <= flags:
+        return "avx512"
+    if "avx2" in flags:
+        return "avx2"
+    return "none"
+
+
+def lowest_simd(levels: Iterable[str]) -> str:
+    """Return the SIMD instruction set all the given hosts support."""
+    levels = list(levels)
+    if not levels:
+        return "none"
+    return min(levels, key=lambda level: SIMD_LEVELS.index(level) if level in SIMD_LEVELS else 0)
+
+
+def recommend_chunks(failure_domains: int) -> tuple:
+    """Pick the data and coding chunk counts for a number of failure domains.
+
+    Every chunk is placed in its own failure domain, and a spare domain is kept
+    when there are enough of them, so that the chunks of a lost domain can be
+    recovered elsewhere.
+
+    Args:
+        failure_domains: number of failure domains holding OSDs.
+
+    Returns:
+        A (k, m) tuple.
+
+    Raises:
+        ValueError: if there are too few failure domains for erasure coding.
+    """
+    if failure_domains < 3:
+        raise ValueError(
+            f"Erasure coding needs at least 3 failure domains, found {failure_domains}"
+        )
+    m = 2 if failure_domains >= 5 else 1
+    spare = 1 if failure_domains - m > 2 else 0
+    return min(MAX_DATA_CHUNKS, failure_domains - m - spare), m
+
+
+def recommend_technique(plugin: str, coding_chunks: int) -> Optional[str]:
+    """Return the coding technique suiting a plugin, None for the plugin's default."""
+    if plugin == "isa":
+        if coding_chunks > ISA_VANDERMONDE_MAX_CODING_CHUNKS:
+            return "cauchy"
+        return "reed_sol_van"
+    if plugin == "jerasure":
+        return "reed_sol_van"
+    return None
+
+
+def recommend_erasure_profile(
+    simd: str,
+    failure_domains: int,
+    plugin: Optional[str] = None,
+    data_chunks: Optional[int] = None,
+    coding_chunks: Optional[int] = None,
+    stripe_unit: Optional[int] = None,
+) -> dict:
+    """Recommend the settings of an erasure code profile.
+
+    The isa plugin is recommended when all storage hosts support AVX2, as
+    ISA-L then encodes and decodes several times faster than jerasure.
+    Settings which are given are kept, the others are filled in.
+
+    Args:
+        simd: SIMD instruction set all storage hosts support.
+        failure_domains: number of failure domains the profile can spread
+            chunks over.
+        plugin: erasure code plugin, None to pick one.
+        data_chunks: number of data chunks (k), None to pick one.
+        coding_chunks: number of coding chunks (m), None to pick one.
+        stripe_unit: size of the chunk written to each OSD per stripe, None
+            for Ceph's default.
+
+    Returns:
+        The plugin, technique, k, m and, if given, stripe_unit of the profile.
+
+    Raises:
+        ValueError: if k or m must be picked but there are too few failure
+            domains for erasure coding.
+    """
+    if data_chunks is None or coding_chunks is None:
+        k, m = recommend_chunks(failure_domains)
+        data_chunks = k if data_chunks is None else data_chunks
+        coding_chunks = m if coding_chunks is None else coding_chunks
+    if plugin is None:
+        plugin = "isa" if simd in ("avx2", "avx512") else "jerasure"
+
+    profile = {
+        "plugin": plugin,
+        "technique": recommend_technique(plugin, int(coding_chunks)),
+        "k": data_chunks,
+        "m": coding_chunks,
+    }
+    if stripe_unit:
+        profile["stripe_unit"] = stripe_unit
+    return profile
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+# Copyright 2025 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Policy deciding which ceph health checks gate snap upgrades."""
+
+from dataclasses import dataclass
+from typing import FrozenSet, Mapping, NamedTuple, Union
+
+from ceph import CephHealth
+
+# Decisions of a health policy.
+PROCEED = "proceed"
+WAIT = "wait"
+ABORT = "abort"
+
+
+class HealthVerdict(NamedTuple):
+    """Decision on ceph health, with the reason for it."""
+
+    decision: str
+    reason: str
+
+    @property
+    def ok(self) -> bool:
+        """Whether the upgrade may proceed."""
+        return self.decision == PROCEED
+
+
+def _parse_checks(value: str) -> FrozenSet[str]:
+    """Parse a comma separated list of health check codes."""
+    return frozenset(code.strip().upper() for code in (value or "").split(",") if code.strip())
+
+
+def _describe(code: str, checks: Mapping) -> str:
+    """Describe a health check by its code and summary."""
+    message = checks[code].get("summary", {}).get("message", "")
+    return f"{code} ({message})" if message else code
+
+
+@dataclass(frozen=True)
+class HealthPolicy:
+    """Health checks an upgrade ignores or aborts on.
+
+    Checks which are neither ignored nor aborted on must clear before an
+    upgrade proceeds.
+
+    Attributes:
+        ignore: codes of health checks which never hold up an upgrade.
+        abort: codes of health checks which stop an upgrade rather than
+            waiting for them to clear.
+    """
+
+    ignore: FrozenSet[str] = frozenset()
+    abort: FrozenSet[str] = frozenset()
+
+    @classmethod
+    def from_config(cls, config: Mapping) -> "HealthPolicy":
+        """Build the policy from the upgrade-health-* charm options."""
+        return cls(
+            ignore=_parse_checks(config.get("upgrade-health-ignore", "")),
+            abort=_parse_checks(config.get("upgrade-health-abort", "")),
+        )
+
+    def evaluate(self, health: CephHealth, checks: Union[Mapping, str]) -> HealthVerdict:
+        """Decide whether an upgrade may proceed.
+
+        Args:
+            health: overall ceph health.
+            checks: health checks keyed by code, as ceph health detail
+                reports them, or a description of why they are unknown.
+
+        Returns:
+            The decision, with a reason naming the checks it was based on.
+        """
+        if health == CephHealth.Ok:
+            return HealthVerdict(PROCEED, str(health))
+        if not isinstance(checks, Mapping) or not checks:
+            return HealthVerdict(WAIT, f"{health}, {checks}")
+
+        aborting = sorted(set(checks) & self.abort)
+        if aborting:
+            described = ", ".join(_describe(code, checks) for code in aborting)
+            return HealthVerdict(ABORT, f"{health}, aborting on {described}")
+
+        reason = [str(health)]
+        pending = sorted(set(checks) - self.ignore)
+        if pending:
+            described = ", ".join(_describe(code, checks) for code in pending)
+            reason.append(f"waiting for {described} to clear")
+        ignored = sorted(set(checks) & self.ignore)
+        if ignored:
+            reason.append(f"ignoring {', '.join(ignored)}")
+        return HealthVerdict(WAIT if pending else PROCEED, ", ".join(reason))
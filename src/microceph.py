@@ -18,14 +18,18 @@
 
 import json
 import logging
+import os
+import re
 import subprocess
 from socket import gethostname
+from typing import Callable, List, Optional
 
 import requests
 import tenacity
 from charms.operator_libs_linux.v2 import snap
 
 import ceph
+import device_inventory
 import utils
 from microceph_client import (
     Client,
@@ -35,6 +39,12 @@ from microceph_client import (
 
 logger = logging.getLogger(__name__)
 
+# Device nodes named in microceph disk add output.
+_DEVNODE_RE = re.compile(r"/dev/\S+")
+# Lines of microceph disk add output naming a WAL or DB device, e.g.
+# "  wal: /dev/nvme0n1p1", rather than an OSD data device.
+_WALDB_LINE_RE = re.compile(r"^\W*(wal|db)\b", re.IGNORECASE)
+
 MAJOR_VERSIONS = {
     "17": "quincy",
     "18": "reef",
@@ -42,6 +52,18 @@ MAJOR_VERSIONS = {
     "20": "tentacle",
 }
 
+# Points at the installed revision of the microceph snap.
+SNAP_CURRENT_PATH = "/snap/microceph/current"
+
+# Identifies the current boot, dm-crypt must be loaded again after a reboot.
+BOOT_ID_PATH = "/proc/sys/kernel/random/boot_id"
+# Present while the dm_crypt kernel module is loaded.
+DM_CRYPT_MODULE_PATH = "/sys/module/dm_crypt"
+
+# Snap revision, boot and dm-crypt plug connection for which dm-crypt is
+# known to be set up, see prepare_dm_crypt.
+_dm_crypt_ready_key = None
+
 
 def _az_flag_supported() -> bool:
     """Return True if the installed microceph supports --availability-zone."""
@@ -444,9 +466,17 @@ def microceph_has_service(service_name) -> bool:
 
 # Disk CMDs and Helpers
 def add_osd_cmd(
-    spec: str, wal_dev: str = None, db_dev: str = None, wipe: bool = False, encrypt: bool = False
+    spec: str,
+    wal_dev: str = None,
+    db_dev: str = None,
+    wipe: bool = False,
+    encrypt: bool = False,
+    on_line: Optional[Callable[[str], None]] = None,
 ) -> None:
-    """Executes MicroCeph add osd cmd with provided spec."""
+    """Executes MicroCeph add osd cmd with provided spec.
+
+    With ``on_line``, the output lines are passed to it as they are printed.
+    """
     cmd = ["microceph", "disk", "add", spec]
     if wal_dev:
         cmd.extend(["--wal-device", wal_dev, "--wal-wipe"])
@@ -456,10 +486,85 @@ def add_osd_cmd(
         cmd.append("--wipe")
     if encrypt:
         logger.debug("Called with --encrypt flag")
-        _setup_dm_crypt()
+        prepare_dm_crypt()
         cmd.append("--encrypt")
 
-    utils.run_cmd(cmd, timeout=900)
+    if on_line:
+        utils.run_cmd_streaming(cmd, timeout=900, on_line=on_line)
+    else:
+        utils.run_cmd(cmd, timeout=900)
+    device_inventory.invalidate_inventory()
+
+
+def snap_revision() -> str:
+    """Return the installed microceph snap revision, or "" if unknown."""
+    try:
+        return os.readlink(SNAP_CURRENT_PATH)
+    except OSError:
+        return ""
+
+
+def _boot_id() -> str:
+    """Return the id of the current boot, or "" if unknown."""
+    try:
+        with open(BOOT_ID_PATH) as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def _dm_crypt_slot() -> str:
+    """Return the slot the dm-crypt plug of microceph is connected to, "" if none."""
+    try:
+        output = utils.run_cmd(["snap", "connections", "microceph"])
+    except subprocess.CalledProcessError:
+        return ""
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) >= 3 and fields[1] == "microceph:dm-crypt":
+            return "" if fields[2] == "-" else fields[2]
+    return ""
+
+
+def _dm_crypt_key() -> str:
+    """Return the snap revision, boot and dm-crypt slot, "" if any is unknown."""
+    revision, boot_id = snap_revision(), _boot_id()
+    if not revision or not boot_id:
+        return ""
+    slot = _dm_crypt_slot()
+    return f"{revision}:{boot_id}:{slot.lstrip(':')}" if slot else ""
+
+
+def prepare_dm_crypt() -> None:
+    """Make dm-crypt usable by the microceph snap, once per snap revision and boot.
+
+    Connecting the dm-crypt plug survives until the snap is refreshed or the
+    plug is disconnected, and loading the module until the host reboots. So
+    once dm-crypt was set up for the installed revision in the current boot,
+    with the plug still connected and the module still loaded, further calls
+    only check ``snap connections``. Callers persist ``dm_crypt_ready_key()``
+    across hooks and seed it back with ``set_dm_crypt_ready_key()``.
+    """
+    global _dm_crypt_ready_key
+    key = _dm_crypt_key()
+    if key and key == _dm_crypt_ready_key and os.path.isdir(DM_CRYPT_MODULE_PATH):
+        logger.debug("dm-crypt already set up for microceph: %s", key)
+        return
+
+    _setup_dm_crypt()
+    # Setting up connects the plug.
+    _dm_crypt_ready_key = _dm_crypt_key()
+
+
+def dm_crypt_ready_key() -> str:
+    """Return the snap revision, boot and slot dm-crypt was set up for, "" if not set up."""
+    return _dm_crypt_ready_key or ""
+
+
+def set_dm_crypt_ready_key(key: str) -> None:
+    """Record the snap revision, boot and slot dm-crypt is set up for, "" to set it up again."""
+    global _dm_crypt_ready_key
+    _dm_crypt_ready_key = key or None
 
 
 def _setup_dm_crypt() -> None:
@@ -506,6 +611,7 @@ def add_batch_osds(disks: list) -> None:
     # of block devices as params.
     cmd.extend(disks)
     utils.run_cmd(cmd)
+    device_inventory.invalidate_inventory()
 
 
 def _append_optional_match_args(cmd: list, *flag_value_pairs: tuple[str, str | None]) -> None:
@@ -522,6 +628,25 @@ def _append_enabled_flags(cmd: list, *flag_pairs: tuple[bool, str]) -> None:
             cmd.append(flag)
 
 
+def disk_add_data_device(line: str) -> str:
+    """Return the OSD data device named in a line of disk add output, if any.
+
+    MicroCeph has no structured output for disk add, its result table lists
+    the data device first. WAL/DB devices are listed on their own lines or
+    after the data device of their OSD, so only the first device of a data
+    device line is taken.
+    """
+    if _WALDB_LINE_RE.match(line):
+        return ""
+    match = _DEVNODE_RE.search(line)
+    return match.group() if match else ""
+
+
+def disk_add_data_devices(output: Optional[str]) -> List[str]:
+    """Return the sorted OSD data devices named in disk add output."""
+    return sorted({disk_add_data_device(line) for line in (output or "").splitlines()} - {""})
+
+
 def add_disk_match_cmd(
     osd_match: str,
     *,
@@ -536,8 +661,14 @@ def add_disk_match_cmd(
     db_wipe: bool = False,
     db_encrypt: bool = False,
     dry_run: bool = False,
+    on_line: Optional[Callable[[str], None]] = None,
 ) -> str:
-    """Execute MicroCeph disk add with DSL-based OSD/WAL/DB matching."""
+    """Execute MicroCeph disk add with DSL-based OSD/WAL/DB matching.
+
+    With ``on_line``, the output lines of an actual enrollment are passed to it
+    as they are printed and only the tail of the output is returned. Dry runs
+    always return the full output.
+    """
     logger.debug(
         "Preparing microceph disk add command osd_match=%s wal_match=%s wal_size=%s "
         "db_match=%s db_size=%s wipe=%s encrypt=%s wal_wipe=%s wal_encrypt=%s "
@@ -583,7 +714,9 @@ def add_disk_match_cmd(
         cmd,
     )
 
-    if encrypt or (wal_enabled and wal_encrypt) or (db_enabled and db_encrypt):
+    # Dry runs do not touch the devices, dm-crypt is only needed to enroll.
+    encrypting = encrypt or (wal_enabled and wal_encrypt) or (db_enabled and db_encrypt)
+    if encrypting and not dry_run:
         logger.debug(
             "Encryption requested for disk add command; ensuring dm-crypt is available "
             "osd_encrypt=%s wal_encrypt=%s db_encrypt=%s",
@@ -591,9 +724,15 @@ def add_disk_match_cmd(
             wal_encrypt,
             db_encrypt,
         )
-        _setup_dm_crypt()
+        prepare_dm_crypt()
 
-    return utils.run_cmd(cmd, timeout=900)
+    if on_line and not dry_run:
+        output = utils.run_cmd_streaming(cmd, timeout=900, on_line=on_line)
+    else:
+        output = utils.run_cmd(cmd, timeout=900)
+    if not dry_run:
+        device_inventory.invalidate_inventory()
+    return output
 
 
 def get_snap_info(snap_name):
@@ -650,15 +789,11 @@ def enroll_disks_as_osds(disks: list) -> None:
 
 
 def _get_disk_info(disk: str) -> dict:
-    """Fetches disk info from lsblk as a python dict."""
-    try:
-        disk_info = json.loads(utils.run_cmd(["lsblk", disk, "--json"]))["blockdevices"]
-        return disk_info[0]
-    except subprocess.CalledProcessError as e:
-        if "not a block device" in e.stderr:
-            return {}
-        else:
-            raise e
+    """Fetches disk info from the host device inventory as a python dict.
+
+    Returns {} if the disk is not a block device.
+    """
+    return device_inventory.get_inventory().get(disk)
 
 
 def _is_block_device_enrollable(disk: str) -> bool:
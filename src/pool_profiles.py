@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+# Copyright 2025 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Workload profiles for broker-created pools."""
+
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+# Device classes, fastest first.
+FAST_DEVICE_CLASSES = ("nvme", "ssd")
+
+
+@dataclass(frozen=True)
+class PoolProfile:
+    """Pool settings suiting one workload.
+
+    Attributes:
+        device_classes: device classes the pool is placed on, in order of
+            preference. Only applied when the pool is created with the
+            profile requested, and only if enough hosts hold OSDs of such a
+            class; empty for any class.
+        target_size_ratio: share of the cluster the pool is expected to use,
+            None to leave it to the pool's weight. Only applied when the
+            profile is requested.
+        autoscale_bias: multiplier of the PG count the autoscaler picks.
+        pg_num_min: lower bound of the PG count the autoscaler picks.
+        compression_mode: BlueStore compression mode, "" to leave it alone.
+        fast_read: read from all shards of erasure coded pools at once.
+        ec_overwrites: allow partial overwrites of erasure coded pools.
+        stripe_unit: bytes of a stripe written to each OSD of erasure coded
+            pools, 0 for Ceph's default of 4KiB.
+        rbd_qos: (option, value) pairs of RBD QoS options, such as
+            ("rbd_qos_iops_limit", 1000), limiting every image of the pool.
+            Only applied when the profile is requested.
+
+    A profile inferred from the pool's application and name only tunes the
+    pool when it is created.
+    """
+
+    device_classes: Tuple[str, ...] = ()
+    target_size_ratio: Optional[float] = None
+    autoscale_bias: float = 1.0
+    pg_num_min: int = 0
+    compression_mode: str = ""
+    fast_read: bool = False
+    ec_overwrites: bool = False
+    stripe_unit: int = 0
+    rbd_qos: Tuple[Tuple[str, int], ...] = ()
+
+
+PROFILES = {
+    # Block devices of VMs: random small I/O, partial writes on EC.
+    "rbd-vm": PoolProfile(pg_num_min=32, ec_overwrites=True),
+    # Bucket indexes: omap heavy.
+    "rgw-index": PoolProfile(
+        device_classes=FAST_DEVICE_CLASSES,
+        target_size_ratio=0.01,
+        autoscale_bias=4.0,
+        pg_num_min=16,
+    ),
+    # Object data: large sequential I/O.
+    "rgw-data": PoolProfile(fast_read=True, stripe_unit=64 * 1024),
+    "cephfs-metadata": PoolProfile(
+        device_classes=FAST_DEVICE_CLASSES,
+        target_size_ratio=0.01,
+        autoscale_bias=4.0,
+        pg_num_min=16,
+    ),
+    # Many small objects written in bursts.
+    "gnocchi-metrics": PoolProfile(
+        device_classes=FAST_DEVICE_CLASSES, autoscale_bias=2.0, pg_num_min=32
+    ),
+    # Rarely read data, traded against capacity.
+    "cold-archive": PoolProfile(
+        device_classes=("hdd",), compression_mode="aggressive", stripe_unit=64 * 1024
+    ),
+}
+
+
+def infer_profile_name(app_name: str, pool_name: str) -> Optional[str]:
+    """Guess the workload profile of a pool from its application and name.
+
+    RGW pools other than bucket indexes and data, e.g. .log or .control,
+    have no profile.
+    """
+    name = (pool_name or "").lower()
+    if "gnocchi" in name:
+        return "gnocchi-metrics"
+    if app_name == "rbd":
+        return "rbd-vm"
+    if app_name == "rgw":
+        if name.endswith(".data"):
+            return "rgw-data"
+        return "rgw-index" if name.endswith(".index") else None
+    # ceph fs volume create names the metadata pool cephfs.<volume>.meta.
+    if app_name == "cephfs" and ("metadata" in name or name.endswith(".meta")):
+        return "cephfs-metadata"
+    return None
+
+
+def resolve_profile(
+    requested: Optional[str], app_name: str, pool_name: str
+) -> Optional[PoolProfile]:
+    """Return the workload profile of a pool.
+
+    Args:
+        requested: profile named in the broker request, if any.
+        app_name: Ceph application of the pool.
+        pool_name: name of the pool.
+
+    Returns:
+        The requested profile, or the one inferred when none was requested.
+        None when no profile fits.
+
+    Raises:
+        ValueError: if the requested profile does not exist.
+    """
+    name = requested or infer_profile_name(app_name, pool_name)
+    if name is None:
+        return None
+    if name not in PROFILES:
+        raise ValueError(
+            f"Unknown workload profile '{name}'. Valid profiles: {', '.join(sorted(PROFILES))}"
+        )
+    return PROFILES[name]
@@ -22,6 +22,8 @@ This charm deploys and manages microceph.
 
 import json
 import logging
+import os
+import time
 from socket import gethostname
 from typing import Callable, Dict, List, Optional, Tuple
 
@@ -38,6 +40,7 @@ from ops.framework import (
 from ops_sunbeam.interfaces import OperatorPeers
 from ops_sunbeam.relation_handlers import BasePeerHandler, RelationHandler
 
+import erasure_profiles
 import utils
 from ceph import Capabilities, get_osd_count
 from ceph import is_leader as is_ceph_mon_leader
@@ -90,6 +93,18 @@ def collect_peer_data(model: ops.model.Model) -> dict:
     elif current_data.get("nfs-address"):
         to_update["nfs-address"] = ""
 
+    # Record the availability zone, so services such as NFS can be spread
+    # across zones.
+    availability_zone = os.environ.get("JUJU_AVAILABILITY_ZONE", "")
+    if current_data.get("availability-zone", "") != availability_zone:
+        to_update["availability-zone"] = availability_zone
+
+    # Publish the SIMD instruction sets of the host's CPUs, the leader picks
+    # the erasure code plugin of new profiles from them.
+    cpu_simd = erasure_profiles.probe_simd()
+    if current_data.get("cpu-simd") != cpu_simd:
+        to_update["cpu-simd"] = cpu_simd
+
     return to_update
 
 
@@ -159,6 +174,14 @@ class UpgradeNodeDoneEvent(UpgradeBaseEvent):
     """Event to indicate that an upgrade request has been processed."""
 
 
+class UpgradePrefetchRequestEvent(UpgradeBaseEvent):
+    """Event to stage the snap revision of an upgrade on a node."""
+
+
+class UpgradeStartEvent(UpgradeBaseEvent):
+    """Event to start the rolling upgrade once all nodes staged the snap."""
+
+
 class MicroClusterEvents(ObjectEvents):
     """Events related to MicroCluster apps."""
 
@@ -167,6 +190,8 @@ class MicroClusterEvents(ObjectEvents):
     remove_node = EventSource(MicroClusterRemoveNodeEvent)
     upgrade_request = EventSource(UpgradeNodeRequestEvent)
     upgrade_done = EventSource(UpgradeNodeDoneEvent)
+    upgrade_prefetch = EventSource(UpgradePrefetchRequestEvent)
+    upgrade_start = EventSource(UpgradeStartEvent)
 
 
 class MicroClusterPeers(OperatorPeers):
@@ -200,19 +225,35 @@ class MicroClusterPeers(OperatorPeers):
         # Do nothing or raise an event to charm?
         pass
 
-    def set_upgrade_info(self, nonce: str, channel: str, nodes: List[str]) -> None:
-        """Set upgrade info in app data."""
-        self.set_app_data(
-            {
-                "upgrade-info": json.dumps(
-                    {
-                        "nonce": nonce,
-                        "nodes": nodes,
-                        "channel": channel,
-                    }
-                )
-            }
-        )
+    def set_upgrade_info(
+        self,
+        nonce: str,
+        channel: str,
+        nodes: List[str],
+        batches: List[List[str]] = None,
+        phase: str = "",
+        deadline: int = 0,
+    ) -> None:
+        """Set upgrade info in app data.
+
+        Nodes of the first of the batches upgrade concurrently. Without
+        batches, nodes upgrade one at a time in order. In the "prefetch"
+        phase, nodes only stage the snap revision they upgrade to, until the
+        deadline in seconds since the epoch. In the "leader" phase, the nodes
+        wait for the leader to upgrade itself.
+        """
+        info = {
+            "nonce": nonce,
+            "nodes": nodes,
+            "channel": channel,
+        }
+        if batches is not None:
+            info["batches"] = batches
+        if phase:
+            info["phase"] = phase
+        if deadline:
+            info["prefetch-deadline"] = deadline
+        self.set_app_data({"upgrade-info": json.dumps(info)})
 
     def get_upgrade_info(self) -> Dict:
         """Get upgrade info from app data."""
@@ -229,6 +270,14 @@ class MicroClusterPeers(OperatorPeers):
         """Handle upgrade request on the leader unit."""
         logger.debug(f"_handle_upgrade: {event}")
 
+        phase = upgrade_info.get("phase")
+        if phase == "prefetch":
+            self._handle_prefetch_leader(event.relation, upgrade_info)
+            return
+        if phase:
+            logger.debug(f"Upgrade in {phase} phase, no node to track")
+            return
+
         # Check for upgrade done events
         if not event.unit:
             return
@@ -252,14 +301,52 @@ class MicroClusterPeers(OperatorPeers):
         except ValueError:
             logger.warning(f"upgrade done: {event.unit.name} not in upgrade list")
             return
+        batches = upgrade_info.get("batches")
+        if batches is not None:
+            # Drop the node from its batch, the next batch starts once the
+            # current one is done.
+            batches = [[n for n in batch if n != event.unit.name] for batch in batches]
+            batches = [batch for batch in batches if batch]
         if nodes:
             # Still nodes left to upgrade, set remaining nodes in app data
             logger.debug(f"set_upgrade_info for: {nodes}")
-            self.set_upgrade_info(nonce, upgrade_info["channel"], nodes)
+            self.set_upgrade_info(nonce, upgrade_info["channel"], nodes, batches)
         else:
             logger.debug(f"no more nodes for {nonce}, clear_upgrade_info")
             self.clear_upgrade_info()
 
+    def check_prefetch(self, relation: ops.model.Relation) -> None:
+        """Start the upgrade if its prefetch is done or timed out, on the leader."""
+        upgrade_info = self.get_upgrade_info()
+        if self.model.unit.is_leader() and upgrade_info.get("phase") == "prefetch":
+            self._handle_prefetch_leader(relation, upgrade_info)
+
+    def _handle_prefetch_leader(self, relation: ops.model.Relation, upgrade_info: Dict) -> None:
+        """Start the upgrade once every node staged the snap revision.
+
+        Once the prefetch deadline passed, the upgrade starts regardless and
+        the nodes which did not stage the snap download it when upgrading.
+        """
+        units = {unit.name: unit for unit in relation.units}
+        pending = [
+            node
+            for node in upgrade_info["nodes"]
+            if node in units
+            and relation.data[units[node]].get("upgrade-prefetched") != upgrade_info["nonce"]
+        ]
+        deadline = upgrade_info.get("prefetch-deadline")
+        if pending and (deadline is None or time.time() < deadline):
+            logger.debug(f"Waiting for prefetch on {pending}")
+            return
+        if pending:
+            logger.warning(f"Prefetch timed out on {pending}, they download the snap instead")
+        logger.debug(f"Prefetch of {upgrade_info['channel']} done, starting upgrade")
+        self.on.upgrade_start.emit(
+            node=self.model.unit.name,
+            channel=upgrade_info["channel"],
+            nonce=upgrade_info["nonce"],
+        )
+
     def _rel_changed_leader(self, event: EventBase) -> None:
         """Handle relation changed event for leader unit."""
         upgrade_info = self.get_upgrade_info()
@@ -293,11 +380,33 @@ class MicroClusterPeers(OperatorPeers):
         nodes = upgrade_info.get("nodes")
         if not nodes:  # no nodes to upgrade
             return
+        unit = self.model.unit.name
+        if upgrade_info.get("phase") == "prefetch":
+            prefetched = event.relation.data[self.model.unit].get("upgrade-prefetched")
+            if unit in nodes and prefetched != upgrade_info["nonce"]:
+                logger.debug(f"emit upgrade prefetch event for {unit}")
+                self.on.upgrade_prefetch.emit(
+                    node=unit,
+                    channel=upgrade_info["channel"],
+                    nonce=upgrade_info["nonce"],
+                )
+            return
+        if upgrade_info.get("phase"):
+            logger.debug(f"upgrade nonldr: waiting for the {upgrade_info['phase']} phase")
+            return
+        batches = upgrade_info.get("batches")
+        if batches:
+            # are we in the current batch, and not done yet?
+            if unit not in batches[0]:
+                logger.debug(f"upgrade nonldr: {unit} not in {batches[0]}")
+                return
+            if event.relation.data[self.model.unit].get("upgrade-done") == upgrade_info["nonce"]:
+                logger.debug(f"upgrade nonldr: {unit} already upgraded")
+                return
         # are we top of stack?
-        unit = nodes.pop(0)
-        if unit != self.model.unit.name:
+        elif nodes[0] != unit:
             # no, another unit should upgrade
-            logger.debug(f"upgrade nonldr: {unit} != {self.model.unit.name}")
+            logger.debug(f"upgrade nonldr: {nodes[0]} != {unit}")
             return
         logger.debug(f"emit upgrade request event for {unit}")
         self.on.upgrade_request.emit(
@@ -377,6 +486,8 @@ class MicroClusterPeerHandler(BasePeerHandler):
         self.framework.observe(peer_int.on.remove_node, self._on_remove_node)
         self.framework.observe(peer_int.on.upgrade_request, self._on_upgrade_request)
         self.framework.observe(peer_int.on.upgrade_done, self._on_upgrade_done)
+        self.framework.observe(peer_int.on.upgrade_prefetch, self._on_upgrade_request)
+        self.framework.observe(peer_int.on.upgrade_start, self._on_upgrade_request)
 
         return peer_int
 
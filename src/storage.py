@@ -16,8 +16,14 @@
 
 """Handle Charm's Storage Events."""
 
+import contextlib
+import itertools
 import json
 import logging
+import queue
+import statistics
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from dataclasses import asdict
 from subprocess import CalledProcessError, TimeoutExpired, run
 from types import SimpleNamespace
@@ -26,15 +32,161 @@ import ops_sunbeam.compound_status as compound_status
 import ops_sunbeam.guard as sunbeam_guard
 from ops.charm import ActionEvent, CharmBase, StorageAttachedEvent, StorageDetachingEvent
 from ops.framework import Object, StoredState
-from ops.model import ActiveStatus, MaintenanceStatus
+from ops.model import ActiveStatus, MaintenanceStatus, WaitingStatus
 from tenacity import retry, stop_after_attempt, wait_fixed
 
+import ceph
+import device_inventory
 import microceph
 import utils
 from device_flags import DeviceAddFlags, parse_device_add_flags
 
 logger = logging.getLogger(__name__)
 
+MiB = 1024**2
+GiB = 1024**3
+
+# Relative throughput of the device classes, fastest last.
+_DEVICE_CLASS_RANK = {"hdd": 0, "ssd": 1, "nvme": 2}
+
+# Maximum number of OSDs sharing one fast device for their WAL/DB, keyed by
+# (fast device class, OSD device class).
+WALDB_MAX_OSDS_PER_DEVICE = {("nvme", "hdd"): 6, ("nvme", "ssd"): 4, ("ssd", "hdd"): 4}
+
+# Seconds between checks of the PG states while OSDs are drained.
+DRAIN_POLL_INTERVAL = 30
+
+# BlueStore DB size as a fraction of the OSD capacity. Sized so RocksDB does
+# not spill over onto the slow device.
+DEFAULT_DB_RATIO = 0.04
+
+
+def device_class(device: dict) -> str:
+    """Classify an lsblk device as nvme, ssd or hdd."""
+    name = device.get("kname") or device.get("name") or ""
+    if device.get("tran") == "nvme" or name.startswith("nvme"):
+        return "nvme"
+    # lsblk reports rota as a boolean, or as "0"/"1" on older versions.
+    return "hdd" if device.get("rota") in (True, 1, "1") else "ssd"
+
+
+def plan_waldb_placement(
+    osd_devices: list, fast_devices: list, db_ratio: float = DEFAULT_DB_RATIO
+) -> dict:
+    """Assign OSD devices to the fast devices carrying their WAL/DB.
+
+    Only faster devices can carry an OSD's WAL/DB, and each fast device takes
+    at most ``WALDB_MAX_OSDS_PER_DEVICE`` OSDs. Largest OSDs are placed first,
+    each on the least loaded eligible fast device (fastest class, then most
+    free capacity, on ties). Every OSD sharing a fast device gets the DB size
+    required by the largest of them, and OSDs that fit nowhere are left
+    unplaced rather than risking DB spillover.
+
+    Args:
+        osd_devices: lsblk entries of the devices to enroll as OSDs.
+        fast_devices: lsblk entries of the devices to carry WAL/DB.
+        db_ratio: DB size as a fraction of the OSD capacity.
+
+    Returns:
+        A dict with the ``fast-devices`` assignment and the ``unplaced`` OSD
+        device paths.
+    """
+    slots = [
+        {
+            "device": dev["path"],
+            "class": device_class(dev),
+            "capacity": int(dev.get("size") or 0),
+            "db-size": 0,
+            "osds": [],
+        }
+        for dev in fast_devices
+    ]
+    unplaced = []
+
+    for osd in sorted(osd_devices, key=lambda d: int(d.get("size") or 0), reverse=True):
+        osd_class = device_class(osd)
+        required = max(int(int(osd.get("size") or 0) * db_ratio), GiB)
+        eligible = [
+            slot
+            for slot in slots
+            if len(slot["osds"]) < WALDB_MAX_OSDS_PER_DEVICE.get((slot["class"], osd_class), 0)
+            and (len(slot["osds"]) + 1) * max(slot["db-size"], required) <= slot["capacity"]
+        ]
+        if not eligible:
+            unplaced.append(osd["path"])
+            continue
+
+        slot = min(
+            eligible,
+            key=lambda s: (
+                len(s["osds"]) / WALDB_MAX_OSDS_PER_DEVICE[(s["class"], osd_class)],
+                -_DEVICE_CLASS_RANK[s["class"]],
+                -(s["capacity"] - len(s["osds"]) * s["db-size"]),
+            ),
+        )
+        slot["db-size"] = max(slot["db-size"], required)
+        slot["osds"].append(osd["path"])
+
+    for slot in slots:
+        slot["db-size"] = f"{slot['db-size'] // GiB}GiB"
+        del slot["capacity"]
+
+    return {"fast-devices": [s for s in slots if s["osds"]], "unplaced": unplaced}
+
+
+def summarize_osd_bench(results: list, mad_threshold: float) -> dict:
+    """Aggregate OSD benchmarks per device class and host, flagging slow OSDs.
+
+    An OSD is a suspected slow disk when its throughput is more than
+    ``mad_threshold`` median absolute deviations (MAD) below the median of its
+    device class. Classes whose OSDs all perform alike (a MAD of 0) have no
+    outliers.
+
+    Args:
+        results: successful benchmarks, dicts with ``osd``, ``host``,
+            ``device-class``, ``iops`` and ``mib-per-sec``.
+        mad_threshold: number of MADs below the class median an OSD must be.
+
+    Returns:
+        A dict with the ``device-classes`` and ``hosts`` aggregates and the
+        sorted ids of the ``slow-osds``.
+    """
+    classes, slow = [], []
+    for name, group in _group_bench(results, "device-class"):
+        rates = [r["mib-per-sec"] for r in group]
+        median = statistics.median(rates)
+        mad = statistics.median(abs(rate - median) for rate in rates)
+        slow += [r["osd"] for r in group if r["mib-per-sec"] < median - mad_threshold * mad]
+        classes.append(
+            {"device-class": name, **_bench_aggregate(group), "mad-mib-per-sec": round(mad, 1)}
+        )
+
+    hosts = [
+        {"host": name, **_bench_aggregate(group)} for name, group in _group_bench(results, "host")
+    ]
+    return {"device-classes": classes, "hosts": hosts, "slow-osds": sorted(slow)}
+
+
+def _group_bench(results: list, key: str) -> list:
+    results = sorted(results, key=lambda r: r[key])
+    return [(name, list(group)) for name, group in itertools.groupby(results, lambda r: r[key])]
+
+
+def _bench_aggregate(results: list) -> dict:
+    return {
+        "osds": len(results),
+        "median-iops": round(statistics.median(r["iops"] for r in results), 1),
+        "median-mib-per-sec": round(statistics.median(r["mib-per-sec"] for r in results), 1),
+        "total-mib-per-sec": round(sum(r["mib-per-sec"] for r in results), 1),
+    }
+
+
+def devnode_match(paths: list) -> str:
+    """Build an osd-devices style DSL expression matching exactly the given devices."""
+    if len(paths) == 1:
+        return f"eq(@devnode,'{paths[0]}')"
+    return "in(@devnode,{})".format(",".join(f"'{p}'" for p in paths))
+
 
 class StorageHandler(Object):
     """The Storage class manages the storage events.
@@ -44,7 +196,14 @@ class StorageHandler(Object):
     2) *_storage_detaching
     3) add_osd_action
     4) list_disks_action
-    5) config_changed (for osd-devices processing)
+    5) plan_wal_db_action
+    6) decommission_osds_action
+    7) replace_osd_action
+    8) config_changed (for osd-devices processing)
+    9) update_status (for hot-plugged osd-devices)
+    10) osd_admission admitted (for throttled osd-devices enrollment)
+    11) update_status (for the CRUSH weight ramp of new OSDs)
+    12) benchmark_osds_action
     """
 
     name = "storage"
@@ -56,6 +215,19 @@ class StorageHandler(Object):
     # _stored: per unit stored state for storage class. Contains:
     #  osd_data: dict of dicts with int (osd num) key
     #    disk: OSD disk storage name (unique)
+    #    replacing: set when the OSD was destroyed to replace its disk
+    #    weight: CRUSH weight of a destroyed OSD, for its replacement
+    #    replaced_by: id of the new OSD taking over a destroyed one, until
+    #      the destroyed OSD was purged
+    #  drained_osd_weights: CRUSH weight of OSDs being decommissioned, keyed
+    #    by int (osd num), restored if the decommission is cancelled.
+    #  ramp_osd_weights: target CRUSH weight of new OSDs whose weight is
+    #    ramped up, keyed by int (osd num).
+    #  ramp_last_step: time of the last weight ramp step.
+    #  last_osd_bench: iops and mib-per-sec of the last benchmark-osds run,
+    #    keyed by str (osd num), to report deltas on the next run.
+    #  pending_osd_enroll: JSON of the osd-devices request and expected
+    #    device count waiting for admission to an enrollment wave.
     _stored = StoredState()
 
     def __init__(self, charm: CharmBase, name="storage"):
@@ -66,13 +238,24 @@ class StorageHandler(Object):
             last_wipe_osd=False,
             last_encrypt_osd=False,
             last_storage_config_signature="",
+            last_inventory_fingerprint="",
+            dm_crypt_ready_key="",
+            drained_osd_weights={},
+            ramp_osd_weights={},
+            ramp_last_step=0.0,
+            last_osd_bench={},
+            pending_osd_enroll="",
         )
         self.charm = charm
         self.name = name
+        # dm-crypt setup is skipped for the snap revision and boot it was done for.
+        microceph.set_dm_crypt_ready_key(self._stored.dm_crypt_ready_key)
         self.storage_status = compound_status.Status(self.name)
         self.storage_config_status = compound_status.Status(f"{self.name}-config")
+        self.ramp_status = compound_status.Status(f"{self.name}-ramp")
         self.charm.status_pool.add(self.storage_status)
         self.charm.status_pool.add(self.storage_config_status)
+        self.charm.status_pool.add(self.ramp_status)
         self._storage_guard = SimpleNamespace(status=self.storage_status)
         self._storage_config_guard = SimpleNamespace(status=self.storage_config_status)
 
@@ -90,9 +273,21 @@ class StorageHandler(Object):
 
         self.framework.observe(charm.on.add_osd_action, self._add_osd_action)
         self.framework.observe(charm.on.list_disks_action, self._list_disks_action)
+        self.framework.observe(charm.on.plan_wal_db_action, self._plan_wal_db_action)
+        self.framework.observe(charm.on.decommission_osds_action, self._decommission_osds_action)
+        self.framework.observe(charm.on.replace_osd_action, self._replace_osd_action)
+        self.framework.observe(charm.on.benchmark_osds_action, self._benchmark_osds_action)
 
         # Observe config-changed for osd-devices processing
         self.framework.observe(charm.on.config_changed, self._on_config_changed_osd_devices)
+        # Pick up hot-plugged disks matching osd-devices
+        self.framework.observe(charm.on.update_status, self._on_update_status_hotplug)
+        # Step up the CRUSH weight of new OSDs
+        self.framework.observe(charm.on.update_status, self._on_update_status_ramp)
+        # Resume interrupted OSD replacements
+        self.framework.observe(charm.on.update_status, self._on_update_status_replacements)
+        # Enroll osd-devices once admitted to an enrollment wave
+        self.framework.observe(charm.osd_admission.on.admitted, self._on_osd_enroll_admitted)
 
     # storage event handlers
 
@@ -117,7 +312,11 @@ class StorageHandler(Object):
         logger.debug(f"Enroll list {enroll}")
         with sunbeam_guard.guard(self._storage_guard, self.name):
             self.storage_status.set(MaintenanceStatus("Enrolling OSDs"))
-            self._enroll_disks_in_batch(enroll)
+            if enroll and self._pending_replacements():
+                self._enroll_replacements(enroll)
+            else:
+                with self._weight_ramp():
+                    self._enroll_disks_in_batch(enroll)
             self.storage_status.set(ActiveStatus(""))
             self._restore_ready_workload_status()
 
@@ -140,6 +339,13 @@ class StorageHandler(Object):
             logger.info("Application is being removed; skipping OSD removal for osd.%s", osd_num)
             return
 
+        entry = dict(self._stored.osd_data.get(osd_num) or {})
+        if entry.get("replacing"):
+            # Keep the destroyed OSD in CRUSH for the disk replacing it.
+            logger.info("Keeping destroyed osd.%s for its replacement disk", osd_num)
+            self._stored.osd_data[osd_num] = {**entry, "disk": None}
+            return
+
         with sunbeam_guard.guard(self._storage_guard, self.name):
             try:
                 self.remove_osd(osd_num)
@@ -207,13 +413,66 @@ class StorageHandler(Object):
         # fetch requested wipe flag.
         wipe = event.params.get("wipe", False)
         encrypt = event.params.get("encrypt", False)
+        parallelism = max(1, int(event.params.get("parallelism", 1)))
+        norebalance = event.params.get("norebalance", False)
 
-        error = False
-        result = {"result": []}
-        for spec in add_osd_specs:
+        if encrypt and not self._prepare_dm_crypt(event, add_osd_specs):
+            return
+
+        flags = ["norebalance"] if norebalance else []
+        try:
+            with ceph.osd_flags(*flags), self._weight_ramp():
+                results = self._enroll_osd_specs(event, add_osd_specs, wipe, encrypt, parallelism)
+        except CalledProcessError as e:
+            err_msg = self._error_message(e)
+            logger.error("Failed to set osd flags %s for add-osd: %s", flags, err_msg)
+            event.set_results({"message": err_msg})
+            event.fail()
+            return
+
+        event.set_results({"result": results})
+        failed = any(result["status"] == "failure" for result in results)
+        if encrypt:
+            self._record_dm_crypt_readiness(success=not failed)
+        if failed:
+            event.fail()
+
+    def _prepare_dm_crypt(self, event: ActionEvent, specs: list) -> bool:
+        """Prepare dm-crypt once up front, failing the action if that is not possible.
+
+        Doing it before any OSD is added means concurrent adds never race on
+        connecting the plug and restarting the daemon.
+        """
+        try:
+            microceph.prepare_dm_crypt()
+        except (CalledProcessError, TimeoutExpired, ValueError) as e:
+            err_msg = self._error_message(e)
+            logger.error("Failed to prepare dm-crypt for add-osd: %s", err_msg)
+            results = [{"spec": spec, "status": "failure", "message": err_msg} for spec in specs]
+            event.set_results({"result": results})
+            event.fail()
+            return False
+        return True
+
+    def _enroll_osd_specs(
+        self, event: ActionEvent, specs: list, wipe: bool, encrypt: bool, parallelism: int
+    ) -> list:
+        """Add the OSD specs concurrently, reporting progress on the action.
+
+        Returns one result per spec, in the order the specs were given.
+        """
+        lines = queue.SimpleQueue()
+
+        def add(spec: str) -> dict:
+            start = time.monotonic()
             try:
-                microceph.add_osd_cmd(spec, wipe=wipe, encrypt=encrypt)
-                result["result"].append({"spec": spec, "status": "success"})
+                microceph.add_osd_cmd(
+                    spec,
+                    wipe=wipe,
+                    encrypt=encrypt,
+                    on_line=lambda line: lines.put(f"{spec}: {line}"),
+                )
+                result = {"spec": spec, "status": "success"}
             except (CalledProcessError, TimeoutExpired, ValueError) as e:
                 err_msg = self._error_message(e)
                 logger.error(
@@ -223,12 +482,293 @@ class StorageHandler(Object):
                     encrypt,
                     err_msg,
                 )
-                result["result"].append({"spec": spec, "status": "failure", "message": err_msg})
-                error = True
+                result = {"spec": spec, "status": "failure", "message": err_msg}
+            result["duration"] = round(time.monotonic() - start, 1)
+            return result
+
+        if not specs:
+            return []
+
+        results = [None] * len(specs)
+        with ThreadPoolExecutor(max_workers=min(parallelism, len(specs))) as executor:
+            futures = {executor.submit(add, spec): idx for idx, spec in enumerate(specs)}
+            pending, done = set(futures), 0
+            # Action logs are only emitted from this thread, the workers queue
+            # the disk add output lines as they are printed.
+            while pending:
+                finished, pending = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+                while not lines.empty():
+                    event.log(lines.get())
+                for future in sorted(finished, key=futures.get):
+                    done += 1
+                    result = future.result()
+                    results[futures[future]] = result
+                    event.log(
+                        f"Enrolled {done}/{len(specs)}: {result['spec']} "
+                        f"({result['status']}, {result['duration']}s)"
+                    )
 
-        event.set_results(result)
-        if error:
+        return results
+
+    def _decommission_osds_action(self, event: ActionEvent):
+        """Drain a set of OSDs together, then remove them once the data moved off.
+
+        All OSDs are reweighted to 0 at once, so their data moves exactly once
+        instead of backfilling onto OSDs which are removed next.
+        """
+        if not self.charm.peers.interface.state.joined:
+            event.set_results({"message": "Node not yet joined in microceph cluster"})
+            event.fail()
+            return
+
+        try:
+            osd_ids = self._local_osd_ids(event.params["osd-ids"])
+        except (CalledProcessError, TimeoutExpired, ValueError) as e:
+            event.set_results({"message": self._error_message(e)})
             event.fail()
+            return
+
+        if event.params.get("cancel", False):
+            self._restore_drained_osds(event, osd_ids)
+            return
+
+        try:
+            self._drain_osds(osd_ids)
+            drained = self._wait_for_drain(event, osd_ids, event.params.get("timeout", 3600))
+        except (CalledProcessError, TimeoutExpired, ValueError) as e:
+            err_msg = self._error_message(e)
+            logger.error("Failed to drain OSDs %s: %s", sorted(osd_ids), err_msg)
+            event.set_results({"message": err_msg})
+            event.fail()
+            return
+
+        if not drained:
+            event.set_results(
+                {
+                    "message": "Timed out waiting for the OSDs to drain. Run the action again "
+                    "to keep waiting, or with cancel=true to restore their weights."
+                }
+            )
+            event.fail()
+            return
+
+        results = self._remove_drained_osds(osd_ids)
+        event.set_results({"result": results})
+        if any(result["status"] == "failure" for result in results):
+            event.fail()
+
+    def _local_osd_ids(self, param: str) -> set:
+        """Parse comma separated OSD ids, which must all be OSDs of this unit."""
+        try:
+            osd_ids = {int(osd_id) for osd_id in utils.split_space_or_comma(param)}
+        except ValueError:
+            raise ValueError(f"Invalid osd-ids {param!r}, expected e.g. 3,4,7")
+        if not osd_ids:
+            raise ValueError("No OSD ids given")
+
+        foreign = osd_ids - self._local_osds()
+        if foreign:
+            raise ValueError(f"OSDs {sorted(foreign)} are not on this unit")
+        return osd_ids
+
+    def _local_osds(self) -> set:
+        """Return the ids of the OSDs of this unit."""
+        return {osd["osd"] for osd in microceph.list_disk_cmd(host_only=True)["ConfiguredDisks"]}
+
+    def _drain_osds(self, osd_ids: set):
+        """Record the CRUSH weights of the OSDs, then reweight them all to 0.
+
+        The reweights are done under norebalance, so data movement is computed
+        once, against the final CRUSH map.
+        """
+        for osd_id in sorted(osd_ids):
+            if osd_id in self._stored.drained_osd_weights:
+                # Already draining, keep the weight from before the drain.
+                continue
+            weight = ceph.get_osd_weight(f"osd.{osd_id}")
+            if weight is None:
+                raise ValueError(f"osd.{osd_id} not found in the CRUSH map")
+            self._stored.drained_osd_weights[osd_id] = weight
+            # A drained OSD is not ramped up any further.
+            self._stored.ramp_osd_weights.pop(osd_id, None)
+
+        with ceph.osd_flags("norebalance"):
+            for osd_id in sorted(osd_ids):
+                ceph.set_osd_crush_weight(osd_id, 0)
+
+    def _wait_for_drain(self, event: ActionEvent, osd_ids: set, timeout: int) -> bool:
+        """Wait until the OSDs hold no PGs and all PGs are active+clean."""
+        deadline = time.monotonic() + timeout
+        while True:
+            pg_counts = ceph.get_osd_pg_counts()
+            remaining = sum(pg_counts.get(osd_id, 0) for osd_id in osd_ids)
+            clean, total = ceph.get_pg_state_counts()
+            event.log(f"{remaining} PGs left on the OSDs, {clean}/{total} PGs active+clean")
+            if remaining == 0 and clean == total:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(DRAIN_POLL_INTERVAL)
+
+    def _remove_drained_osds(self, osd_ids: set) -> list:
+        """Remove the drained OSDs in one pass, returning one result per OSD."""
+        results = []
+        for osd_id in sorted(osd_ids):
+            try:
+                self.remove_osd(osd_id)
+                self._stored.drained_osd_weights.pop(osd_id, None)
+                results.append({"osd": osd_id, "status": "success"})
+            except (CalledProcessError, TimeoutExpired) as e:
+                err_msg = self._error_message(e)
+                logger.error("Failed to remove drained osd.%s: %s", osd_id, err_msg)
+                results.append({"osd": osd_id, "status": "failure", "message": err_msg})
+        return results
+
+    def _restore_drained_osds(self, event: ActionEvent, osd_ids: set):
+        """Restore the CRUSH weights the OSDs had before they were drained."""
+        restored = []
+        for osd_id in sorted(osd_ids):
+            weight = self._stored.drained_osd_weights.get(osd_id)
+            if weight is None:
+                continue
+            try:
+                ceph.set_osd_crush_weight(osd_id, weight)
+            except (CalledProcessError, TimeoutExpired) as e:
+                event.set_results({"message": self._error_message(e), "restored": restored})
+                event.fail()
+                return
+            self._stored.drained_osd_weights.pop(osd_id)
+            restored.append(osd_id)
+
+        event.set_results({"restored": restored})
+
+    def _replace_osd_action(self, event: ActionEvent):
+        """Destroy a failed OSD, keeping it in CRUSH until a replacement disk is added.
+
+        The next disk attached as osd-standalone storage becomes a new OSD with
+        the destroyed OSD's CRUSH weight, and the destroyed OSD is then purged.
+        This is a remove plus an add done at once under norebalance: the new
+        OSD gets a new id, so about as much data moves as when removing the
+        OSD and adding the disk separately, but the PGs are remapped once.
+        """
+        if not self.charm.peers.interface.state.joined:
+            event.set_results({"message": "Node not yet joined in microceph cluster"})
+            event.fail()
+            return
+
+        osd_id = event.params["osd-id"]
+        entry = dict(self._stored.osd_data.get(osd_id) or {})
+        if "replaced_by" in entry:
+            event.set_results(
+                {"message": f"osd.{osd_id} is already replaced by osd.{entry['replaced_by']}"}
+            )
+            event.fail()
+            return
+
+        try:
+            self._local_osd_ids(str(osd_id))
+            weight = ceph.get_osd_weight(f"osd.{osd_id}")
+            if weight is None:
+                raise ValueError(f"osd.{osd_id} not found in the CRUSH map")
+            ceph.destroy_osd(osd_id)
+        except (CalledProcessError, TimeoutExpired, ValueError) as e:
+            err_msg = self._error_message(e)
+            logger.error("Failed to destroy osd.%s for replacement: %s", osd_id, err_msg)
+            event.set_results({"message": err_msg})
+            event.fail()
+            return
+
+        self._stored.osd_data[osd_id] = {
+            "disk": entry.get("disk"),
+            "replacing": True,
+            "weight": weight,
+        }
+        logger.info("Destroyed osd.%s (weight %s) for replacement", osd_id, weight)
+        event.set_results(
+            {
+                "message": f"osd.{osd_id} destroyed, attach a replacement disk as "
+                f"{self.standalone} storage",
+                "storage": entry.get("disk") or "",
+            }
+        )
+
+    def _benchmark_osds_action(self, event: ActionEvent):
+        """Benchmark OSDs concurrently and flag the ones slower than their peers."""
+        if not self.charm.peers.interface.state.joined:
+            event.set_results({"message": "Node not yet joined in microceph cluster"})
+            event.fail()
+            return
+
+        host = event.params.get("host", "")
+        try:
+            locations = ceph.get_osd_locations()
+            osd_ids = [osd for osd in ceph.get_osds("admin") if osd in locations]
+        except (CalledProcessError, TimeoutExpired, ValueError) as e:
+            event.set_results({"message": self._error_message(e)})
+            event.fail()
+            return
+
+        if host:
+            osd_ids = [osd for osd in osd_ids if locations[osd]["host"] == host]
+        if not osd_ids:
+            event.set_results({"message": f"No OSDs to benchmark{f' on {host}' if host else ''}"})
+            event.fail()
+            return
+
+        results = self._bench_osds(event, osd_ids, locations)
+        benched = [r for r in results if r["status"] == "success"]
+        summary = summarize_osd_bench(benched, event.params["mad-threshold"])
+        self._record_osd_bench(benched, set(summary["slow-osds"]))
+
+        event.set_results({"osds": results, **summary})
+        if len(benched) < len(results):
+            event.fail()
+
+    def _bench_osds(self, event: ActionEvent, osd_ids: list, locations: dict) -> list:
+        """Run the OSD benchmarks with a bounded fan-out, one result per OSD."""
+        total_bytes = event.params["total-bytes"]
+        block_size = event.params["block-size"]
+
+        def bench(osd_id: int) -> dict:
+            result = {"osd": osd_id, **locations[osd_id]}
+            try:
+                out = ceph.osd_bench(osd_id, total_bytes, block_size)
+            except (CalledProcessError, TimeoutExpired, ValueError) as e:
+                result.update(status="failure", message=self._error_message(e))
+                return result
+            result.update(
+                {
+                    "status": "success",
+                    "iops": round(out["iops"], 1),
+                    "mib-per-sec": round(out["bytes_per_sec"] / MiB, 1),
+                }
+            )
+            return result
+
+        results = []
+        parallelism = min(event.params["parallelism"], len(osd_ids))
+        with ThreadPoolExecutor(max_workers=parallelism) as executor:
+            futures = [executor.submit(bench, osd_id) for osd_id in osd_ids]
+            # Action logs are only emitted from this thread, as results arrive.
+            for done, future in enumerate(as_completed(futures), start=1):
+                result = future.result()
+                results.append(result)
+                event.log(f"Benchmarked {done}/{len(osd_ids)}: osd.{result['osd']}")
+
+        return sorted(results, key=lambda r: r["osd"])
+
+    def _record_osd_bench(self, results: list, slow: set):
+        """Add deltas against the previous run to the results and store this run."""
+        previous = self._stored.last_osd_bench
+        for result in results:
+            result["slow"] = result["osd"] in slow
+            key = str(result["osd"])
+            if key in previous:
+                result["iops-delta"] = round(result["iops"] - previous[key]["iops"], 1)
+                result["mib-per-sec-delta"] = round(
+                    result["mib-per-sec"] - previous[key]["mib-per-sec"], 1
+                )
+            previous[key] = {"iops": result["iops"], "mib-per-sec": result["mib-per-sec"]}
 
     def _list_disks_action(self, event: ActionEvent):
         """List enrolled and unconfigured disks."""
@@ -253,6 +793,99 @@ class StorageHandler(Object):
         # result should conform to previous expectations.
         event.set_results({"osds": osds, "unpartitioned-disks": available_disks})
 
+    def _plan_wal_db_action(self, event: ActionEvent):
+        """Plan, and optionally apply, WAL/DB placement for new OSDs."""
+        if not self.charm.peers.interface.state.joined:
+            event.set_results({"message": "Node not yet joined in microceph cluster"})
+            event.fail()
+            return
+
+        try:
+            osd_devices, fast_devices = self._waldb_candidates(
+                event.params.get("osd-devices"), event.params.get("fast-devices")
+            )
+        except ValueError as e:
+            event.set_results({"message": str(e)})
+            event.fail()
+            return
+
+        plan = plan_waldb_placement(
+            osd_devices, fast_devices, event.params.get("db-ratio", DEFAULT_DB_RATIO)
+        )
+        if not event.params.get("apply", False):
+            event.set_results(plan)
+            return
+
+        with self._weight_ramp():
+            error = self._apply_waldb_plan(plan, event.params.get("wipe", False))
+
+        event.set_results(plan)
+        if error:
+            event.fail()
+
+    def _apply_waldb_plan(self, plan: dict, wipe: bool) -> bool:
+        """Enroll the OSDs of a WAL/DB plan, recording each slot's outcome.
+
+        Returns:
+            True if any slot failed to apply.
+        """
+        error = False
+        for slot in plan["fast-devices"]:
+            try:
+                microceph.add_disk_match_cmd(
+                    osd_match=devnode_match(slot["osds"]),
+                    db_match=devnode_match([slot["device"]]),
+                    db_size=slot["db-size"],
+                    wipe=wipe,
+                    db_wipe=wipe,
+                )
+                slot["status"] = "success"
+            except (CalledProcessError, TimeoutExpired) as e:
+                err_msg = self._error_message(e)
+                logger.error("Failed to apply WAL/DB plan for %s: %s", slot["device"], err_msg)
+                slot["status"] = "failure"
+                slot["message"] = err_msg
+                error = True
+        return error
+
+    def _waldb_candidates(self, osd_paths: str, fast_paths: str) -> tuple:
+        """Resolve the OSD and fast devices for WAL/DB planning.
+
+        Devices not given explicitly default to the host's enrollable disks:
+        the fastest class present carries WAL/DB for the slower ones.
+
+        Raises:
+            ValueError: if a requested device is not a block device.
+        """
+        inventory = device_inventory.get_inventory()
+
+        def resolve(paths: str) -> list:
+            devices = []
+            for path in utils.split_space_or_comma(paths):
+                device = inventory.get(path)
+                if not device:
+                    raise ValueError(f"{path} is not a block device")
+                devices.append(device)
+            return devices
+
+        if osd_paths and fast_paths:
+            return resolve(osd_paths), resolve(fast_paths)
+
+        available = [
+            d for d in inventory.disks() if microceph._is_block_device_enrollable(d["path"])
+        ]
+        fastest = max((_DEVICE_CLASS_RANK[device_class(d)] for d in available), default=0)
+        fast_devices = (
+            resolve(fast_paths)
+            if fast_paths
+            else [d for d in available if _DEVICE_CLASS_RANK[device_class(d)] == fastest]
+        )
+        fast = {d["path"] for d in fast_devices}
+        osd_devices = (
+            resolve(osd_paths) if osd_paths else [d for d in available if d["path"] not in fast]
+        )
+        return osd_devices, fast_devices
+
     def _on_config_changed_osd_devices(self, event):
         """Process config-driven storage requests for OSD/WAL/DB matching."""
         with sunbeam_guard.guard(self._storage_config_guard, f"{self.name}-config"):
@@ -301,6 +934,225 @@ class StorageHandler(Object):
 
             self._apply_osd_config(storage_request)
 
+    def _on_update_status_hotplug(self, event):
+        """Enroll hot-plugged disks matching the already applied osd-devices config."""
+        if utils.is_departing(self.charm.app):
+            return
+
+        if not self._stored.last_storage_config_signature and not self._stored.last_osd_devices:
+            # No config-driven enrollment was applied yet.
+            return
+
+        fingerprint = device_inventory.fingerprint()
+        if fingerprint == self._stored.last_inventory_fingerprint:
+            return
+
+        if not self.charm.ready_for_service():
+            logger.debug("MicroCeph not ready yet, skipping hot-plug storage check")
+            return
+
+        if self._stored.pending_osd_enroll:
+            if self.charm.osd_admission.enabled:
+                logger.debug("OSD enrollment waiting for admission, skipping hot-plug check")
+                return
+            # Enrollment is no longer throttled, match the inventory afresh.
+            self._stored.pending_osd_enroll = ""
+
+        with sunbeam_guard.guard(self._storage_config_guard, f"{self.name}-config"):
+            storage_request = self._normalize_storage_config()
+            if not storage_request["osd_match"] or not self._is_cached_osd_config(storage_request):
+                # A config change is pending, config-changed handles it.
+                return
+
+            self._validate_storage_config(storage_request)
+            self._enroll_hotplugged_devices(storage_request, fingerprint)
+
+    def _enroll_hotplugged_devices(self, storage_request: dict, fingerprint: str):
+        """Dry-run the osd-devices match and only enroll when new devices match.
+
+        MicroCeph never matches disks which are already in use, so a match
+        against the current inventory only yields the newly attached disks.
+        """
+        logger.info("Block device inventory changed, checking for new osd-devices matches")
+        try:
+            output = microceph.add_disk_match_cmd(
+                **self._disk_match_args(storage_request), dry_run=True
+            )
+        except (CalledProcessError, TimeoutExpired) as e:
+            err_msg = self._error_message(e)
+            if "no devices matched" not in err_msg.lower():
+                # Retry on the next update-status.
+                logger.warning("Dry-run of osd-devices match failed: %s", err_msg)
+                return
+            output = ""
+
+        matched = microceph.disk_add_data_devices(output)
+        if not matched:
+            logger.debug("No new devices match osd-devices")
+            self._stored.last_inventory_fingerprint = fingerprint
+            return
+
+        logger.info("Enrolling hot-plugged devices matching osd-devices: %s", matched)
+        self._apply_osd_config(storage_request, expected=len(matched))
+
+    def _ramp_step(self) -> float:
+        """Return the fraction of the target weight added per ramp step, 0 if disabled."""
+        step = float(self.charm.model.config.get("osd-weight-ramp-step") or 0)
+        return step if 0 < step < 1 else 0.0
+
+    @contextlib.contextmanager
+    def _weight_ramp(self):
+        """Start OSDs enrolled within the block at a fraction of their CRUSH weight.
+
+        The enrollment runs under norebalance, so no data moves towards the new
+        OSDs before their weight was lowered. Update-status then steps the
+        weights up to their target, see _on_update_status_ramp.
+        """
+        step = self._ramp_step()
+        if not step:
+            yield
+            return
+
+        try:
+            before = self._local_osds()
+        except (CalledProcessError, TimeoutExpired) as e:
+            logger.warning("Not ramping the weight of new OSDs: %s", self._error_message(e))
+            yield
+            return
+
+        with ceph.osd_flags("norebalance"):
+            try:
+                yield
+            finally:
+                # Also ramp the OSDs enrolled before a failure.
+                self._start_weight_ramps(before, step)
+
+    def _start_weight_ramps(self, before: set, step: float):
+        """Lower the CRUSH weight of the OSDs not in before to the first ramp step."""
+        try:
+            for osd_id in sorted(self._local_osds() - before):
+                self._start_weight_ramp(osd_id, step)
+        except (CalledProcessError, TimeoutExpired, ValueError) as e:
+            logger.warning("Failed to lower the weight of new OSDs: %s", e)
+        if self._stored.ramp_osd_weights:
+            self._set_ramp_status(int(100 * step))
+
+    def _start_weight_ramp(self, osd_id: int, step: float):
+        """Lower the CRUSH weight of a new OSD to the first ramp step."""
+        target = ceph.get_osd_weight(f"osd.{osd_id}")
+        if not target:
+            return
+        weight = round(target * step, 5)
+        ceph.set_osd_crush_weight(osd_id, weight)
+        self._stored.ramp_osd_weights[osd_id] = target
+        self._stored.ramp_last_step = time.time()
+        logger.info("Ramping CRUSH weight of osd.%d from %s to %s", osd_id, weight, target)
+
+    def _on_update_status_ramp(self, event):
+        """Step the CRUSH weight of ramping OSDs up towards their target weight."""
+        if not self._stored.ramp_osd_weights or utils.is_departing(self.charm.app):
+            return
+
+        interval = int(self.charm.model.config.get("osd-weight-ramp-interval") or 0)
+        if time.time() - self._stored.ramp_last_step < interval:
+            return
+
+        if not self.charm.ready_for_service():
+            logger.debug("MicroCeph not ready yet, skipping OSD weight ramp")
+            return
+
+        try:
+            misplaced = ceph.get_misplaced_ratio()
+            limit = float(self.charm.model.config.get("osd-weight-ramp-max-misplaced"))
+            if misplaced > limit:
+                self.ramp_status.set(
+                    MaintenanceStatus(f"OSD weight ramp paused: {misplaced:.1%} misplaced")
+                )
+                return
+            progress = self._step_weight_ramp()
+        except (CalledProcessError, TimeoutExpired, ValueError) as e:
+            # Retry on the next update-status.
+            logger.warning("OSD weight ramp step failed: %s", e)
+            return
+        self._set_ramp_status(progress)
+
+    def _step_weight_ramp(self) -> int:
+        """Add one step to the weight of every ramping OSD.
+
+        Returns:
+            The progress of the ramp in percent.
+        """
+        # Disabling the ramp midway finishes it in one step.
+        step = self._ramp_step() or 1.0
+        weights = {}
+        for osd_id, target in sorted(dict(self._stored.ramp_osd_weights).items()):
+            current = ceph.get_osd_weight(f"osd.{osd_id}")
+            if current is None:
+                # The OSD was removed meanwhile.
+                self._stored.ramp_osd_weights.pop(osd_id)
+                continue
+            weight = min(target, round(current + target * step, 5))
+            ceph.set_osd_crush_weight(osd_id, weight)
+            weights[osd_id] = (weight, target)
+            if weight >= target:
+                logger.info("osd.%d reached its CRUSH weight %s", osd_id, target)
+                self._stored.ramp_osd_weights.pop(osd_id)
+        self._stored.ramp_last_step = time.time()
+        return self._ramp_progress(weights)
+
+    @staticmethod
+    def _ramp_progress(weights: dict) -> int:
+        """Percentage of the target weight reached, over (weight, target) pairs."""
+        total = sum(target for _, target in weights.values())
+        if not total:
+            return 100
+        return int(100 * sum(weight for weight, _ in weights.values()) / total)
+
+    def _set_ramp_status(self, progress: int):
+        """Show the progress of the OSD weight ramp."""
+        ramping = len(self._stored.ramp_osd_weights)
+        if not ramping:
+            self.ramp_status.set(ActiveStatus(""))
+            return
+        self.ramp_status.set(
+            MaintenanceStatus(f"Ramping CRUSH weight of {ramping} OSDs: {progress}%")
+        )
+
+    def _storage_request_encrypts(self, storage_request: dict) -> bool:
+        """Whether a normalized request encrypts any OSD, WAL or DB device."""
+        flags = storage_request["flags"]
+        return bool(
+            flags["encrypt_osd"]
+            or (storage_request["wal_match"] and flags["encrypt_wal"])
+            or (storage_request["db_match"] and flags["encrypt_db"])
+        )
+
+    def _record_dm_crypt_readiness(self, success: bool):
+        """Persist dm-crypt readiness after an encrypted add.
+
+        After a failure readiness is forgotten, so the next encrypted add
+        checks the dm-crypt setup again.
+        """
+        if not success:
+            microceph.set_dm_crypt_ready_key("")
+        self._stored.dm_crypt_ready_key = microceph.dm_crypt_ready_key()
+
+    def _disk_match_args(self, storage_request: dict) -> dict:
+        """Build the add_disk_match_cmd arguments for a normalized request."""
+        return {
+            "osd_match": storage_request["osd_match"],
+            "wal_match": storage_request["wal_match"],
+            "wal_size": storage_request["wal_size"],
+            "db_match": storage_request["db_match"],
+            "db_size": storage_request["db_size"],
+            "wipe": storage_request["flags"]["wipe_osd"],
+            "encrypt": storage_request["flags"]["encrypt_osd"],
+            "wal_wipe": storage_request["flags"]["wipe_wal"],
+            "wal_encrypt": storage_request["flags"]["encrypt_wal"],
+            "db_wipe": storage_request["flags"]["wipe_db"],
+            "db_encrypt": storage_request["flags"]["encrypt_db"],
+        }
+
     def _normalize_storage_config(self) -> dict:
         """Normalize config-driven storage settings into a stable request dict."""
         raw_config = {
@@ -456,6 +1308,8 @@ class StorageHandler(Object):
         self._stored.last_wipe_osd = False
         self._stored.last_encrypt_osd = False
         self._stored.last_storage_config_signature = ""
+        self._stored.last_inventory_fingerprint = ""
+        self._stored.pending_osd_enroll = ""
         logger.debug("Reset config-driven storage cache")
 
     def _set_osd_config_cache(self, storage_request: dict):
@@ -467,6 +1321,7 @@ class StorageHandler(Object):
         self._stored.last_storage_config_signature = self._storage_config_signature(
             storage_request
         )
+        self._stored.last_inventory_fingerprint = device_inventory.fingerprint()
         logger.debug(
             "Persisted storage config cache cacheable_request=%s signature=%s",
             json.dumps(cacheable_request, sort_keys=True),
@@ -581,7 +1436,68 @@ class StorageHandler(Object):
                 "Invalid storage config: db-devices requires db-size"
             )
 
-    def _apply_osd_config(self, storage_request: dict):
+    def _enroll_progress(self, expected: int = 0):
+        """Return a disk add output callback reporting enrolled devices on the status."""
+        seen = set()
+
+        def on_line(line: str):
+            logger.info("microceph disk add: %s", line)
+            device = microceph.disk_add_data_device(line)
+            if not device or device in seen:
+                return
+            seen.add(device)
+            count = f"{min(len(seen), expected)}/{expected}" if expected else len(seen)
+            self.storage_config_status.set(MaintenanceStatus(f"Enrolling OSD {count}"))
+
+        return on_line
+
+    def _on_osd_enroll_admitted(self, event):
+        """Enroll the pending osd-devices request now this unit was admitted to a wave.
+
+        The wave is only released once the enrollment ran. A unit which is not
+        ready yet keeps its slot, admission is signalled again on the next
+        peers relation-changed or update-status.
+        """
+        admission = self.charm.osd_admission
+        if not self._stored.pending_osd_enroll:
+            logger.info("Admitted to enroll OSDs without a pending request, leaving the wave")
+            admission.release()
+            return
+        if not self.charm.ready_for_service():
+            logger.warning("MicroCeph not ready yet, holding the admitted OSD enrollment")
+            return
+
+        pending = json.loads(self._stored.pending_osd_enroll)
+        self._stored.pending_osd_enroll = ""
+        try:
+            with sunbeam_guard.guard(self._storage_config_guard, f"{self.name}-config"):
+                with self._weight_ramp():
+                    self._enroll_osd_config(pending["request"], pending["expected"])
+        finally:
+            admission.release()
+
+    def _apply_osd_config(self, storage_request: dict, expected: int = 0):
+        """Enroll osd-devices once the cluster-wide admission allows it.
+
+        ``expected`` is the number of devices a dry run matched, if known, for
+        the progress shown while enrolling.
+        """
+        admission = self.charm.osd_admission
+        if not admission.acquire(storage_request["osd_match"]):
+            self._stored.pending_osd_enroll = json.dumps(
+                {"request": storage_request, "expected": expected}
+            )
+            self.storage_config_status.set(WaitingStatus("Waiting for a slot to enroll OSDs"))
+            return
+
+        self._stored.pending_osd_enroll = ""
+        try:
+            with self._weight_ramp():
+                self._enroll_osd_config(storage_request, expected)
+        finally:
+            admission.release()
+
+    def _enroll_osd_config(self, storage_request: dict, expected: int = 0):
         """Execute config-driven storage enrollment and cache successful requests."""
         logger.info(
             "Processing storage config request: %s",
@@ -602,21 +1518,11 @@ class StorageHandler(Object):
                 "Calling microceph.add_disk_match_cmd for request=%s",
                 json.dumps(storage_request, sort_keys=True),
             )
-            output = microceph.add_disk_match_cmd(
-                osd_match=storage_request["osd_match"],
-                wal_match=storage_request["wal_match"],
-                wal_size=storage_request["wal_size"],
-                db_match=storage_request["db_match"],
-                db_size=storage_request["db_size"],
-                wipe=storage_request["flags"]["wipe_osd"],
-                encrypt=storage_request["flags"]["encrypt_osd"],
-                wal_wipe=storage_request["flags"]["wipe_wal"],
-                wal_encrypt=storage_request["flags"]["encrypt_wal"],
-                db_wipe=storage_request["flags"]["wipe_db"],
-                db_encrypt=storage_request["flags"]["encrypt_db"],
+            microceph.add_disk_match_cmd(
+                **self._disk_match_args(storage_request), on_line=self._enroll_progress(expected)
             )
-            if output and output.strip():
-                logger.info("Storage config command output:\n%s", output.strip())
+            if self._storage_request_encrypts(storage_request):
+                self._record_dm_crypt_readiness(success=True)
             self.storage_config_status.set(ActiveStatus(""))
             self._set_osd_config_cache(storage_request)
             logger.info(
@@ -637,6 +1543,8 @@ class StorageHandler(Object):
                 self._set_osd_config_cache(storage_request)
                 return
 
+            if self._storage_request_encrypts(storage_request):
+                self._record_dm_crypt_readiness(success=False)
             logger.error(
                 "Failed to process storage config request=%s error=%s",
                 json.dumps(storage_request, sort_keys=True),
@@ -676,15 +1584,99 @@ class StorageHandler(Object):
     def _enroll_disks_in_batch(self, disks: list):
         """Adds requested Disks to Microceph and stored state."""
         # Enroll OSDs
-        disk_paths = map(
-            lambda name: self.juju_storage_get(storage_id=name, attribute="location"), disks
-        )
+        disk_paths = {
+            name: self.juju_storage_get(storage_id=name, attribute="location") for name in disks
+        }
         logger.debug(f"Disk paths {disk_paths}")
-        microceph.enroll_disks_as_osds(disk_paths)
+        microceph.enroll_disks_as_osds(list(disk_paths.values()))
+
+        if not disks:
+            return
 
-        # Save OSD data using storage names.
+        # Save OSD data using storage names, listing the host's OSDs only once.
+        configured = microceph.list_disk_cmd(host_only=True)["ConfiguredDisks"]
         for disk in disks:
-            self._save_osd_data(disk)
+            self._save_osd_data(disk, disk_path=disk_paths[disk], configured=configured)
+
+    def _pending_replacements(self) -> list:
+        """Return the ids of the destroyed OSDs awaiting a replacement disk."""
+        return sorted(
+            osd
+            for osd, entry in dict(self._stored.osd_data).items()
+            if entry.get("replacing") and "replaced_by" not in entry
+        )
+
+    def _paired_replacements(self) -> dict:
+        """Return the destroyed OSDs already paired with a replacement, by id."""
+        return {
+            osd: dict(entry)
+            for osd, entry in dict(self._stored.osd_data).items()
+            if "replaced_by" in entry
+        }
+
+    def _enroll_replacements(self, disks: list):
+        """Enroll disks, handing each new OSD the CRUSH weight of a destroyed one.
+
+        MicroCeph picks the id of a new OSD and cannot reuse the destroyed
+        one's, so the destroyed OSD is purged once its replacement holds its
+        weight in the same host bucket. CRUSH places the new id differently,
+        so this moves about as much data as a separate remove and add; doing
+        both under norebalance only saves the intermediate remapping.
+        """
+        pending = self._pending_replacements()
+        known = set(self._stored.osd_data)
+        with ceph.osd_flags("norebalance"):
+            self._enroll_disks_in_batch(disks)
+            new_osds = sorted(set(self._stored.osd_data) - known)
+            for old, new in zip(pending, new_osds):
+                # Pair them first, so a failure below is resumed rather than
+                # handing the destroyed OSD to the next disk.
+                self._stored.osd_data[old] = {**self._stored.osd_data[old], "replaced_by": new}
+            self._complete_replacements()
+
+    def _complete_replacements(self):
+        """Move the weight of paired destroyed OSDs to their replacement and purge them.
+
+        Both steps are idempotent, a replacement which failed half-way is
+        resumed on update-status.
+        """
+        paired = self._paired_replacements()
+        if not paired:
+            return
+        try:
+            configured = {
+                osd["osd"] for osd in microceph.list_disk_cmd(host_only=True)["ConfiguredDisks"]
+            }
+            for old, entry in paired.items():
+                new = entry["replaced_by"]
+                ceph.set_osd_crush_weight(new, entry["weight"])
+                if old in configured:
+                    microceph.remove_disk_cmd(old, force=True)
+                self._stored.osd_data.pop(old, None)
+                logger.info(
+                    "osd.%s replaces osd.%s with CRUSH weight %s", new, old, entry["weight"]
+                )
+        except (CalledProcessError, TimeoutExpired) as e:
+            err_msg = self._error_message(e)
+            logger.error("Failed to complete OSD replacement: %s", err_msg)
+            raise sunbeam_guard.BlockedExceptionError(
+                f"Failed to complete OSD replacement, retrying: {err_msg}"
+            )
+
+    def _on_update_status_replacements(self, event):
+        """Resume OSD replacements interrupted after their new OSD was enrolled."""
+        if not self._paired_replacements() or utils.is_departing(self.charm.app):
+            return
+
+        if not self.charm.ready_for_service():
+            logger.debug("MicroCeph not ready yet, skipping OSD replacements")
+            return
+
+        with sunbeam_guard.guard(self._storage_guard, self.name):
+            with ceph.osd_flags("norebalance"):
+                self._complete_replacements()
+            self.storage_status.set(ActiveStatus(""))
+            self._restore_ready_workload_status()
 
     def remove_osd(self, osd_num: int, force: bool = False):
         """Removes OSD from MicroCeph and from stored state."""
@@ -698,17 +1690,30 @@ class StorageHandler(Object):
                 self._clean_stale_osd_data()
             raise e
 
-    def _save_osd_data(self, disk_name: str):
-        """Save OSD data to stored state mapping with juju storage names."""
+    def _save_osd_data(self, disk_name: str, disk_path: str = None, configured: list = None):
+        """Save OSD data to stored state mapping with juju storage names.
+
+        ``disk_path`` and ``configured`` (the host's configured disks) can be
+        passed in by callers saving several disks at once.
+        """
         logger.debug(f"Entry stored state: {dict(self._stored.osd_data)}")
-        disk_path = self.juju_storage_get(storage_id=disk_name, attribute="location")
+        if disk_path is None:
+            disk_path = self.juju_storage_get(storage_id=disk_name, attribute="location")
+        if configured is None:
+            configured = microceph.list_disk_cmd(host_only=True)["ConfiguredDisks"]
 
-        for osd in microceph.list_disk_cmd(host_only=True)["ConfiguredDisks"]:
-            # get block device info using /dev/disk-by-id and lsblk.
+        replacing = {
+            osd for osd, entry in dict(self._stored.osd_data).items() if entry.get("replacing")
+        }
+        for osd in configured:
+            if osd["osd"] in replacing:
+                # A destroyed OSD may still list the device of its replacement.
+                continue
+            # get block device info from the host device inventory.
             local_device = microceph._get_disk_info(osd["path"])
 
             # e.g. check 'vdd' in '/dev/vdd' and is for a local device
-            if local_device["name"] in disk_path:
+            if local_device and local_device["name"] in disk_path:
                 logger.debug(f"Added OSD {osd['osd']} with Disk {disk_name}.")
                 self._stored.osd_data[osd["osd"]] = {
                     "disk": disk_name,  # storage name for OSD device.
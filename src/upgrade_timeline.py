@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+# Copyright 2025 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Timelines of snap upgrades, recorded per node.
+
+Peer unit data is only committed once a hook ends, while a node upgrades
+within a single hook. Timelines are thus also written to a ceph config-key
+per node, which shows the phases as they are reached.
+"""
+
+import json
+import time
+from typing import Dict, List, Optional
+
+# Peer unit data key holding the timeline of the node's last upgrade.
+TIMELINE_KEY = "upgrade-timeline"
+
+# Ceph config-key prefix of the timelines as they are recorded.
+LIVE_KEY_PREFIX = "microceph-charm/upgrade-timeline/"
+
+# Phases of a node's upgrade, in order.
+PHASES = ("queued", "prefetched", "refresh-start", "refresh-end", "health-wait", "done")
+
+# Durations reported for a node, as the phases they run between.
+SPANS = (
+    ("prefetch", "queued", "prefetched"),
+    ("refresh", "refresh-start", "refresh-end"),
+    ("osds-up", "refresh-end", "health-wait"),
+    ("health-wait", "health-wait", "done"),
+)
+
+
+def encode(nonce: str, stamps: Dict[str, int]) -> str:
+    """Encode the phase timestamps of an upgrade for peer data.
+
+    The timeline is stored as [nonce, start, offsets...], the offsets being
+    the seconds from the first phase to each of PHASES, null for phases not
+    reached.
+    """
+    start = min(stamps.values()) if stamps else 0
+    offsets = [stamps[phase] - start if phase in stamps else None for phase in PHASES]
+    return json.dumps([nonce, start, *offsets], separators=(",", ":"))
+
+
+def decode(value: Optional[str]) -> tuple:
+    """Decode a timeline from peer data.
+
+    Returns:
+        A (nonce, stamps) tuple, ("", {}) for an empty or malformed value.
+    """
+    try:
+        nonce, start, *offsets = json.loads(value or "[]")
+    except (ValueError, TypeError):
+        return "", {}
+    stamps = {
+        phase: start + offset for phase, offset in zip(PHASES, offsets) if isinstance(offset, int)
+    }
+    return nonce, stamps
+
+
+def live_key(unit_name: str) -> str:
+    """Return the config-key holding the timeline of a unit."""
+    return LIVE_KEY_PREFIX + unit_name.replace("/", "-")
+
+
+def merge(*values: Optional[str]) -> tuple:
+    """Merge encoded timelines of a node, e.g. from peer data and config-key.
+
+    Returns:
+        A (nonce, stamps) tuple of the upgrade which started last, with the
+        phases any of the values recorded for it.
+    """
+    timelines = [decode(value) for value in values]
+    timelines = [(nonce, stamps) for nonce, stamps in timelines if nonce and stamps]
+    if not timelines:
+        return "", {}
+    nonce, _ = max(timelines, key=lambda timeline: min(timeline[1].values()))
+    stamps = {}
+    for other, other_stamps in timelines:
+        if other == nonce:
+            stamps.update(other_stamps)
+    return nonce, stamps
+
+
+def record(value: Optional[str], nonce: str, phase: str, now: Optional[float] = None) -> str:
+    """Stamp a phase in an encoded timeline, starting over for a new upgrade.
+
+    Args:
+        value: the timeline so far, as stored in peer data.
+        nonce: nonce of the upgrade the phase belongs to.
+        phase: one of PHASES.
+        now: the time of the phase, defaults to the current time.
+
+    Returns:
+        The encoded timeline.
+    """
+    old_nonce, stamps = decode(value)
+    if old_nonce != nonce:
+        stamps = {}
+    stamps[phase] = int(time.time() if now is None else now)
+    return encode(nonce, stamps)
+
+
+def node_report(node: str, stamps: Dict[str, int]) -> dict:
+    """Return the reached phases and the durations of a node's upgrade."""
+    report = {"node": node, "phase": max(stamps, key=PHASES.index) if stamps else "pending"}
+    for name, begin, end in SPANS:
+        if begin in stamps and end in stamps:
+            report[name] = stamps[end] - stamps[begin]
+    if "refresh-start" in stamps and "done" in stamps:
+        report["total"] = stamps["done"] - stamps["refresh-start"]
+    return report
+
+
+def critical_path(timelines: Dict[str, Dict[str, int]]) -> List[dict]:
+    """Return the nodes which held up the upgrade, one per step.
+
+    Nodes which upgraded concurrently form a step. A step ends with its
+    slowest node, which is reported along with the phase it spent the longest
+    in.
+    """
+    done = sorted(
+        (stamps["refresh-start"], stamps["done"], node)
+        for node, stamps in timelines.items()
+        if "refresh-start" in stamps and "done" in stamps
+    )
+    steps = []
+    for start, end, node in done:
+        if steps and start < steps[-1]["end"]:
+            step = steps[-1]
+            if end > step["end"]:
+                step.update(end=end, node=node)
+        else:
+            steps.append({"start": start, "end": end, "node": node})
+
+    path = []
+    for step in steps:
+        report = node_report(step["node"], timelines[step["node"]])
+        spans = {name: report[name] for name, _, _ in SPANS[1:] if name in report}
+        path.append(
+            {
+                "node": step["node"],
+                "duration": step["end"] - step["start"],
+                "slowest-phase": max(spans, key=spans.get) if spans else "",
+            }
+        )
+    return path
+
+
+def summarize(
+    upgrade_info: Dict,
+    timelines: Dict[str, Dict[str, int]],
+    now: Optional[float] = None,
+) -> dict:
+    """Summarize the progress of an upgrade.
+
+    Args:
+        upgrade_info: the upgrade info of the peer app data, empty once the
+            upgrade finished.
+        timelines: phase timestamps of the upgrade on each node.
+        now: the current time, defaults to the current time.
+
+    Returns:
+        The state of each node, the critical path, the time elapsed and, once
+        a step finished, an estimate of the seconds left.
+    """
+    now = int(time.time() if now is None else now)
+    path = critical_path(timelines)
+    nodes = upgrade_info.get("nodes", [])
+    remaining_steps = len(upgrade_info.get("batches") or nodes)
+    if upgrade_info.get("phase") in ("prefetch", "leader"):
+        # The leader itself upgrades first, once all nodes prefetched.
+        remaining_steps += 1
+
+    starts = [min(stamps.values()) for stamps in timelines.values() if stamps]
+    summary = {
+        "state": upgrade_info.get("phase", "upgrading") if upgrade_info else "done",
+        "nodes": [node_report(node, stamps) for node, stamps in sorted(timelines.items())],
+        "pending": nodes,
+        "critical-path": path,
+        "elapsed": now - min(starts) if starts else 0,
+    }
+    if remaining_steps == 0:
+        summary["eta"] = 0
+    elif path:
+        step = sum(p["duration"] for p in path) / len(path)
+        summary["eta"] = int(step * remaining_steps)
+    return summary
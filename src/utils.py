@@ -16,9 +16,12 @@
 
 """Utils module."""
 
+import collections
 import ipaddress
 import logging
 import subprocess
+import threading
+from typing import Callable, Iterator, Optional
 
 import requests
 
@@ -27,6 +30,9 @@ from microceph_client import Client
 
 logger = logging.getLogger(__name__)
 
+# Output lines kept in memory by stream_cmd, for error messages.
+OUTPUT_TAIL_LINES = 20
+
 
 def _normalize_ip(addr: str) -> str:
     """Return the canonical form of a bare IP, or the input unchanged."""
@@ -47,6 +53,66 @@ def run_cmd(cmd: list, timeout: int = 180) -> str:
         raise e
 
 
+def stream_cmd(
+    cmd: list, timeout: int = 180, tail_lines: int = OUTPUT_TAIL_LINES
+) -> Iterator[str]:
+    """Execute provided command, yielding its output lines as they are printed.
+
+    stderr is merged into stdout. Only the last ``tail_lines`` lines are kept,
+    as output of the ``CalledProcessError`` or ``TimeoutExpired`` raised when
+    the command fails or runs past ``timeout`` seconds.
+    """
+    tail = collections.deque(maxlen=tail_lines)
+    timed_out = threading.Event()
+    process = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1
+    )
+
+    def _kill():
+        timed_out.set()
+        process.kill()
+
+    timer = threading.Timer(timeout, _kill)
+    timer.start()
+    try:
+        for line in process.stdout:
+            line = line.rstrip("\n")
+            tail.append(line)
+            yield line
+        returncode = process.wait()
+    finally:
+        timer.cancel()
+        if process.poll() is None:
+            # The caller stopped reading, do not leave the command behind.
+            process.kill()
+            process.wait()
+        process.stdout.close()
+
+    output = "\n".join(tail)
+    if timed_out.is_set():
+        logger.error(f"Timed out executing cmd: {cmd}, output: {output}")
+        raise subprocess.TimeoutExpired(cmd, timeout, output=output, stderr=output)
+    if returncode:
+        logger.error(f"Failed executing cmd: {cmd}, error: {output}")
+        raise subprocess.CalledProcessError(returncode, cmd, output=output, stderr=output)
+    logger.debug(f"Command {' '.join(cmd)} finished")
+
+
+def run_cmd_streaming(
+    cmd: list, timeout: int = 180, on_line: Optional[Callable[[str], None]] = None
+) -> str:
+    """Execute provided command, passing each output line to ``on_line`` as it arrives.
+
+    Returns the tail of the output, see ``stream_cmd``.
+    """
+    tail = collections.deque(maxlen=OUTPUT_TAIL_LINES)
+    for line in stream_cmd(cmd, timeout=timeout):
+        tail.append(line)
+        if on_line:
+            on_line(line)
+    return "\n".join(tail)
+
+
 def run_cmd_with_input(cmd: list, input_data: str) -> str:
     """Execute provided command with input to stdin."""
     try:
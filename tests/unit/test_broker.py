@@ -28,12 +28,15 @@ class TestBroker(test_utils.CharmTestCase):
     def _raise_subproc(*args, **kwargs):
         raise broker.CalledProcessError(1, "")
 
+    @patch.object(broker, "count_selectable_osds", return_value=(2, 2))
+    @patch.object(broker, "get_cluster_simd", return_value="none")
     @patch.object(broker, "pool_exists")
     @patch.object(broker, "ErasurePool")
     @patch.object(broker, "erasure_profile_exists")
-    def test_erasure_pool(self, ep_exists, epool, pool_exists):
+    def test_erasure_pool(self, ep_exists, epool, pool_exists, _simd, _count):
         req = {"name": "mypool"}
         ep_exists.side_effect = lambda service, name: name == "some-profile"
+        # Too few hosts to create the default profile.
         rv = broker.handle_erasure_pool(req, "admin")
         self.assertEqual(rv["exit-code"], 1)
         pool_exists.assert_not_called()
@@ -45,6 +48,59 @@ class TestBroker(test_utils.CharmTestCase):
         epool.assert_called()
         pool_exists.assert_called_with(service="admin", name="mypool")
 
+    @patch.object(broker, "check_call")
+    @patch.object(broker, "count_selectable_osds", return_value=(12, 6))
+    @patch.object(broker, "get_cluster_simd", return_value="avx2")
+    @patch.object(broker, "pool_exists", return_value=True)
+    @patch.object(broker, "ErasurePool")
+    @patch.object(broker, "erasure_profile_exists")
+    def test_erasure_pool_default_profile(
+        self, ep_exists, epool, _pool_exists, _simd, _count, check_call
+    ):
+        created = set()
+        ep_exists.side_effect = lambda service, name: name in created
+        check_call.side_effect = lambda cmd: created.add(cmd[6])
+
+        req = {"name": "default.rgw.buckets.data", "app-name": "rgw"}
+        self.assertIsNone(broker.handle_erasure_pool(req, "admin"))
+        cmd = check_call.call_args.args[0]
+        self.assertEqual(cmd[6], "default-canonical-64k")
+        for arg in ("plugin=isa", "technique=reed_sol_van", "k=3", "m=2", "stripe_unit=65536"):
+            self.assertIn(arg, cmd)
+        self.assertEqual(epool.call_args.kwargs["op"]["erasure-profile"], "default-canonical-64k")
+
+        req = {"name": "glance"}
+        self.assertIsNone(broker.handle_erasure_pool(req, "admin"))
+        self.assertEqual(check_call.call_args.args[0][6], "default-canonical")
+        self.assertEqual(epool.call_args.kwargs["op"]["erasure-profile"], "default-canonical")
+
+    @patch.object(broker, "check_call")
+    @patch.object(broker, "erasure_profile_exists", return_value=False)
+    @patch.object(broker, "count_selectable_osds", return_value=(8, 4))
+    @patch.object(broker, "get_cluster_simd")
+    def test_create_erasure_profile_defaults(self, get_simd, _count, _exists, check_call):
+        get_simd.return_value = "avx512"
+        req = {"name": "ec", "failure-domain": "rack", "device-class": "ssd"}
+        self.assertEqual(broker.handle_create_erasure_profile(req, "admin"), {"exit-code": 0})
+        cmd = check_call.call_args.args[0]
+        for arg in ("plugin=isa", "technique=reed_sol_van", "k=2", "m=1"):
+            self.assertIn(arg, cmd)
+        _count.assert_called_with(device_class="ssd", failure_domain="rack")
+
+        # Settings the client asks for are kept.
+        get_simd.return_value = "none"
+        req = {"name": "ec", "erasure-type": "isa", "k": 4, "m": 5}
+        broker.handle_create_erasure_profile(req, "admin")
+        cmd = check_call.call_args.args[0]
+        for arg in ("plugin=isa", "technique=cauchy", "k=4", "m=5"):
+            self.assertIn(arg, cmd)
+
+        req = {"name": "ec", "erasure-technique": "cauchy_good", "k": 2, "m": 1}
+        broker.handle_create_erasure_profile(req, "admin")
+        cmd = check_call.call_args.args[0]
+        self.assertIn("plugin=jerasure", cmd)
+        self.assertIn("technique=cauchy_good", cmd)
+
     @patch.object(broker, "pool_exists")
     @patch.object(broker, "ReplicatedPool")
     @patch.object(broker, "get_osds")
@@ -66,6 +122,14 @@ class TestBroker(test_utils.CharmTestCase):
         pool.create.assert_called()
         pool.update.assert_called()
 
+    @patch.object(broker, "pool_exists")
+    def test_replicated_pool_unknown_workload_profile(self, pool_exists):
+        req = {"name": "mypool", "replicas": 3, "workload-profile": "fast"}
+        rv = broker.handle_replicated_pool(req, "admin")
+        self.assertEqual(rv["exit-code"], 1)
+        self.assertIn("Unknown workload profile", rv["stderr"])
+        pool_exists.assert_not_called()
+
     @patch.object(broker, "check_output")
     @patch.object(broker, "pool_exists")
     def test_create_cephfs(self, pool_exists, check_output):
@@ -353,6 +417,76 @@ class TestBroker(test_utils.CharmTestCase):
             ret = broker.process_requests_v1(reqs)
             self.assertEqual(ret["exit-code"], 0)
 
+    @patch.object(broker, "check_call")
+    @patch.object(broker, "create_rbd_namespace")
+    @patch.object(broker, "pool_exists")
+    @patch.object(broker, "monitor_key_set")
+    @patch.object(broker, "monitor_key_get")
+    def test_create_rbd_namespace(
+        self, key_get, key_set, pool_exists, create_rbd_namespace, check_call
+    ):
+        keys = {}
+        key_get.side_effect = lambda service, key: keys.get(key)
+        key_set.side_effect = lambda service, key, value: keys.update({key: value})
+
+        req = {"op": "create-rbd-namespace", "pool": "tenants", "namespace": "tenant-a"}
+        pool_exists.return_value = False
+        rv = broker.process_requests_v1([req])
+        self.assertEqual(rv["exit-code"], 1)
+        create_rbd_namespace.assert_not_called()
+
+        pool_exists.return_value = True
+        rv = broker.process_requests_v1([dict(req, **{"rbd-qos-iops-limit": 500})])
+        self.assertEqual(rv["stderr"], broker.RBD_NAMESPACE_QOS_MSG)
+        create_rbd_namespace.assert_not_called()
+
+        pool_exists.return_value = True
+        req["name"] = "tenant-a-client"
+        rv = broker.process_requests_v1([req])
+        self.assertEqual(rv["exit-code"], 0)
+        create_rbd_namespace.assert_called_once_with("admin", "tenants", "tenant-a")
+        group = json.loads(keys["cephx.groups.tenants-tenant-a"])
+        self.assertEqual(group["rbd-namespaces"], {"tenants": ["tenant-a"]})
+        self.assertEqual(group["services"], ["tenant-a-client"])
+        caps = check_call.call_args.args[0]
+        self.assertEqual(caps[:4], ["microceph.ceph", "auth", "caps", "client.tenant-a-client"])
+        self.assertEqual(caps[-1], "allow rwx pool=tenants namespace=tenant-a")
+
+        # Members of the group are granted access to namespaces added later.
+        req = {"op": "create-rbd-namespace", "pool": "tenants", "namespace": "tenant-b"}
+        req["group"] = "tenants-tenant-a"
+        rv = broker.process_requests_v1([req])
+        self.assertEqual(rv["exit-code"], 0)
+        self.assertEqual(
+            check_call.call_args.args[0][-1],
+            "allow rwx pool=tenants namespace=tenant-a, "
+            "allow rwx pool=tenants namespace=tenant-b",
+        )
+
+    @patch.object(broker, "set_rbd_qos")
+    @patch.object(broker, "pool_exists", return_value=True)
+    def test_set_rbd_qos(self, _pool_exists, set_rbd_qos):
+        req = {"op": "set-rbd-qos", "pool": "cinder", "rbd-qos-iops-limit": "many"}
+        rv = broker.process_requests_v1([req])
+        self.assertEqual(rv["exit-code"], 1)
+        self.assertIn("rbd-qos-iops-limit", rv["stderr"])
+
+        req["rbd-qos-iops-limit"] = 500
+        rv = broker.process_requests_v1([req])
+        self.assertEqual(rv["exit-code"], 0)
+        set_rbd_qos.assert_called_once_with("admin", "cinder", {"rbd_qos_iops_limit": 500})
+
+        # RBD has no QoS limits per namespace.
+        set_rbd_qos.reset_mock()
+        rv = broker.process_requests_v1([dict(req, namespace="tenant-a")])
+        self.assertEqual(rv["exit-code"], 1)
+        self.assertEqual(rv["stderr"], broker.RBD_NAMESPACE_QOS_MSG)
+        set_rbd_qos.assert_not_called()
+
+        set_rbd_qos.side_effect = self._raise_subproc
+        rv = broker.process_requests_v1([req])
+        self.assertEqual(rv["exit-code"], 1)
+
     @patch.object(broker, "check_output")
     @patch.object(broker, "log")
     def test_create_cephfs_client(self, mock_log, check_output):
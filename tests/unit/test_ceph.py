@@ -16,10 +16,56 @@
 
 import json
 import unittest
-from unittest.mock import patch
+from unittest.mock import call, patch
 
 import ceph
 
+CRUSH_DUMP = {
+    "devices": [
+        {"id": 0, "name": "osd.0", "class": "hdd"},
+        {"id": 1, "name": "osd.1", "class": "ssd"},
+        {"id": 2, "name": "osd.2", "class": "hdd"},
+        {"id": 3, "name": "osd.3", "class": "hdd"},
+        {"id": 4, "name": "osd.4", "class": "hdd"},
+    ],
+    "buckets": [
+        {"id": -1, "name": "default", "type_name": "root", "items": [{"id": -2}, {"id": -3}]},
+        {"id": -2, "name": "node-1", "type_name": "host", "items": [{"id": 0}, {"id": 1}]},
+        {"id": -3, "name": "node-2", "type_name": "host", "items": [{"id": 2}, {"id": 3}]},
+        {"id": -4, "name": "archive", "type_name": "root", "items": [{"id": -5}]},
+        {"id": -5, "name": "node-3", "type_name": "host", "items": [{"id": 4}]},
+    ],
+    "rules": [
+        {
+            "rule_id": 0,
+            "rule_name": "replicated_rule",
+            "steps": [
+                {"op": "take", "item": -1, "item_name": "default"},
+                {"op": "chooseleaf_firstn", "num": 0, "type": "host"},
+                {"op": "emit"},
+            ],
+        },
+        {
+            "rule_id": 1,
+            "rule_name": "fast",
+            "steps": [
+                {"op": "take", "item": -6, "item_name": "default~ssd"},
+                {"op": "chooseleaf_firstn", "num": 0, "type": "host"},
+                {"op": "emit"},
+            ],
+        },
+        {
+            "rule_id": 2,
+            "rule_name": "archive",
+            "steps": [
+                {"op": "take", "item": -4, "item_name": "archive"},
+                {"op": "chooseleaf_indep", "num": 0, "type": "osd"},
+                {"op": "emit"},
+            ],
+        },
+    ],
+}
+
 
 class TestCeph(unittest.TestCase):
     @patch.object(ceph, "check_output")
@@ -159,6 +205,530 @@ class TestCeph(unittest.TestCase):
         check_output.return_value = b"null"
         self.assertEqual(ceph.get_live_mon_ips(), set())
 
+    @patch.object(ceph, "utils")
+    def test_osd_flags_restores_only_added_flags(self, utils):
+        utils.run_cmd.return_value = json.dumps({"flags": "noout,sortbitwise"})
+
+        with ceph.osd_flags("noout", "norebalance"):
+            utils.run_cmd.assert_any_call(["microceph.ceph", "osd", "set", "norebalance"])
+
+        utils.run_cmd.assert_called_with(["microceph.ceph", "osd", "unset", "norebalance"])
+        self.assertNotIn(
+            call(["microceph.ceph", "osd", "unset", "noout"]),
+            utils.run_cmd.call_args_list,
+        )
+
+    @patch.object(ceph, "utils")
+    def test_osd_flags_unset_on_error(self, utils):
+        utils.run_cmd.return_value = json.dumps({"flags": ""})
+
+        with self.assertRaises(RuntimeError):
+            with ceph.osd_flags("norebalance"):
+                raise RuntimeError("boom")
+
+        utils.run_cmd.assert_called_with(["microceph.ceph", "osd", "unset", "norebalance"])
+
+    @patch.object(ceph, "monitor_key_delete")
+    @patch.object(ceph, "monitor_key_set")
+    @patch.object(ceph, "monitor_key_get")
+    @patch.object(ceph, "utils")
+    def test_host_osd_flags_recorded(self, utils, key_get, key_set, key_delete):
+        key_get.return_value = None
+        with self.assertRaises(RuntimeError):
+            with ceph.host_osd_flags("node-1", "noout"):
+                key_set.assert_called_once_with(
+                    "admin", "microceph-charm/host-osd-flags/node-1", '["noout"]'
+                )
+                utils.run_cmd.assert_called_once_with(
+                    ["microceph.ceph", "osd", "set-group", "noout", "node-1"]
+                )
+                key_get.return_value = '["noout"]'
+                raise RuntimeError("boom")
+
+        utils.run_cmd.assert_called_with(
+            ["microceph.ceph", "osd", "unset-group", "noout", "node-1"]
+        )
+        key_delete.assert_called_once_with("admin", "microceph-charm/host-osd-flags/node-1")
+
+    @patch.object(ceph, "monitor_key_get", return_value=None)
+    @patch.object(ceph, "utils")
+    def test_clear_host_osd_flags_none_recorded(self, utils, _key_get):
+        self.assertEqual(ceph.clear_host_osd_flags("node-1"), [])
+        utils.run_cmd.assert_not_called()
+
+    @patch.object(ceph, "utils")
+    def test_get_host_down_osds(self, utils):
+        utils.run_cmd.return_value = json.dumps(
+            {
+                "nodes": [
+                    {"id": -2, "type": "host", "name": "node-1", "children": [0, 1]},
+                    {"id": -3, "type": "host", "name": "node-2", "children": [2]},
+                    {"id": 0, "type": "osd", "status": "up"},
+                    {"id": 1, "type": "osd", "status": "down"},
+                    {"id": 2, "type": "osd", "status": "down"},
+                ]
+            }
+        )
+        self.assertEqual(ceph.get_host_down_osds("node-1"), [1])
+
+    @patch.object(ceph, "utils")
+    def test_get_pg_state_counts(self, utils):
+        utils.run_cmd.return_value = json.dumps(
+            {
+                "pg_summary": {
+                    "num_pg_by_state": [
+                        {"name": "active+clean", "num": 30},
+                        {"name": "active+clean+scrubbing+deep", "num": 2},
+                        {"name": "active+remapped+backfilling", "num": 1},
+                    ],
+                    "num_pgs": 33,
+                }
+            }
+        )
+        self.assertEqual(ceph.get_pg_state_counts(), (32, 33))
+
+    @patch.object(ceph, "utils")
+    def test_get_remapped_pg_count(self, utils):
+        utils.run_cmd.return_value = json.dumps(
+            {
+                "num_pg_by_state": [
+                    {"name": "active+clean", "num": 28},
+                    {"name": "active+recovering+degraded", "num": 3},
+                    {"name": "active+remapped+backfill_wait", "num": 2},
+                    {"name": "active+remapped+backfilling", "num": 1},
+                ]
+            }
+        )
+        # Recovering PGs move no data to other OSDs.
+        self.assertEqual(ceph.get_remapped_pg_count(), 3)
+
+    def test_round_pgs(self):
+        self.assertEqual(ceph.round_pgs(1), 2)
+        self.assertEqual(ceph.round_pgs(70), 64)
+        # 64 is more than 25% below 100.
+        self.assertEqual(ceph.round_pgs(100), 128)
+
+    def test_allocate_pgs(self):
+        pools = [
+            {"name": "rbd", "weight": 40, "size": 3, "device-class": ""},
+            {"name": "rgw", "weight": 20, "size": 3, "device-class": ""},
+            {"name": "meta", "weight": 5, "size": 3, "device-class": "ssd"},
+        ]
+        self.assertEqual(
+            ceph.allocate_pgs(pools, {"hdd": 8, "ssd": 2}),
+            {"rbd": 128, "rgw": 64, "meta": 4},
+        )
+
+    def test_allocate_pgs_scales_down_overcommitted_weights(self):
+        pools = [
+            {"name": "a", "weight": 80, "size": 3, "device-class": ""},
+            {"name": "b", "weight": 80, "size": 3, "device-class": ""},
+        ]
+        self.assertEqual(ceph.allocate_pgs(pools, {"hdd": 3}), {"a": 64, "b": 64})
+        # The largest pool is halved until the OSDs are within the limit.
+        self.assertEqual(
+            ceph.allocate_pgs(pools, {"hdd": 3}, max_pgs_per_osd=100), {"a": 32, "b": 64}
+        )
+
+    @patch.object(ceph, "utils")
+    def test_get_crush_rule_classes(self, utils):
+        self._crush_dump(utils)
+        self.assertEqual(ceph.get_crush_rule_classes(), {0: "", 1: "ssd", 2: ""})
+
+    def _crush_dump(self, utils):
+        ceph.invalidate_crush_map()
+        self.addCleanup(ceph.invalidate_crush_map)
+        utils.run_cmd.return_value = json.dumps(CRUSH_DUMP)
+
+    @patch.object(ceph, "utils")
+    def test_get_host_failure_domains(self, utils):
+        ceph.invalidate_crush_map()
+        self.addCleanup(ceph.invalidate_crush_map)
+        buckets = [
+            {"id": -1, "name": "default", "type_name": "root", "items": [{"id": -2}, {"id": -4}]},
+            {"id": -2, "name": "rack1", "type_name": "rack", "items": [{"id": -3}]},
+            {"id": -3, "name": "node-1", "type_name": "host", "items": [{"id": 0}]},
+            {"id": -4, "name": "node-2", "type_name": "host", "items": [{"id": 1}]},
+        ]
+        utils.run_cmd.return_value = json.dumps({"buckets": buckets})
+
+        self.assertEqual(ceph.get_host_failure_domains(), {"node-1": "rack1", "node-2": "node-2"})
+        self.assertEqual(
+            ceph.get_host_buckets()["node-1"],
+            [("host", "node-1"), ("rack", "rack1"), ("root", "default")],
+        )
+
+    @patch.object(ceph, "utils")
+    def test_get_pool_failure_domains(self, utils):
+        ceph.invalidate_crush_map()
+        self.addCleanup(ceph.invalidate_crush_map)
+        pools = [
+            {"pool_name": "rbd", "size": 3, "pg_num": 32, "crush_rule": 0},
+            {"pool_name": "archive", "size": 2, "pg_num": 32, "crush_rule": 2},
+            {"pool_name": "lost", "size": 3, "pg_num": 32, "crush_rule": 7},
+        ]
+        utils.run_cmd.side_effect = lambda cmd, **_: json.dumps(
+            pools if "pool" in cmd else CRUSH_DUMP
+        )
+
+        self.assertEqual(ceph.get_pool_failure_domains(), {"host", "osd"})
+
+    @patch.object(ceph, "utils")
+    def test_get_mon_quorum(self, utils):
+        utils.run_cmd.return_value = json.dumps(
+            {
+                "quorum_names": ["node-1", "node-2"],
+                "monmap": {"mons": [{"name": "node-1"}, {"name": "node-2"}, {"name": "node-3"}]},
+            }
+        )
+        self.assertEqual(
+            ceph.get_mon_quorum(), (["node-1", "node-2", "node-3"], ["node-1", "node-2"])
+        )
+
+    @patch.object(ceph, "utils")
+    def test_get_crush_map_cached(self, utils):
+        self._crush_dump(utils)
+        ceph.get_crush_map()
+        ceph.get_crush_map()
+        utils.run_cmd.assert_called_once_with(
+            ["microceph.ceph", "osd", "crush", "dump", "--format=json"]
+        )
+
+    @patch.object(ceph, "utils")
+    def test_get_rule_selection(self, utils):
+        self._crush_dump(utils)
+        self.assertEqual(
+            ceph.get_rule_selection("fast"),
+            {"root": "default", "device-class": "ssd", "failure-domain": "host"},
+        )
+        self.assertEqual(ceph.get_rule_selection(2)["root"], "archive")
+        self.assertIsNone(ceph.get_rule_selection("missing"))
+
+    @patch.object(ceph, "utils")
+    def test_count_selectable_osds(self, utils):
+        self._crush_dump(utils)
+        self.assertEqual(ceph.count_selectable_osds("default", "", "host"), (4, 2))
+        self.assertEqual(ceph.count_selectable_osds("default", "ssd", "host"), (1, 1))
+        self.assertEqual(ceph.count_selectable_osds("archive", "", "osd"), (1, 1))
+
+    @patch.object(ceph, "get_osds")
+    @patch.object(ceph, "utils")
+    def test_get_pgs_counts_rule_osds(self, utils, get_osds):
+        self._crush_dump(utils)
+        pool = ceph.ReplicatedPool("admin", name="volumes")
+
+        self.assertEqual(pool.get_pgs(3, 40, crush_rule="replicated_rule"), 64)
+        # A single SSD, fewer failure domains than replicas.
+        with self.assertLogs(ceph.logger, "WARNING"):
+            self.assertEqual(pool.get_pgs(3, 40, crush_rule="fast"), 16)
+        get_osds.assert_not_called()
+
+    @patch.object(ceph, "update_pool")
+    def test_set_workload_profile(self, update_pool):
+        pool = ceph.ErasurePool(
+            "admin", op={"name": "default.rgw.buckets.data", "app-name": "rgw"}
+        )
+        pool.set_workload_profile()
+        update_pool.assert_called_once_with(
+            "admin", "default.rgw.buckets.data", {"pg_autoscale_bias": "1.0", "fast_read": "1"}
+        )
+
+        update_pool.reset_mock()
+        pool = ceph.ReplicatedPool(
+            "admin",
+            op={
+                "name": "archive",
+                "replicas": 3,
+                "workload-profile": "cold-archive",
+                "compression-mode": "passive",
+            },
+        )
+        pool.set_workload_profile()
+        # The client's own compression mode is kept.
+        update_pool.assert_called_once_with("admin", "archive", {"pg_autoscale_bias": "1.0"})
+
+        update_pool.reset_mock()
+        ceph.ReplicatedPool("admin", op={"name": "glance", "replicas": 3}).set_workload_profile()
+        update_pool.assert_not_called()
+
+    def test_target_size_settings(self):
+        def pool(name, quota=0, **options):
+            return {"name": name, "quota-bytes": quota, "options": options}
+
+        pools = [
+            pool("rbd", target_size_ratio=0.4),
+            pool("rgw"),
+            pool("backups", quota=1024**4),
+            pool(".mgr"),
+        ]
+        weights = {"rbd": 60, "rgw": 60, "backups": 20}
+
+        self.assertEqual(
+            ceph.target_size_settings(pools, weights),
+            {
+                # Weights add up to 120%, they are scaled down.
+                "rbd": {"target_size_ratio": "0.5", "target_size_bytes": "0"},
+                "rgw": {"target_size_ratio": "0.5", "target_size_bytes": "0"},
+                "backups": {"target_size_ratio": "0.0", "target_size_bytes": str(1024**4)},
+            },
+        )
+
+        # Already aligned pools are not touched again.
+        pools[0]["options"]["target_size_ratio"] = 0.5
+        self.assertNotIn("rbd", ceph.target_size_settings(pools, weights))
+
+    @patch.object(ceph, "apply_target_sizes")
+    @patch.object(ceph, "record_pool_weight")
+    def test_set_target_size(self, record_pool_weight, apply_target_sizes):
+        ceph.ReplicatedPool(
+            "admin", op={"name": "glance", "replicas": 3, "weight": 20}
+        ).set_target_size()
+        record_pool_weight.assert_called_once_with("admin", "glance", 20)
+        apply_target_sizes.assert_called_once_with("admin")
+
+        # An inferred profile leaves the weight alone.
+        record_pool_weight.reset_mock()
+        op = {"name": "ceph-fs_metadata", "app-name": "cephfs", "replicas": 3}
+        ceph.ReplicatedPool("admin", op=op).set_target_size()
+        record_pool_weight.assert_called_once_with("admin", "ceph-fs_metadata", 10.0)
+
+        # The requested profile's ratio stands in for the weight.
+        record_pool_weight.reset_mock()
+        op["workload-profile"] = "cephfs-metadata"
+        ceph.ReplicatedPool("admin", op=op).set_target_size()
+        record_pool_weight.assert_called_once_with("admin", "ceph-fs_metadata", 1.0)
+
+    @patch.object(ceph, "apply_target_sizes")
+    @patch.object(ceph, "record_pool_weight")
+    @patch.object(ceph, "update_pool")
+    def test_update_applies_requested_profile(self, update_pool, *_):
+        op = {"name": "ceph-fs_metadata", "app-name": "cephfs", "replicas": 3}
+        ceph.ReplicatedPool("admin", op=op).update()
+        # Existing pools are not retuned by an inferred profile.
+        update_pool.assert_called_once_with(
+            client="admin", pool="ceph-fs_metadata", settings={"size": "3"}
+        )
+
+        update_pool.reset_mock()
+        op["workload-profile"] = "cephfs-metadata"
+        ceph.ReplicatedPool("admin", op=op).update()
+        update_pool.assert_called_with(
+            "admin", "ceph-fs_metadata", {"pg_autoscale_bias": "4.0", "pg_num_min": "16"}
+        )
+
+    def test_rbd_qos_settings(self):
+        op = {"name": "cinder", "rbd-qos-iops-limit": 500, "rbd-qos-write-bps-burst": 0}
+        self.assertEqual(
+            ceph.rbd_qos_settings(op),
+            {"rbd_qos_iops_limit": 500, "rbd_qos_write_bps_burst": 0},
+        )
+        for key, value in (
+            ("rbd-qos-iops-limit", -1),
+            ("rbd-qos-bps-limit", "fast"),
+            ("rbd-qos-read-iops-burst-seconds", 0),
+        ):
+            with self.subTest(key=key), self.assertRaises(ValueError):
+                ceph.rbd_qos_settings({key: value})
+
+        # Pool requests are validated alike.
+        pool = ceph.ReplicatedPool(
+            "admin", op={"name": "cinder", "replicas": 3, "rbd-qos-iops-limit": -1}
+        )
+        with self.assertRaises(ValueError):
+            pool.validate()
+
+    @patch.object(ceph, "check_call")
+    @patch.object(ceph, "check_output")
+    def test_set_rbd_qos(self, check_output, check_call):
+        check_output.return_value = json.dumps(
+            [
+                {"name": "rbd_qos_iops_limit", "value": "500", "source": "pool"},
+                {"name": "rbd_qos_bps_limit", "value": "0", "source": "config"},
+            ]
+        ).encode()
+
+        ceph.set_rbd_qos("admin", "cinder", {"rbd_qos_iops_limit": 500, "rbd_qos_bps_limit": 0})
+
+        check_output.assert_called_once_with(
+            [
+                "microceph.rbd",
+                "--id",
+                "admin",
+                "config",
+                "pool",
+                "list",
+                "cinder",
+                "--format",
+                "json",
+            ]
+        )
+        # Only the option not yet set on the pool is written.
+        check_call.assert_called_once_with(
+            [
+                "microceph.rbd",
+                "--id",
+                "admin",
+                "config",
+                "pool",
+                "set",
+                "cinder",
+                "rbd_qos_bps_limit",
+                "0",
+            ]
+        )
+
+    @patch.object(ceph, "set_rbd_qos")
+    def test_pool_set_rbd_qos(self, set_rbd_qos):
+        ceph.ReplicatedPool("admin", op={"name": "glance", "replicas": 3}).set_rbd_qos()
+        set_rbd_qos.assert_not_called()
+
+        profile = ceph.pool_profiles.PoolProfile(
+            rbd_qos=(("rbd_qos_iops_limit", 1000), ("rbd_qos_bps_limit", 2**30))
+        )
+        with patch.dict(ceph.pool_profiles.PROFILES, {"rbd-vm": profile}):
+            pool = ceph.ReplicatedPool(
+                "admin",
+                op={
+                    "name": "cinder",
+                    "app-name": "rbd",
+                    "replicas": 3,
+                    "workload-profile": "rbd-vm",
+                    "rbd-qos-iops-limit": 200,
+                },
+            )
+        pool.set_rbd_qos()
+        # The client's limits win over the workload profile's.
+        set_rbd_qos.assert_called_once_with(
+            "admin", "cinder", {"rbd_qos_iops_limit": 200, "rbd_qos_bps_limit": 2**30}
+        )
+
+    @patch.object(ceph, "utils")
+    def test_workload_crush_rule(self, utils):
+        self._crush_dump(utils)
+        op = {"name": "ceph-fs_metadata", "app-name": "cephfs", "replicas": 3}
+        # An inferred profile does not place the pool.
+        self.assertIsNone(ceph.ReplicatedPool("admin", op=op)._workload_crush_rule())
+
+        # The only SSD is on a single host, too few for the replicas.
+        op["workload-profile"] = "cephfs-metadata"
+        with self.assertLogs(ceph.logger, "WARNING"):
+            self.assertIsNone(ceph.ReplicatedPool("admin", op=op)._workload_crush_rule())
+
+        op["replicas"] = 1
+        pool = ceph.ReplicatedPool("admin", op=op)
+        self.assertEqual(pool._workload_crush_rule(), "replicated-ssd-host")
+        utils.run_cmd.assert_called_with(
+            [
+                "microceph.ceph",
+                "osd",
+                "crush",
+                "rule",
+                "create-replicated",
+                "replicated-ssd-host",
+                "default",
+                "host",
+                "ssd",
+            ]
+        )
+
+        self._crush_dump(utils)
+        pool = ceph.ReplicatedPool("admin", op={"name": "glance", "replicas": 3})
+        self.assertIsNone(pool._workload_crush_rule())
+
+    @patch.object(ceph, "_rule_osd_count", return_value=8)
+    @patch.object(ceph, "get_osd_locations")
+    @patch.object(ceph, "get_pool_weights")
+    @patch.object(ceph, "list_pools_detail")
+    def test_plan_pg_budget(
+        self, list_pools_detail, get_pool_weights, get_osd_locations, _rule_osd_count
+    ):
+        list_pools_detail.return_value = [
+            {
+                "name": "rbd",
+                "size": 3,
+                "pg_num": 32,
+                "device-class": "",
+                "crush-rule": 0,
+                "autoscale": "off",
+            }
+        ]
+        get_pool_weights.return_value = {"rbd": 40}
+        get_osd_locations.return_value = {
+            osd: {"host": "node-1", "device-class": "hdd"} for osd in range(8)
+        }
+
+        plan = ceph.plan_pg_budget(
+            "admin", requested=[{"name": "ec", "weight": 20, "size": 5, "device-class": ""}]
+        )
+
+        self.assertEqual(
+            [(p["pool"], p["current"], p["optimal"], p["autoscale"]) for p in plan],
+            [("rbd", 32, 128, "off"), ("ec", 0, 32, "on")],
+        )
+
+    @patch.object(ceph, "utils")
+    def test_get_osd_locations(self, utils):
+        utils.run_cmd.return_value = json.dumps(
+            {
+                "nodes": [
+                    {"id": -1, "name": "default", "type": "root", "children": [-3]},
+                    {"id": -3, "name": "node-1", "type": "host", "children": [1, 0]},
+                    {"id": 0, "name": "osd.0", "type": "osd", "device_class": "ssd"},
+                    {"id": 1, "name": "osd.1", "type": "osd", "device_class": "hdd"},
+                    {"id": 2, "name": "osd.2", "type": "osd", "device_class": "hdd"},
+                ]
+            }
+        )
+        self.assertEqual(
+            ceph.get_osd_locations(),
+            {
+                0: {"host": "node-1", "device-class": "ssd"},
+                1: {"host": "node-1", "device-class": "hdd"},
+                2: {"host": "", "device-class": "hdd"},
+            },
+        )
+
+    @patch.object(ceph, "utils")
+    def test_osd_bench(self, utils):
+        utils.run_cmd.return_value = json.dumps({"bytes_per_sec": 104857600.0, "iops": 25.0})
+        self.assertEqual(ceph.osd_bench(3, 1073741824, 4194304)["iops"], 25.0)
+        utils.run_cmd.assert_called_once_with(
+            [
+                "microceph.ceph",
+                "tell",
+                "osd.3",
+                "bench",
+                "1073741824",
+                "4194304",
+                "--format=json",
+            ],
+            timeout=600,
+        )
+
+    @patch.object(ceph, "utils")
+    def test_get_misplaced_ratio(self, utils):
+        utils.run_cmd.return_value = json.dumps({"pgmap": {"misplaced_ratio": 0.125}})
+        self.assertEqual(ceph.get_misplaced_ratio(), 0.125)
+        utils.run_cmd.assert_called_once_with(["microceph.ceph", "status", "--format=json"])
+
+        # Nothing misplaced, the key is absent.
+        utils.run_cmd.return_value = json.dumps({"pgmap": {}})
+        self.assertEqual(ceph.get_misplaced_ratio(), 0.0)
+
+    @patch.object(ceph, "utils")
+    def test_destroy_osd(self, utils):
+        ceph.destroy_osd(5)
+        utils.run_cmd.assert_called_once_with(
+            ["microceph.ceph", "osd", "destroy", "osd.5", "--yes-i-really-mean-it"]
+        )
+
+    @patch.object(ceph, "utils")
+    def test_get_osd_pg_counts(self, utils):
+        utils.run_cmd.return_value = json.dumps(
+            {"nodes": [{"id": 0, "pgs": 40}, {"id": 3, "pgs": 0}], "summary": {}}
+        )
+        self.assertEqual(ceph.get_osd_pg_counts(), {0: 40, 3: 0})
+
     def test_addr_to_ip(self):
         """_addr_to_ip parses all messenger forms and canonicalises the result."""
         cases = {
@@ -175,3 +745,26 @@ class TestCeph(unittest.TestCase):
         }
         for addr, expected in cases.items():
             self.assertEqual(ceph._addr_to_ip(addr), expected, addr)
+
+    @patch.object(ceph, "check_call")
+    @patch.object(ceph, "check_output")
+    def test_create_rbd_namespace(self, check_output, check_call):
+        check_output.return_value = json.dumps([{"name": "tenant-a"}]).encode()
+
+        ceph.create_rbd_namespace("admin", "tenants", "tenant-a")
+        check_call.assert_not_called()
+
+        ceph.create_rbd_namespace("admin", "tenants", "tenant-b")
+        check_call.assert_called_once_with(
+            [
+                "microceph.rbd",
+                "--id",
+                "admin",
+                "namespace",
+                "create",
+                "--pool",
+                "tenants",
+                "--namespace",
+                "tenant-b",
+            ]
+        )
@@ -112,7 +112,7 @@ class TestCephNfsClientProvides(testbase.TestBaseCharm):
 
         self.create_fs_volume.side_effect = _add_fs_volume
 
-    def _add_peer_unit(self, rel_id, number):
+    def _add_peer_unit(self, rel_id, number, zone=None):
         host = f"foo{number}"
         unit_name = f"microceph/{number}"
 
@@ -126,6 +126,8 @@ class TestCephNfsClientProvides(testbase.TestBaseCharm):
             "nfs-address": f"nfs-addr-{number}",
             unit_name: f"foo{number}",
         }
+        if zone:
+            unit_data["availability-zone"] = zone
         self.add_unit(self.harness, rel_id, unit_name, unit_data)
 
     def test_ceph_nfs_connected_not_emitted(self):
@@ -520,6 +522,149 @@ class TestCephNfsClientProvides(testbase.TestBaseCharm):
         self.get_named_key.assert_called_once_with("client.another-app", caps)
         self.assertIsInstance(ceph_nfs_status.status, ActiveStatus)
 
+    def test_placement_spreads_zones(self):
+        # foo1 and foo2 share a zone, so the cluster should skip foo2.
+        self.harness.set_leader()
+        unit_data = {
+            "public-address": "pub-addr-1",
+            "microceph/1": "foo1",
+        }
+        rel_id = self.add_complete_peer_relation(self.harness, unit_data)
+        self._add_peer_unit(rel_id, 1, zone="az1")
+        self._add_peer_unit(rel_id, 2, zone="az1")
+        self._add_peer_unit(rel_id, 3, zone="az2")
+        self._add_peer_unit(rel_id, 4, zone="az3")
+
+        self.add_ceph_nfs_relation(self.harness)
+
+        self.assertEqual(
+            sorted(c.args[0] for c in self.enable_nfs.call_args_list), ["foo1", "foo3", "foo4"]
+        )
+
+    def test_placement_prefers_least_loaded(self):
+        self.harness.set_leader()
+        self.harness.update_config({"nfs-cluster-size": 1})
+        unit_data = {
+            "public-address": "pub-addr-1",
+            "microceph/1": "foo1",
+        }
+        rel_id = self.add_complete_peer_relation(self.harness, unit_data)
+        self._add_peer_unit(rel_id, 1)
+        self._add_peer_unit(rel_id, 2)
+        self.list_services.return_value += [
+            {"service": "rgw", "location": "foo1"},
+            {"service": "mds", "location": "foo1"},
+        ]
+
+        self.add_ceph_nfs_relation(self.harness)
+
+        self.enable_nfs.assert_called_once_with("foo2", "manila-cephfs", "nfs-addr-2")
+
+    def test_placement_moves_to_new_zone(self):
+        # A full cluster crowded in one zone moves a member to a new zone.
+        self.harness.set_leader()
+        self.harness.update_config({"nfs-cluster-size": 2})
+        unit_data = {
+            "public-address": "pub-addr-1",
+            "microceph/1": "foo1",
+        }
+        rel_id = self.add_complete_peer_relation(self.harness, unit_data)
+        self._add_peer_unit(rel_id, 1, zone="az1")
+        self._add_peer_unit(rel_id, 2, zone="az1")
+        self.add_ceph_nfs_relation(self.harness)
+        self.disable_nfs.assert_not_called()
+
+        self._add_peer_unit(rel_id, 3, zone="az2")
+
+        self.enable_nfs.assert_called_with("foo3", "manila-cephfs", "nfs-addr-3")
+        self.disable_nfs.assert_called_once_with("foo2", "manila-cephfs")
+
+    def test_placement_holds_back_moves_until_settled(self):
+        # Only one member moves at a time, the next once clients failed over.
+        self.harness.set_leader()
+        unit_data = {
+            "public-address": "pub-addr-1",
+            "microceph/1": "foo1",
+        }
+        rel_id = self.add_complete_peer_relation(self.harness, unit_data)
+        for number in (1, 2, 3):
+            self._add_peer_unit(rel_id, number, zone="az1")
+        self.add_ceph_nfs_relation(self.harness)
+
+        self._add_peer_unit(rel_id, 4, zone="az2")
+        self.enable_nfs.assert_called_with("foo4", "manila-cephfs", "nfs-addr-4")
+        self.disable_nfs.assert_called_once()
+
+        self._add_peer_unit(rel_id, 5, zone="az3")
+        self.disable_nfs.assert_called_once()
+
+        settled = ceph_nfs.time.time() + ceph_nfs.NFS_MOVE_SETTLE_TIME
+        with patch("ceph_nfs.time.time", return_value=settled):
+            self._add_peer_unit(rel_id, 6, zone="az1")
+        self.enable_nfs.assert_called_with("foo5", "manila-cephfs", "nfs-addr-5")
+        self.assertEqual(self.disable_nfs.call_count, 2)
+
+    def test_placement_move_keeps_member_if_new_host_fails(self):
+        self.harness.set_leader()
+        self.harness.update_config({"nfs-cluster-size": 2})
+        unit_data = {
+            "public-address": "pub-addr-1",
+            "microceph/1": "foo1",
+        }
+        rel_id = self.add_complete_peer_relation(self.harness, unit_data)
+        self._add_peer_unit(rel_id, 1, zone="az1")
+        self._add_peer_unit(rel_id, 2, zone="az1")
+        self.add_ceph_nfs_relation(self.harness)
+
+        self.enable_nfs.side_effect = Exception("enable failed")
+        self._add_peer_unit(rel_id, 3, zone="az2")
+
+        self.enable_nfs.assert_called_with("foo3", "manila-cephfs", "nfs-addr-3")
+        self.disable_nfs.assert_not_called()
+
+    def test_reconcile_uses_single_snapshot(self):
+        # All the relations are reconciled against one view of the cluster.
+        self.harness.set_leader()
+        unit_data = {
+            "public-address": "pub-addr-1",
+            "microceph/1": "foo1",
+        }
+        rel_id = self.add_complete_peer_relation(self.harness, unit_data)
+        for number in range(1, 5):
+            self._add_peer_unit(rel_id, number)
+
+        first_rel_id = self.add_ceph_nfs_relation(self.harness)
+        second_rel_id = self.add_ceph_nfs_relation(self.harness, "another-app")
+
+        self.list_services.reset_mock()
+        self.list_fs_volumes.reset_mock()
+        self.get_mon_addresses.reset_mock()
+        self.get_fsid.reset_mock()
+        self.enable_nfs.reset_mock()
+        self.run_cmd.reset_mock()
+
+        event = MagicMock()
+        self.harness.charm.ceph_nfs._on_ceph_nfs_reconcile(event)
+
+        self.list_services.assert_called_once()
+        self.list_fs_volumes.assert_called_once()
+        self.get_mon_addresses.assert_called_once()
+        self.get_fsid.assert_called_once()
+        self.assertEqual(
+            self.run_cmd.call_args_list,
+            [
+                call(cmd=["microceph.ceph", "mgr", "module", "enable", "microceph"]),
+                call(["microceph.ceph", "orch", "set", "backend", "microceph"]),
+            ],
+        )
+        # Placement is already satisfied, nothing new is enabled.
+        self.enable_nfs.assert_not_called()
+        event.defer.assert_not_called()
+
+        for nfs_rel_id in (first_rel_id, second_rel_id):
+            rel_data = self.harness.get_relation_data(nfs_rel_id, self.harness.model.app)
+            self.assertEqual('["foo.lish"]', rel_data.get("mon_hosts"))
+
     def test_ceph_nfs_departed_inert_on_whole_app_teardown(self):
         """ceph-nfs departed cleanup must not run while the whole app is being removed.
 
@@ -18,7 +18,7 @@ import ipaddress
 import json
 from pathlib import Path
 from subprocess import CalledProcessError, TimeoutExpired
-from unittest.mock import MagicMock, PropertyMock, call, mock_open, patch
+from unittest.mock import ANY, MagicMock, PropertyMock, call, mock_open, patch
 
 import ops_sunbeam.guard as sunbeam_guard
 import ops_sunbeam.test_utils as test_utils
@@ -659,9 +659,9 @@ class TestCharm(testbase.TestBaseCharm):
             "rgw_keystone_verify_ssl", str(False).lower(), True
         )
 
-    @patch("utils.subprocess")
+    @patch("utils.run_cmd_streaming")
     @patch("ceph.check_output")
-    def test_add_osds_action_with_device_id(self, _chk, subprocess):
+    def test_add_osds_action_with_device_id(self, _chk, run_cmd_streaming):
         """Test action add_osds."""
         test_utils.add_complete_peer_relation(self.harness)
         self.harness._charm.peers.interface.state.joined = True
@@ -672,44 +672,39 @@ class TestCharm(testbase.TestBaseCharm):
 
         action_event.set_results.assert_called()
         action_event.fail.assert_not_called()
-        subprocess.run.assert_called_with(
-            ["microceph", "disk", "add", "/dev/sdb"],
-            capture_output=True,
-            text=True,
-            check=True,
-            timeout=900,
+        run_cmd_streaming.assert_called_with(
+            ["microceph", "disk", "add", "/dev/sdb"], timeout=900, on_line=ANY
         )
 
-    @patch("utils.subprocess")
+    @patch("utils.run_cmd_streaming")
     @patch("ceph.check_output")
-    def test_add_osds_action_with_already_added_device_id(self, _chk, subprocess):
+    def test_add_osds_action_with_already_added_device_id(self, _chk, run_cmd_streaming):
         """Test action add_osds."""
         test_utils.add_complete_peer_relation(self.harness)
         self.harness._charm.peers.interface.state.joined = True
 
         disk = "/dev/sdb"
         error = 'Error: failed to record disk: This "disks" entry already exists\n'
-        result = {"result": [{"spec": disk, "status": "failure", "message": error}]}
-        subprocess.CalledProcessError = CalledProcessError
-        subprocess.run.side_effect = CalledProcessError(returncode=1, cmd=["echo"], stderr=error)
+        result = {
+            "result": [{"spec": disk, "status": "failure", "message": error, "duration": ANY}]
+        }
+        run_cmd_streaming.side_effect = CalledProcessError(
+            returncode=1, cmd=["echo"], stderr=error
+        )
 
         action_event = MagicMock()
         action_event.params = {"device-id": disk}
         self.harness.charm.storage._add_osd_action(action_event)
 
-        subprocess.run.assert_called_with(
-            ["microceph", "disk", "add", disk],
-            capture_output=True,
-            text=True,
-            check=True,
-            timeout=900,
+        run_cmd_streaming.assert_called_with(
+            ["microceph", "disk", "add", disk], timeout=900, on_line=ANY
         )
         action_event.set_results.assert_called_with(result)
         action_event.fail.assert_called()
 
-    @patch("utils.subprocess")
+    @patch("utils.run_cmd_streaming")
     @patch("ceph.check_output")
-    def test_add_osds_action_with_loop_spec(self, _chk, subprocess):
+    def test_add_osds_action_with_loop_spec(self, _chk, run_cmd_streaming):
         """Test action add_osds with loop file spec."""
         test_utils.add_complete_peer_relation(self.harness)
         self.harness._charm.peers.interface.state.joined = True
@@ -720,13 +715,147 @@ class TestCharm(testbase.TestBaseCharm):
 
         action_event.set_results.assert_called()
         action_event.fail.assert_not_called()
-        subprocess.run.assert_called_with(
-            ["microceph", "disk", "add", "loop,4G,3"],
-            capture_output=True,
-            text=True,
-            check=True,
-            timeout=900,
+        run_cmd_streaming.assert_called_with(
+            ["microceph", "disk", "add", "loop,4G,3"], timeout=900, on_line=ANY
+        )
+
+    @patch("ceph.osd_flags")
+    @patch("microceph.add_osd_cmd")
+    @patch("ceph.check_output")
+    def test_add_osds_action_parallel(self, _chk, add_osd_cmd, osd_flags):
+        """Test action add_osds enrolls several disks concurrently."""
+        test_utils.add_complete_peer_relation(self.harness)
+        self.harness._charm.peers.interface.state.joined = True
+
+        def _add(spec, wipe, encrypt, on_line):
+            on_line("Adding")
+            if spec == "/dev/sdc":
+                raise CalledProcessError(1, ["microceph"], stderr="boom")
+
+        add_osd_cmd.side_effect = _add
+        action_event = MagicMock()
+        action_event.params = {
+            "device-id": "/dev/sdb,/dev/sdc,/dev/sdd",
+            "parallelism": 3,
+            "norebalance": True,
+        }
+        self.harness.charm.storage._add_osd_action(action_event)
+
+        osd_flags.assert_called_once_with("norebalance")
+        self.assertEqual(add_osd_cmd.call_count, 3)
+        # The disk add output and one line per enrolled spec.
+        self.assertEqual(action_event.log.call_count, 6)
+        action_event.log.assert_any_call("/dev/sdc: Adding")
+        results = action_event.set_results.call_args[0][0]["result"]
+        # Results keep the order of the requested specs.
+        self.assertEqual(
+            [(r["spec"], r["status"]) for r in results],
+            [("/dev/sdb", "success"), ("/dev/sdc", "failure"), ("/dev/sdd", "success")],
+        )
+        self.assertTrue(all("duration" in r for r in results))
+        action_event.fail.assert_called_once()
+
+    @patch("storage.time.sleep")
+    @patch("storage.ceph")
+    @patch("microceph.remove_disk_cmd")
+    @patch("microceph.list_disk_cmd")
+    def test_decommission_osds_action(self, list_disk_cmd, remove_disk_cmd, ceph, _sleep):
+        """Draining takes the OSDs together and removes them once their PGs moved off."""
+        test_utils.add_complete_peer_relation(self.harness)
+        self.harness._charm.peers.interface.state.joined = True
+        list_disk_cmd.return_value = {
+            "ConfiguredDisks": [{"osd": 1}, {"osd": 3}, {"osd": 4}],
+            "AvailableDisks": [],
+        }
+        ceph.get_osd_weight.side_effect = lambda name: {"osd.3": 3.6, "osd.4": 1.8}[name]
+        ceph.get_osd_pg_counts.side_effect = [{1: 60, 3: 12, 4: 9}, {1: 81, 3: 0, 4: 0}]
+        ceph.get_pg_state_counts.side_effect = [(70, 81), (81, 81)]
+
+        action_event = MagicMock()
+        action_event.params = {"osd-ids": "3,4", "timeout": 600}
+        self.harness.charm.storage._decommission_osds_action(action_event)
+
+        ceph.osd_flags.assert_called_once_with("norebalance")
+        ceph.set_osd_crush_weight.assert_has_calls([call(3, 0), call(4, 0)])
+        self.assertEqual(action_event.log.call_count, 2)
+        remove_disk_cmd.assert_has_calls([call(3, False), call(4, False)])
+        action_event.set_results.assert_called_with(
+            {"result": [{"osd": 3, "status": "success"}, {"osd": 4, "status": "success"}]}
         )
+        action_event.fail.assert_not_called()
+        self.assertEqual(dict(self.harness.charm.storage._stored.drained_osd_weights), {})
+
+    @patch("storage.ceph")
+    @patch("microceph.list_disk_cmd")
+    def test_decommission_osds_action_cancel(self, list_disk_cmd, ceph):
+        """Cancelling restores the weights recorded when the OSDs were drained."""
+        test_utils.add_complete_peer_relation(self.harness)
+        self.harness._charm.peers.interface.state.joined = True
+        list_disk_cmd.return_value = {"ConfiguredDisks": [{"osd": 3}], "AvailableDisks": []}
+        self.harness.charm.storage._stored.drained_osd_weights[3] = 3.6
+
+        action_event = MagicMock()
+        action_event.params = {"osd-ids": "3", "cancel": True}
+        self.harness.charm.storage._decommission_osds_action(action_event)
+
+        ceph.set_osd_crush_weight.assert_called_once_with(3, 3.6)
+        action_event.set_results.assert_called_with({"restored": [3]})
+        self.assertNotIn(3, self.harness.charm.storage._stored.drained_osd_weights)
+
+    @patch("storage.ceph")
+    @patch("microceph.list_disk_cmd")
+    def test_decommission_osds_action_foreign_osd(self, list_disk_cmd, ceph):
+        """Refuse OSDs of other units before anything is drained."""
+        test_utils.add_complete_peer_relation(self.harness)
+        self.harness._charm.peers.interface.state.joined = True
+        list_disk_cmd.return_value = {"ConfiguredDisks": [{"osd": 3}], "AvailableDisks": []}
+
+        action_event = MagicMock()
+        action_event.params = {"osd-ids": "3,9"}
+        self.harness.charm.storage._decommission_osds_action(action_event)
+
+        ceph.set_osd_crush_weight.assert_not_called()
+        action_event.fail.assert_called_once()
+
+    @patch("storage.ceph")
+    def test_benchmark_osds_action(self, ceph):
+        """Benchmark the OSDs, flag slow ones and report deltas on the next run."""
+        test_utils.add_complete_peer_relation(self.harness)
+        self.harness._charm.peers.interface.state.joined = True
+        ceph.get_osd_locations.return_value = {
+            osd: {"host": f"node-{osd % 2}", "device-class": "hdd"} for osd in range(4)
+        }
+        ceph.get_osds.return_value = [0, 1, 2, 3]
+        rates = {0: 150, 1: 155, 2: 160, 3: 40}
+        ceph.osd_bench.side_effect = lambda osd, *_: {
+            "iops": rates[osd] / 4,
+            "bytes_per_sec": rates[osd] * 1024**2,
+        }
+
+        action_event = MagicMock()
+        action_event.params = {
+            "host": "",
+            "total-bytes": 1073741824,
+            "block-size": 4194304,
+            "parallelism": 2,
+            "mad-threshold": 3.0,
+        }
+        self.harness.charm.storage._benchmark_osds_action(action_event)
+
+        results = action_event.set_results.call_args[0][0]
+        self.assertEqual(results["slow-osds"], [3])
+        self.assertEqual([r["osd"] for r in results["osds"]], [0, 1, 2, 3])
+        self.assertTrue(results["osds"][3]["slow"])
+        self.assertNotIn("mib-per-sec-delta", results["osds"][0])
+        action_event.fail.assert_not_called()
+
+        rates[3] = 150
+        action_event.params["host"] = "node-1"
+        self.harness.charm.storage._benchmark_osds_action(action_event)
+
+        results = action_event.set_results.call_args[0][0]
+        self.assertEqual([r["osd"] for r in results["osds"]], [1, 3])
+        self.assertEqual(results["osds"][1]["mib-per-sec-delta"], 110.0)
 
     @patch("utils.subprocess")
     @patch("ceph.check_output")
@@ -1107,6 +1236,48 @@ class TestCharm(testbase.TestBaseCharm):
         mock_get_disk_info.return_value = {"mountpoints": [None], "children": [{}]}
         self.assertFalse(microceph._is_block_device_enrollable("/dev/sda"))
 
+    @patch("ceph.plan_pg_budget")
+    def test_plan_pgs_action(self, plan_pg_budget):
+        """The PG budget is reported without touching any pool."""
+        plan = [{"pool": "rbd", "current": 32, "optimal": 128, "autoscale": "off"}]
+        plan_pg_budget.return_value = plan
+
+        action_event = MagicMock()
+        self.harness.charm._plan_pgs_action(action_event)
+
+        action_event.set_results.assert_called_once_with({"pools": plan})
+        action_event.fail.assert_not_called()
+
+    @patch("ceph.update_pool")
+    @patch("ceph.plan_pg_budget")
+    def test_apply_pg_budget(self, plan_pg_budget, update_pool):
+        """Only pools the autoscaler does not manage are resized."""
+        plan_pg_budget.return_value = [
+            {"pool": "rbd", "current": 32, "optimal": 128, "autoscale": "off"},
+            {"pool": "rgw", "current": 32, "optimal": 64, "autoscale": "on"},
+            {"pool": "meta", "current": 16, "optimal": 16, "autoscale": "warn"},
+        ]
+
+        self.harness.charm.apply_pg_budget()
+
+        update_pool.assert_called_once_with("admin", "rbd", {"pg_num": "128"})
+
+    @patch("ceph.record_cluster_simd")
+    @patch.object(charm.MicroCephCharm, "ready_for_service", return_value=True)
+    def test_record_cluster_simd(self, _ready, record_cluster_simd):
+        """The CPU features are recorded once every unit published its own."""
+        rel_id = self.harness.add_relation("peers", self.harness.charm.app.name)
+        self.harness.add_relation_unit(rel_id, "microceph/1")
+
+        with patch.object(self.harness.charm.peers, "get_all_unit_values") as unit_values:
+            unit_values.return_value = ["avx512"]
+            self.harness.charm.handle_config_leader_cluster_simd()
+            record_cluster_simd.assert_not_called()
+
+            unit_values.return_value = ["avx512", "avx2"]
+            self.harness.charm.handle_config_leader_cluster_simd()
+            record_cluster_simd.assert_called_once_with("admin", "avx2")
+
     def test_get_rgw_endpoints_action_node_not_bootstrapped(self):
         """Test action get_rgw_endpoints when node not bootstrapped."""
         test_utils.add_complete_peer_relation(self.harness)
@@ -14,12 +14,16 @@
 
 """Tests for the cluster module — ClusterNodes operations."""
 
+import json
+import os
 import subprocess
+import tempfile
 import unittest
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock, PropertyMock, call, patch
 
 import cluster
 import microceph
+from ceph import CephHealth
 
 
 class TestAddNodeToCluster(unittest.TestCase):
@@ -236,5 +240,452 @@ class TestJoinNodeToCluster(unittest.TestCase):
         )
 
 
+class TestOsdEnrollAdmission(unittest.TestCase):
+    """Tests for the cluster-wide OSD enrollment waves."""
+
+    def setUp(self):
+        self.units = []
+        for i in range(3):
+            unit = MagicMock()
+            unit.name = f"microceph/{i}"
+            self.units.append(unit)
+        self.relation = MagicMock()
+        self.relation.units = self.units[1:]
+        self.relation.data = {unit: {} for unit in self.units}
+        self.app_data = {}
+
+        model = MagicMock()
+        model.unit = self.units[0]
+        model.unit.is_leader.return_value = True
+        model.get_relation.return_value = self.relation
+        model.config = {"osd-enroll-concurrency": 1, "osd-enroll-flags": "norebalance"}
+        patcher = patch.object(
+            cluster.OsdEnrollAdmission, "model", new_callable=PropertyMock, return_value=model
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        with patch.object(cluster.ops.framework.Object, "__init__"):
+            self.admission = cluster.OsdEnrollAdmission.__new__(cluster.OsdEnrollAdmission)
+        self.admission.charm = MagicMock()
+        self.admission.charm.peers.get_app_data.side_effect = self.app_data.get
+        self.admission.charm.peers.set_app_data.side_effect = self.app_data.update
+        self.admission.charm.peers.set_unit_data.side_effect = self.relation.data[
+            self.units[0]
+        ].update
+
+    def _wave(self):
+        return json.loads(self.app_data[cluster.OSD_ENROLL_WAVE_KEY])
+
+    @patch("cluster.ceph")
+    def test_waves_are_capped_and_hold_flags(self, ceph):
+        ceph.get_osd_flags.return_value = set()
+        ceph.get_peering_pg_count.return_value = 0
+        for unit in self.units[1:]:
+            self.relation.data[unit]["osd-enroll-request"] = "eq(@type,'nvme')"
+
+        self.admission.reconcile()
+        self.assertEqual(self._wave()["units"], ["microceph/1"])
+        ceph.set_osd_flag.assert_called_once_with("norebalance")
+
+        # Nothing changes until microceph/1 reports back.
+        self.admission.reconcile()
+        self.assertEqual(self._wave()["id"], 1)
+
+        self.relation.data[self.units[1]].update(
+            {"osd-enroll-done": "1", "osd-enroll-request": ""}
+        )
+        self.admission.reconcile()
+        ceph.unset_osd_flag.assert_called_once_with("norebalance")
+        self.assertEqual(self._wave()["id"], 2)
+        self.assertEqual(self._wave()["units"], ["microceph/2"])
+
+    @patch("cluster.ceph")
+    def test_next_wave_waits_for_peering(self, ceph):
+        ceph.get_osd_flags.return_value = set()
+        ceph.get_peering_pg_count.return_value = 12
+        self.app_data[cluster.OSD_ENROLL_WAVE_KEY] = json.dumps(
+            {"id": 1, "state": "enrolling", "units": ["microceph/1"], "flags": []}
+        )
+        self.relation.data[self.units[1]]["osd-enroll-done"] = "1"
+        self.relation.data[self.units[2]]["osd-enroll-request"] = "eq(@type,'nvme')"
+
+        self.admission.reconcile()
+        self.assertEqual(self._wave()["state"], "settling")
+        ceph.get_peering_pg_count.assert_called_once_with()
+
+        ceph.get_peering_pg_count.return_value = 0
+        self.admission.reconcile()
+        self.assertEqual(self._wave()["id"], 2)
+        self.assertEqual(self._wave()["units"], ["microceph/2"])
+
+    @patch("cluster.ceph")
+    def test_leader_admits_itself(self, ceph):
+        ceph.get_osd_flags.return_value = {"norebalance"}
+
+        self.assertTrue(self.admission.acquire("eq(@type,'nvme')"))
+        # A flag set by the operator is neither set nor released by the wave.
+        self.assertEqual(self._wave()["flags"], [])
+
+        ceph.get_peering_pg_count.return_value = 0
+        self.admission.release()
+        self.assertEqual(self.relation.data[self.units[0]]["osd-enroll-done"], "1")
+        self.assertEqual(self._wave(), {"id": 1, "state": "idle"})
+        self.assertNotIn(call("norebalance"), ceph.unset_osd_flag.call_args_list)
+
+    @patch("cluster.ceph")
+    def test_disabling_releases_wave_flags(self, ceph):
+        self.app_data[cluster.OSD_ENROLL_WAVE_KEY] = json.dumps(
+            {"id": 3, "state": "enrolling", "units": ["microceph/1"], "flags": ["norebalance"]}
+        )
+        self.relation.data[self.units[0]]["osd-enroll-request"] = "eq(@type,'nvme')"
+        self.admission.model.config["osd-enroll-concurrency"] = 0
+
+        ceph.unset_osd_flag.side_effect = subprocess.CalledProcessError(1, "ceph")
+        self.admission._on_peers_changed(MagicMock())
+        self.assertEqual(self._wave()["flags"], ["norebalance"])
+
+        ceph.unset_osd_flag.side_effect = None
+        self.admission._on_peers_changed(MagicMock())
+        ceph.unset_osd_flag.assert_called_with("norebalance")
+        self.assertEqual(self.app_data[cluster.OSD_ENROLL_WAVE_KEY], "")
+        self.assertEqual(self.relation.data[self.units[0]]["osd-enroll-request"], "")
+
+    def test_disabled_always_admits(self):
+        self.admission.model.config["osd-enroll-concurrency"] = 0
+        self.assertTrue(self.admission.acquire("eq(@type,'nvme')"))
+        self.admission.charm.peers.set_unit_data.assert_not_called()
+
+
+class TestUpgradePlan(unittest.TestCase):
+    """Tests for upgrading nodes by failure domain."""
+
+    def setUp(self):
+        self.units = []
+        for i in range(5):
+            unit = MagicMock()
+            unit.name = f"microceph/{i}"
+            self.units.append(unit)
+        self.relation = MagicMock()
+        self.relation.units = self.units[1:]
+        self.relation.data = {unit: {unit.name: f"node-{i}"} for i, unit in enumerate(self.units)}
+
+        self.model = MagicMock()
+        self.model.unit = self.units[0]
+        self.model.get_relation.return_value = self.relation
+        self.model.config = {"upgrade-by-failure-domain": True}
+        patcher = patch.object(
+            cluster.ClusterUpgrades, "model", new_callable=PropertyMock, return_value=self.model
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        with patch.object(cluster.ops.framework.Object, "__init__"):
+            self.upgrades = cluster.ClusterUpgrades.__new__(cluster.ClusterUpgrades)
+        self.upgrades.charm = MagicMock()
+        self.app_data = {}
+        self.upgrades.charm.peers.get_app_data.side_effect = self.app_data.get
+
+    def _crush(self, ceph, racks, pool_domains=("rack",)):
+        """Place hosts in racks under the default root."""
+        ceph.get_host_buckets.return_value = {
+            host: [("host", host), ("rack", rack), ("root", "default")]
+            for host, rack in racks.items()
+        }
+        ceph.get_host_failure_domain.side_effect = lambda chain: chain[1]
+        ceph.get_pool_failure_domains.return_value = set(pool_domains)
+
+    def test_plan_upgrade_batches(self):
+        domains = {"a/1": "rack1", "a/2": "rack1", "a/3": "rack1", "b/1": "rack2"}
+        self.assertEqual(
+            cluster.plan_upgrade_batches(domains, [], 1),
+            [["a/1", "a/2", "a/3"], ["b/1"]],
+        )
+        # No more mons than may be down at once share a batch.
+        self.assertEqual(
+            cluster.plan_upgrade_batches(domains, ["a/1", "a/3", "b/1"], 1),
+            [["a/1", "a/2"], ["a/3"], ["b/1"]],
+        )
+
+    @patch("cluster.ceph")
+    def test_plan_upgrade_by_crush_bucket(self, ceph):
+        self._crush(
+            ceph, {"node-1": "rack1", "node-2": "rack1", "node-3": "rack2", "node-4": "rack2"}
+        )
+        ceph.get_mon_quorum.return_value = (["node-0", "node-1", "node-2"], [])
+
+        self.assertEqual(
+            self.upgrades.plan_upgrade([u.name for u in self.units[1:]]),
+            [["microceph/1"], ["microceph/2"], ["microceph/3", "microceph/4"]],
+        )
+
+    @patch("cluster.ceph")
+    def test_plan_upgrade_by_zone(self, ceph):
+        self._crush(ceph, {"node-1": "az0", "node-2": "az1", "node-3": "az0", "node-4": "az1"})
+        ceph.get_mon_quorum.return_value = (["node-0"], ["node-0"])
+        for i, unit in enumerate(self.units[1:]):
+            self.relation.data[unit]["availability-zone"] = f"az{i % 2}"
+        nodes = [u.name for u in self.units[1:]]
+
+        self.app_data["cluster_uses_az"] = "true"
+        self.assertEqual(
+            self.upgrades.plan_upgrade(nodes),
+            [["microceph/1", "microceph/3"], ["microceph/2", "microceph/4"]],
+        )
+
+        # A zone without a CRUSH bucket cannot be upgraded at once.
+        self.relation.data[self.units[1]]["availability-zone"] = "az9"
+        self.assertEqual(self.upgrades.plan_upgrade(nodes), [[node] for node in nodes])
+
+    @patch("cluster.ceph")
+    def test_plan_upgrade_ignores_zone_without_az_cluster(self, ceph):
+        # The Juju zones disagree with CRUSH, which places every host alone.
+        ceph.get_host_buckets.return_value = {
+            f"node-{i}": [("host", f"node-{i}"), ("root", "default")] for i in range(5)
+        }
+        ceph.get_host_failure_domain.side_effect = lambda chain: chain[0]
+        ceph.get_pool_failure_domains.return_value = {"host"}
+        ceph.get_mon_quorum.return_value = (["node-0"], ["node-0"])
+        for unit in self.units[1:]:
+            self.relation.data[unit]["availability-zone"] = "az0"
+
+        nodes = [u.name for u in self.units[1:]]
+        self.assertEqual(self.upgrades.plan_upgrade(nodes), [[node] for node in nodes])
+
+    @patch("cluster.ceph")
+    def test_plan_upgrade_checks_pool_failure_domains(self, ceph):
+        # A pool spreading replicas across hosts may keep two in one rack.
+        self._crush(
+            ceph,
+            {"node-1": "rack1", "node-2": "rack1", "node-3": "rack2", "node-4": "rack2"},
+            pool_domains=("rack", "host"),
+        )
+        ceph.get_mon_quorum.return_value = (["node-0"], ["node-0"])
+
+        nodes = [u.name for u in self.units[1:]]
+        with self.assertLogs(cluster.logger, "WARNING"):
+            self.assertEqual(self.upgrades.plan_upgrade(nodes), [[node] for node in nodes])
+
+    @patch("cluster.ceph")
+    def test_plan_upgrade_sequential(self, ceph):
+        nodes = [u.name for u in self.units[1:]]
+        self.model.config["upgrade-by-failure-domain"] = False
+        self.assertEqual(self.upgrades.plan_upgrade(nodes), [[node] for node in nodes])
+
+        # Planning errors fall back to upgrading one node at a time.
+        self.model.config["upgrade-by-failure-domain"] = True
+        ceph.get_mon_quorum.side_effect = subprocess.CalledProcessError(1, "quorum_status")
+        self.assertEqual(self.upgrades.plan_upgrade(nodes), [[node] for node in nodes])
+
+    @patch("cluster.gethostname", return_value="node-0")
+    @patch("cluster.ceph")
+    def test_wait_mon_quorum_safe(self, ceph, _hostname):
+        mons = ["node-0", "node-1", "node-2"]
+        ceph.get_mon_quorum.return_value = (mons, mons)
+        self.upgrades._wait_mon_quorum_safe()
+
+        # node-1 is already down, restarting node-0 would lose quorum.
+        ceph.get_mon_quorum.return_value = (mons, ["node-0", "node-2"])
+        with patch.object(cluster.tenacity, "stop_after_delay", return_value=lambda _: True):
+            with self.assertRaises(cluster.sunbeam_guard.BlockedExceptionError):
+                self.upgrades._wait_mon_quorum_safe()
+
+    @patch("cluster.utils.run_cmd")
+    def test_prefetch(self, run_cmd):
+        with tempfile.TemporaryDirectory() as tmp:
+            with patch("cluster.UPGRADE_STAGING_DIR", tmp):
+                self.assertTrue(self.upgrades.prefetch("squid/stable"))
+                cmd = run_cmd.call_args.args[0]
+                self.assertEqual(cmd[:3], ["snap", "download", "microceph"])
+                self.assertIn("--channel=squid/stable", cmd)
+                self.assertIn("--basename=microceph_squid_stable", cmd)
+
+                # Staged snaps are installed before refreshing to the channel.
+                open(os.path.join(tmp, "microceph_squid_stable.snap"), "w").close()
+                run_cmd.reset_mock()
+                self.assertTrue(self.upgrades.prefetch("squid/stable"))
+                run_cmd.assert_not_called()
+                self.upgrades._install_staged("squid/stable")
+                run_cmd.assert_called_with(
+                    ["snap", "install", os.path.join(tmp, "microceph_squid_stable.snap")],
+                    timeout=900,
+                )
+                self.upgrades._clear_staged()
+                self.assertEqual(os.listdir(tmp), [])
+
+    @patch("cluster.ceph")
+    @patch("cluster.utils.run_cmd", side_effect=subprocess.CalledProcessError(1, "snap"))
+    def test_prefetch_node_request_acks_failed_download(self, _run_cmd, ceph):
+        ceph.monitor_key_get.return_value = None
+        event = MagicMock(node="microceph/0", channel="squid/stable", nonce="n1")
+        with tempfile.TemporaryDirectory() as tmp:
+            with patch("cluster.UPGRADE_STAGING_DIR", tmp):
+                self.upgrades.prefetch_node_request(event)
+        set_unit_data = self.upgrades.charm.peers.interface.set_unit_data
+        set_unit_data.assert_called_with({"upgrade-prefetched": "n1"})
+        timeline = set_unit_data.call_args_list[-2].args[0]["upgrade-timeline"]
+        self.assertEqual(timeline[:5], '["n1"')
+        # The phases show in config-key before the hook ends.
+        ceph.monitor_key_set.assert_called_with(
+            "admin", "microceph-charm/upgrade-timeline/microceph-0", timeline
+        )
+
+    @patch("cluster.ceph")
+    def test_init_upgrade_publishes_prefetch_first(self, ceph):
+        ceph.monitor_key_get.return_value = None
+        peer_int = self.upgrades.charm.peers.interface
+        peer_int.all_joined_units.return_value = self.units[1:3]
+        with patch.object(self.upgrades, "prefetch") as prefetch:
+            self.upgrades.init_upgrade("squid/stable")
+            prefetch.assert_not_called()
+            _, kwargs = peer_int.set_upgrade_info.call_args
+            self.assertEqual(kwargs["phase"], "prefetch")
+            nonce = peer_int.set_upgrade_info.call_args.args[0]
+            peer_int.on.upgrade_prefetch.emit.assert_called_once_with(
+                node="microceph/0", channel="squid/stable", nonce=nonce
+            )
+
+            # This node downloads in the next hook, once the peers saw the phase.
+            event = MagicMock(node="microceph/0", channel="squid/stable", nonce=nonce)
+            self.upgrades.prefetch_node_request(event)
+            event.defer.assert_called_once()
+            prefetch.assert_not_called()
+
+            self.upgrades._prefetch_published = ""
+            self.upgrades.prefetch_node_request(event)
+            prefetch.assert_called_once_with("squid/stable")
+        peer_int.set_unit_data.assert_called_with({"upgrade-prefetched": nonce})
+
+    def test_start_upgrade(self):
+        peer_int = self.upgrades.charm.peers.interface
+        peer_int.get_upgrade_info.return_value = {
+            "nonce": "n1",
+            "channel": "squid/stable",
+            "nodes": ["microceph/1", "microceph/2"],
+            "phase": "prefetch",
+        }
+        self.model.config["upgrade-by-failure-domain"] = False
+        event = MagicMock(channel="squid/stable", nonce="n1")
+        with patch.object(self.upgrades, "perform_upgrade") as perform_upgrade:
+            # The prefetch phase ends before this node upgrades, in the next hook.
+            self.upgrades.start_upgrade(event)
+            perform_upgrade.assert_not_called()
+            event.defer.assert_called_once()
+            peer_int.set_upgrade_info.assert_called_once_with(
+                "n1", "squid/stable", ["microceph/1", "microceph/2"], phase="leader"
+            )
+
+            peer_int.set_upgrade_info.reset_mock()
+            peer_int.get_upgrade_info.return_value["phase"] = "leader"
+            self.upgrades.start_upgrade(event)
+            perform_upgrade.assert_called_once_with("squid/stable", "n1")
+        peer_int.set_upgrade_info.assert_called_once_with(
+            "n1",
+            "squid/stable",
+            ["microceph/1", "microceph/2"],
+            [["microceph/1"], ["microceph/2"]],
+        )
+
+        # A stale start event does not upgrade again.
+        event.nonce = "n0"
+        with patch.object(self.upgrades, "perform_upgrade") as perform_upgrade:
+            self.upgrades.start_upgrade(event)
+            perform_upgrade.assert_not_called()
+
+    @patch("cluster.snap")
+    @patch("cluster.CephStatus")
+    @patch("cluster.subprocess.run", side_effect=subprocess.CalledProcessError(1, "pgrep"))
+    @patch("cluster.gethostname", return_value="node-0")
+    @patch("cluster.ceph")
+    def test_perform_upgrade_holds_noout(self, ceph, _hostname, _pgrep, ceph_status, snap):
+        ceph.get_host_failure_domains.return_value = {"node-0": "node-0"}
+        ceph.get_mon_quorum.return_value = (["node-0"], ["node-0"])
+        ceph.get_host_down_osds.side_effect = [[1], []]
+        ceph.get_misplaced_ratio.return_value = 0.0
+        ceph.get_remapped_pg_count.side_effect = [0, 4, 0, 0, 0]
+        ceph_status.return_value.ceph_health.return_value = (CephHealth.Ok, {})
+        events = []
+        ceph.host_osd_flags.return_value.__enter__.side_effect = lambda: events.append("set")
+        ceph.host_osd_flags.return_value.__exit__.side_effect = lambda *_: events.append("unset")
+        snap.SnapCache.return_value["microceph"].ensure.side_effect = lambda *_, **__: (
+            events.append("refresh")
+        )
+
+        with (
+            patch.object(cluster.tenacity, "wait_fixed", return_value=lambda _: 0),
+            patch.object(self.upgrades, "_install_staged"),
+            patch.object(self.upgrades, "_clear_staged"),
+        ):
+            self.upgrades.perform_upgrade("squid/stable")
+
+        ceph.host_osd_flags.assert_called_once_with("node-0", "noout")
+        self.assertEqual(events, ["set", "refresh", "unset"])
+        report = json.loads(
+            self.upgrades.charm.peers.interface.set_unit_data.call_args.args[0]["upgrade-report"]
+        )
+        self.assertTrue(report["noout"])
+        self.assertTrue(report["data-movement"])
+        self.assertEqual(report["max-remapped-pgs"], 4)
+
+    @patch("cluster.ceph")
+    def test_upgrade_status(self, ceph):
+        # microceph/2 is still upgrading, its phases so far are only in config-key.
+        live = {"microceph-charm/upgrade-timeline/microceph-2": '["n1",1230,0,0,0,null,null,null]'}
+        ceph.monitor_key_get.side_effect = lambda _, key: live.get(key)
+        self.relation.data[self.units[0]]["upgrade-timeline"] = '["n1",1000,0,5,5,65,85,115]'
+        self.relation.data[self.units[1]]["upgrade-timeline"] = '["n1",1000,0,7,115,175,195,225]'
+        self.relation.data[self.units[2]][
+            "upgrade-timeline"
+        ] = '["n0",500,0,7,null,null,null,null]'
+        self.upgrades.charm.peers.interface.get_upgrade_info.return_value = {
+            "nonce": "n1",
+            "channel": "squid/stable",
+            "nodes": ["microceph/2"],
+        }
+
+        status = self.upgrades.upgrade_status()
+
+        self.assertEqual(status["nonce"], "n1")
+        self.assertEqual(
+            [(n["node"], n["phase"]) for n in status["nodes"]],
+            [("microceph/0", "done"), ("microceph/1", "done"), ("microceph/2", "refresh-start")],
+        )
+        self.assertEqual(
+            [p["node"] for p in status["critical-path"]], ["microceph/0", "microceph/1"]
+        )
+        self.assertEqual(status["eta"], 110)
+
+    @patch("cluster.CephStatus")
+    def test_wait_healthy_aborts_on_policy(self, ceph_status):
+        self.model.config["upgrade-health-abort"] = "OSD_FULL"
+        ceph_status.return_value.ceph_health.return_value = (
+            CephHealth.Err,
+            {"OSD_FULL": {"summary": {"message": "1 full osd(s)"}}},
+        )
+        with patch.object(self.upgrades, "_sample_data_movement"):
+            with self.assertRaises(cluster.sunbeam_guard.BlockedExceptionError) as ctx:
+                self.upgrades._wait_healthy("microceph/0", "squid/stable", {})
+        self.assertIn("aborting on OSD_FULL (1 full osd(s))", str(ctx.exception))
+        ceph_status.return_value.ceph_health.assert_called_once()
+
+    @patch("cluster.CephStatus")
+    @patch("cluster.microceph.can_upgrade_snap", return_value=True)
+    def test_can_upgrade_ignores_allowed_checks(self, _can_upgrade, ceph_status):
+        self.model.config["upgrade-health-ignore"] = "PG_NOT_DEEP_SCRUBBED"
+        self.upgrades.charm.channel = "reef/stable"
+        checks = {"PG_NOT_DEEP_SCRUBBED": {"summary": {"message": "2 pgs not deep-scrubbed"}}}
+        ceph_status.return_value.ceph_health.return_value = (CephHealth.Warn, checks)
+        self.assertEqual(self.upgrades.can_upgrade_charm_payload("squid/stable"), (True, ""))
+
+        checks["MON_CLOCK_SKEW"] = {"summary": {"message": "clock skew detected"}}
+        ok, msg = self.upgrades.can_upgrade_charm_payload("squid/stable")
+        self.assertFalse(ok)
+        self.assertEqual(
+            msg,
+            f"{cluster.UPGRADE_HEALTH_BLOCKED_MSG_PREFIX}: HEALTH_WARN, waiting for "
+            "MON_CLOCK_SKEW (clock skew detected) to clear, ignoring PG_NOT_DEEP_SCRUBBED",
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,154 @@
+# Copyright 2025 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the host block device inventory."""
+
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import device_inventory
+import microceph
+
+LSBLK_OUTPUT = {
+    "blockdevices": [
+        {
+            "name": "sda",
+            "kname": "sda",
+            "path": "/dev/sda",
+            "type": "disk",
+            "serial": "SER-A",
+            "wwn": "0x5000c500a0a0a0a0",
+            "size": 480103981056,
+            "mountpoints": [None],
+            "children": [
+                {
+                    "name": "sda1",
+                    "kname": "sda1",
+                    "pkname": "sda",
+                    "path": "/dev/sda1",
+                    "type": "part",
+                    "serial": "SER-A",
+                    "mountpoints": ["/"],
+                }
+            ],
+        },
+        {
+            "name": "sdb",
+            "kname": "sdb",
+            "path": "/dev/sdb",
+            "type": "disk",
+            "serial": "SER-B",
+            "wwn": None,
+            "size": 4000787030016,
+            "mountpoints": [None],
+        },
+    ]
+}
+
+BY_ID = {"/dev/sdb": ["/dev/disk/by-id/ata-DISK-B"]}
+
+
+class TestDeviceInventory(unittest.TestCase):
+
+    def setUp(self):
+        self.inventory = device_inventory.DeviceInventory(LSBLK_OUTPUT["blockdevices"], BY_ID)
+
+    def test_lookup_keys(self):
+        for key in ("sdb", "/dev/sdb", "/dev/disk/by-id/ata-DISK-B", "SER-B"):
+            self.assertEqual(self.inventory.get(key)["kname"], "sdb", key)
+        self.assertEqual(self.inventory.get("0x5000c500a0a0a0a0")["kname"], "sda")
+
+    def test_partition_does_not_shadow_disk_serial(self):
+        self.assertEqual(self.inventory.get("SER-A")["kname"], "sda")
+        self.assertEqual(self.inventory.get("/dev/sda1")["kname"], "sda1")
+
+    @patch("device_inventory.os.path.realpath", return_value="/dev/sdb")
+    def test_lookup_other_symlink(self, _realpath):
+        self.assertEqual(self.inventory.get("/dev/disk/by-path/pci-0-ata-2")["kname"], "sdb")
+
+    @patch("device_inventory.os.path.realpath", side_effect=lambda p: p)
+    def test_unknown_device(self, _realpath):
+        self.assertEqual(self.inventory.get("/dev/nope"), {})
+
+    def test_disks(self):
+        self.assertEqual([d["kname"] for d in self.inventory.disks()], ["sda", "sdb"])
+
+
+class TestFingerprint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        patcher = patch("device_inventory.SYS_BLOCK_DIR", self.tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _add_disk(self, name, size, serial=None):
+        os.makedirs(os.path.join(self.tmp.name, name, "device"))
+        with open(os.path.join(self.tmp.name, name, "size"), "w") as f:
+            f.write(f"{size}\n")
+        if serial:
+            with open(os.path.join(self.tmp.name, name, "device", "serial"), "w") as f:
+                f.write(serial)
+
+    def test_fingerprint_changes_on_hotplug(self):
+        self._add_disk("sda", 100, "SER-A")
+        self._add_disk("loop0", 10)
+        before = device_inventory.fingerprint()
+
+        self._add_disk("loop1", 10)
+        self.assertEqual(before, device_inventory.fingerprint())
+
+        self._add_disk("sdb", 200)
+        self.assertNotEqual(before, device_inventory.fingerprint())
+
+
+class TestInventoryCache(unittest.TestCase):
+
+    def setUp(self):
+        device_inventory.invalidate_inventory()
+        self.addCleanup(device_inventory.invalidate_inventory)
+
+    @patch("device_inventory._read_by_id_links", return_value={})
+    @patch("device_inventory.utils.run_cmd")
+    def test_single_lsblk_per_hook(self, run_cmd, _by_id):
+        run_cmd.return_value = json.dumps(LSBLK_OUTPUT)
+
+        self.assertTrue(microceph._is_block_device_enrollable("/dev/sdb"))
+        self.assertFalse(microceph._is_block_device_enrollable("/dev/sda"))
+        self.assertEqual(microceph._get_disk_info("sdb")["serial"], "SER-B")
+
+        run_cmd.assert_called_once_with(["lsblk", "--json", "--bytes", "-O"])
+
+    @patch("device_inventory._read_by_id_links", return_value={})
+    @patch("utils.run_cmd")
+    def test_enrollment_invalidates(self, run_cmd, _by_id):
+        def _run_cmd(cmd, **kwargs):
+            return json.dumps(LSBLK_OUTPUT) if cmd[0] == "lsblk" else ""
+
+        run_cmd.side_effect = _run_cmd
+
+        microceph.enroll_disks_as_osds(["/dev/sdb"])
+        microceph._get_disk_info("/dev/sdb")
+
+        lsblk_calls = [c for c in run_cmd.call_args_list if c.args[0][0] == "lsblk"]
+        self.assertEqual(len(lsblk_calls), 2)
+        run_cmd.assert_any_call(["microceph", "disk", "add", "/dev/sdb"])
+
+
+if __name__ == "__main__":
+    unittest.main()
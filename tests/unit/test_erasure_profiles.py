@@ -0,0 +1,84 @@
+# Copyright 2025 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for erasure code profile recommendations."""
+
+import os
+import tempfile
+import unittest
+
+import erasure_profiles
+
+
+class TestProbeSimd(unittest.TestCase):
+    """Tests for probing the CPU's SIMD instruction sets."""
+
+    def _probe(self, *flags):
+        with tempfile.NamedTemporaryFile("w", delete=False) as f:
+            for cpu, cpu_flags in enumerate(flags):
+                f.write(f"processor\t: {cpu}\nflags\t\t: fpu sse4_2 {cpu_flags}\n\n")
+        self.addCleanup(os.unlink, f.name)
+        return erasure_profiles.probe_simd(f.name)
+
+    def test_probe(self):
+        self.assertEqual(self._probe("avx2 avx512f avx512bw"), "avx512")
+        self.assertEqual(self._probe("avx2 avx512f"), "avx2")
+        self.assertEqual(self._probe("avx"), "none")
+
+    def test_probe_hybrid_cpu(self):
+        self.assertEqual(self._probe("avx2 avx512f avx512bw", "avx2"), "avx2")
+
+    def test_probe_unreadable(self):
+        self.assertEqual(erasure_profiles.probe_simd("/nonexistent/cpuinfo"), "none")
+
+    def test_lowest_simd(self):
+        self.assertEqual(erasure_profiles.lowest_simd(["avx512", "avx2", "avx512"]), "avx2")
+        self.assertEqual(erasure_profiles.lowest_simd(["avx512", "unknown"]), "unknown")
+        self.assertEqual(erasure_profiles.lowest_simd([]), "none")
+
+
+class TestRecommendErasureProfile(unittest.TestCase):
+    """Tests for the erasure profile recommendations."""
+
+    def test_recommend_chunks(self):
+        for domains, expected in (
+            (3, (2, 1)),
+            (4, (2, 1)),
+            (5, (2, 2)),
+            (8, (5, 2)),
+            (20, (8, 2)),
+        ):
+            with self.subTest(domains=domains):
+                self.assertEqual(erasure_profiles.recommend_chunks(domains), expected)
+        with self.assertRaises(ValueError):
+            erasure_profiles.recommend_chunks(2)
+
+    def test_plugin_follows_cpu(self):
+        profile = erasure_profiles.recommend_erasure_profile("avx2", 4)
+        self.assertEqual(profile, {"plugin": "isa", "technique": "reed_sol_van", "k": 2, "m": 1})
+        profile = erasure_profiles.recommend_erasure_profile("none", 4, stripe_unit=65536)
+        self.assertEqual(profile["plugin"], "jerasure")
+        self.assertEqual(profile["stripe_unit"], 65536)
+
+    def test_requested_settings_kept(self):
+        profile = erasure_profiles.recommend_erasure_profile(
+            "avx512", 2, plugin="isa", data_chunks=6, coding_chunks=6
+        )
+        self.assertEqual(profile, {"plugin": "isa", "technique": "cauchy", "k": 6, "m": 6})
+        profile = erasure_profiles.recommend_erasure_profile("avx512", 6, plugin="lrc")
+        self.assertIsNone(profile["technique"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+# Copyright 2025 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the upgrade health policy."""
+
+import unittest
+
+import health_policy
+from ceph import CephHealth
+
+CHECKS = {
+    "POOL_NO_REDUNDANCY": {"summary": {"message": "1 pool(s) have no replicas configured"}},
+    "OSDMAP_FLAGS": {"summary": {"message": "noout flag(s) set"}},
+}
+
+
+class TestHealthPolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = health_policy.HealthPolicy.from_config(
+            {
+                "upgrade-health-ignore": "pool_no_redundancy, PG_NOT_DEEP_SCRUBBED",
+                "upgrade-health-abort": "OSD_FULL",
+            }
+        )
+
+    def test_from_config(self):
+        self.assertEqual(
+            self.policy.ignore, frozenset({"POOL_NO_REDUNDANCY", "PG_NOT_DEEP_SCRUBBED"})
+        )
+        self.assertEqual(self.policy.abort, frozenset({"OSD_FULL"}))
+        self.assertEqual(health_policy.HealthPolicy.from_config({}), health_policy.HealthPolicy())
+
+    def test_ok(self):
+        self.assertTrue(self.policy.evaluate(CephHealth.Ok, {}).ok)
+
+    def test_ignored_checks_proceed(self):
+        verdict = self.policy.evaluate(
+            CephHealth.Warn, {"POOL_NO_REDUNDANCY": CHECKS["POOL_NO_REDUNDANCY"]}
+        )
+        self.assertEqual(verdict.decision, health_policy.PROCEED)
+        self.assertEqual(verdict.reason, "HEALTH_WARN, ignoring POOL_NO_REDUNDANCY")
+
+    def test_other_checks_wait(self):
+        verdict = self.policy.evaluate(CephHealth.Warn, CHECKS)
+        self.assertEqual(verdict.decision, health_policy.WAIT)
+        self.assertEqual(
+            verdict.reason,
+            "HEALTH_WARN, waiting for OSDMAP_FLAGS (noout flag(s) set) to clear, "
+            "ignoring POOL_NO_REDUNDANCY",
+        )
+
+    def test_abort(self):
+        checks = dict(CHECKS, OSD_FULL={"summary": {"message": "1 full osd(s)"}})
+        verdict = self.policy.evaluate(CephHealth.Err, checks)
+        self.assertEqual(verdict.decision, health_policy.ABORT)
+        self.assertEqual(verdict.reason, "HEALTH_ERR, aborting on OSD_FULL (1 full osd(s))")
+
+    def test_unknown_health_waits(self):
+        verdict = self.policy.evaluate(
+            CephHealth.Unknown, "fault running ceph health detail command"
+        )
+        self.assertEqual(verdict.decision, health_policy.WAIT)
+        self.assertIn("fault running", verdict.reason)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -533,6 +533,14 @@ class TestMicroCeph(unittest.TestCase):
         microceph.add_osd_cmd("loop,4G,3")
         run_cmd.assert_called_with(["microceph", "disk", "add", "loop,4G,3"], timeout=900)
 
+    @patch("utils.run_cmd_streaming")
+    def test_add_osd_cmd_streams_output(self, run_cmd_streaming):
+        on_line = lambda line: None  # noqa: E731
+        microceph.add_osd_cmd("/dev/sdb", on_line=on_line)
+        run_cmd_streaming.assert_called_once_with(
+            ["microceph", "disk", "add", "/dev/sdb"], timeout=900, on_line=on_line
+        )
+
     @patch("utils.run_cmd")
     def test_add_osd_cmd_with_wal(self, run_cmd):
         # Test with WAL device
@@ -681,7 +689,8 @@ class TestMicroCeph(unittest.TestCase):
             ],
             timeout=900,
         )
-        setup_dm_crypt.assert_called_once_with()
+        # Dry runs leave dm-crypt alone.
+        setup_dm_crypt.assert_not_called()
 
     @patch("microceph._setup_dm_crypt")
     @patch("utils.run_cmd")
@@ -720,6 +729,143 @@ class TestMicroCeph(unittest.TestCase):
                 setup_dm_crypt.assert_called_once_with()
                 run_cmd.assert_called_once()
 
+    @patch("utils.run_cmd")
+    @patch("utils.run_cmd_streaming", return_value="tail")
+    def test_add_disk_match_cmd_streams_output(self, run_cmd_streaming, run_cmd):
+        """With an output callback, enrollment output is streamed."""
+        on_line = lambda line: None  # noqa: E731
+        self.assertEqual(microceph.add_disk_match_cmd("eq(@type,'nvme')", on_line=on_line), "tail")
+        run_cmd_streaming.assert_called_once_with(
+            ["microceph", "disk", "add", "--osd-match", "eq(@type,'nvme')"],
+            timeout=900,
+            on_line=on_line,
+        )
+
+        # Dry runs return the whole output.
+        microceph.add_disk_match_cmd("eq(@type,'nvme')", dry_run=True, on_line=on_line)
+        run_cmd.assert_called_once()
+
+    def test_disk_add_data_devices(self):
+        """Only the OSD data devices of disk add output are taken."""
+        output = (
+            "+--------------------------------+---------+\n"
+            "|              PATH              | STATUS  |\n"
+            "+--------------------------------+---------+\n"
+            "| /dev/sdc                       | Success |\n"
+            "| /dev/disk/by-id/nvme-eui.0001  | Success |\n"
+            "+--------------------------------+---------+\n"
+            "/dev/sdb would be added\n"
+            "  wal: /dev/nvme0n1p1\n"
+            "  DB: /dev/nvme0n1p2\n"
+            "/dev/sdd with db /dev/nvme0n1p3\n"
+        )
+        self.assertEqual(
+            microceph.disk_add_data_devices(output),
+            ["/dev/disk/by-id/nvme-eui.0001", "/dev/sdb", "/dev/sdc", "/dev/sdd"],
+        )
+        self.assertEqual(microceph.disk_add_data_device("| wal | /dev/nvme0n1p1 |"), "")
+        self.assertEqual(microceph.disk_add_data_devices(None), [])
+
+    @patch("utils.run_cmd")
+    def test_dm_crypt_slot(self, run_cmd):
+        """The dm-crypt plug connection is read from snap connections."""
+        header = "Interface      Plug                     Slot            Notes\n"
+        run_cmd.return_value = (
+            header + "block-devices  microceph:block-devices  :block-devices  manual\n"
+            "dm-crypt       microceph:dm-crypt       :dm-crypt       manual\n"
+        )
+        self.assertEqual(microceph._dm_crypt_slot(), ":dm-crypt")
+        run_cmd.assert_called_once_with(["snap", "connections", "microceph"])
+
+        run_cmd.return_value = header + "dm-crypt       microceph:dm-crypt       -  -\n"
+        self.assertEqual(microceph._dm_crypt_slot(), "")
+
+
+class TestPrepareDmCrypt(unittest.TestCase):
+    """Tests for the per snap revision and boot dm-crypt readiness cache."""
+
+    def setUp(self):
+        microceph.set_dm_crypt_ready_key("")
+        self.addCleanup(microceph.set_dm_crypt_ready_key, "")
+        patcher = patch("microceph._boot_id", return_value="boot-1")
+        self.boot_id = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("microceph.os.path.isdir", return_value=True)
+        self.isdir = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("microceph._dm_crypt_slot", return_value=":dm-crypt")
+        self.dm_crypt_slot = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch("microceph._setup_dm_crypt")
+    @patch("microceph.snap_revision", return_value="1234")
+    def test_setup_once_per_revision(self, snap_revision, setup_dm_crypt):
+        microceph.prepare_dm_crypt()
+        microceph.prepare_dm_crypt()
+        setup_dm_crypt.assert_called_once_with()
+        self.assertEqual(microceph.dm_crypt_ready_key(), "1234:boot-1:dm-crypt")
+
+        # A refreshed snap needs the plug checked again.
+        snap_revision.return_value = "1300"
+        microceph.prepare_dm_crypt()
+        self.assertEqual(setup_dm_crypt.call_count, 2)
+        self.assertEqual(microceph.dm_crypt_ready_key(), "1300:boot-1:dm-crypt")
+
+    @patch("microceph._setup_dm_crypt")
+    @patch("microceph.snap_revision", return_value="1234")
+    def test_setup_again_after_reboot(self, _snap_revision, setup_dm_crypt):
+        microceph.set_dm_crypt_ready_key("1234:boot-0:dm-crypt")
+        microceph.prepare_dm_crypt()
+        setup_dm_crypt.assert_called_once_with()
+        self.assertEqual(microceph.dm_crypt_ready_key(), "1234:boot-1:dm-crypt")
+
+    @patch("microceph._setup_dm_crypt")
+    @patch("microceph.snap_revision", return_value="1234")
+    def test_setup_again_when_module_unloaded(self, _snap_revision, setup_dm_crypt):
+        microceph.set_dm_crypt_ready_key("1234:boot-1:dm-crypt")
+        self.isdir.return_value = False
+        microceph.prepare_dm_crypt()
+        setup_dm_crypt.assert_called_once_with()
+        self.isdir.assert_called_with(microceph.DM_CRYPT_MODULE_PATH)
+
+    @patch("microceph._setup_dm_crypt")
+    @patch("microceph.snap_revision", return_value="1234")
+    def test_seeded_key_skips_setup(self, _snap_revision, setup_dm_crypt):
+        microceph.set_dm_crypt_ready_key("1234:boot-1:dm-crypt")
+        microceph.prepare_dm_crypt()
+        setup_dm_crypt.assert_not_called()
+
+    @patch("microceph._setup_dm_crypt")
+    @patch("microceph.snap_revision", return_value="1234")
+    def test_setup_again_when_plug_disconnected(self, _snap_revision, setup_dm_crypt):
+        microceph.set_dm_crypt_ready_key("1234:boot-1:dm-crypt")
+        self.dm_crypt_slot.side_effect = ["", ":dm-crypt"]
+        microceph.prepare_dm_crypt()
+        setup_dm_crypt.assert_called_once_with()
+        self.assertEqual(microceph.dm_crypt_ready_key(), "1234:boot-1:dm-crypt")
+
+    @patch("microceph._setup_dm_crypt")
+    @patch("microceph.snap_revision", return_value="")
+    def test_unknown_revision_always_sets_up(self, _snap_revision, setup_dm_crypt):
+        microceph.prepare_dm_crypt()
+        microceph.prepare_dm_crypt()
+        self.assertEqual(setup_dm_crypt.call_count, 2)
+
+    @patch("microceph._setup_dm_crypt")
+    @patch("microceph.snap_revision", return_value="1234")
+    def test_unknown_boot_always_sets_up(self, _snap_revision, setup_dm_crypt):
+        self.boot_id.return_value = ""
+        microceph.prepare_dm_crypt()
+        microceph.prepare_dm_crypt()
+        self.assertEqual(setup_dm_crypt.call_count, 2)
+
+    @patch("microceph._setup_dm_crypt", side_effect=ValueError("plug not connected"))
+    @patch("microceph.snap_revision", return_value="1234")
+    def test_failed_setup_not_recorded(self, _snap_revision, _setup_dm_crypt):
+        with self.assertRaises(ValueError):
+            microceph.prepare_dm_crypt()
+        self.assertEqual(microceph.dm_crypt_ready_key(), "")
+
 
 class TestAZFlagSupported(unittest.TestCase):
 
@@ -0,0 +1,49 @@
+# Copyright 2025 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for pool workload profiles."""
+
+import unittest
+
+from pool_profiles import PROFILES, infer_profile_name, resolve_profile
+
+
+class TestPoolProfiles(unittest.TestCase):
+    """Tests for workload profile resolution."""
+
+    def test_infer_profile_name(self):
+        for app_name, pool_name, expected in (
+            ("rbd", "cinder-ceph", "rbd-vm"),
+            ("rgw", "default.rgw.buckets.index", "rgw-index"),
+            ("rgw", "default.rgw.buckets.data", "rgw-data"),
+            ("rgw", "default.rgw.log", None),
+            ("rgw", "default.rgw.control", None),
+            ("rgw", "default.rgw.meta", None),
+            ("cephfs", "cephfs.ceph-fs.meta", "cephfs-metadata"),
+            ("cephfs", "ceph-fs_metadata", "cephfs-metadata"),
+            ("cephfs", "ceph-fs_data", None),
+            ("unknown", "gnocchi", "gnocchi-metrics"),
+            ("unknown", "glance", None),
+        ):
+            with self.subTest(pool_name=pool_name):
+                self.assertEqual(infer_profile_name(app_name, pool_name), expected)
+
+    def test_requested_profile_wins(self):
+        self.assertIs(resolve_profile("cold-archive", "rbd", "images"), PROFILES["cold-archive"])
+        self.assertIs(resolve_profile(None, "rbd", "images"), PROFILES["rbd-vm"])
+        self.assertIsNone(resolve_profile(None, "unknown", "glance"))
+
+    def test_unknown_profile(self):
+        with self.assertRaisesRegex(ValueError, "Unknown workload profile 'fast'"):
+            resolve_profile("fast", "rbd", "images")
@@ -190,6 +190,42 @@ class TestRelationHelpers(testbase.TestBaseCharm):
         self.assertEqual(change_data["public-address"], "10.0.0.10")
 
 
+class TestUpgradePrefetch(unittest.TestCase):
+    """Tests for starting an upgrade once its snap is prefetched."""
+
+    def setUp(self):
+        self.peers = MagicMock()
+        self.unit = MagicMock()
+        self.unit.name = "microceph/1"
+        self.relation = MagicMock()
+        self.relation.units = {self.unit}
+        self.relation.data = {self.unit: {}}
+
+    def _start(self, deadline):
+        upgrade_info = {
+            "nonce": "n1",
+            "channel": "squid/stable",
+            "nodes": ["microceph/1"],
+            "phase": "prefetch",
+            "prefetch-deadline": deadline,
+        }
+        self.peers.on.upgrade_start.emit.reset_mock()
+        relation_handlers.MicroClusterPeers._handle_prefetch_leader(
+            self.peers, self.relation, upgrade_info
+        )
+        return self.peers.on.upgrade_start.emit
+
+    @patch.object(relation_handlers.time, "time", return_value=1000)
+    def test_prefetch_deadline(self, _time):
+        self._start(1600).assert_not_called()
+        # Past the deadline microceph/1 downloads the snap when it upgrades.
+        with self.assertLogs(relation_handlers.logger, "WARNING"):
+            self._start(900).assert_called_once()
+
+        self.relation.data[self.unit]["upgrade-prefetched"] = "n1"
+        self._start(1600).assert_called_once()
+
+
 class TestCephClientProvides(testbase.TestBaseCharm):
     """Regression tests for mon-address publishing to ceph clients.
 
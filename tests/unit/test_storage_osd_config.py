@@ -14,14 +14,19 @@
 
 """Unit tests for StorageHandler config-driven storage reconciliation."""
 
+import json
+import time
+import unittest
 from subprocess import CalledProcessError
-from unittest.mock import MagicMock, patch
+from unittest.mock import ANY, MagicMock, call, patch
 
 import ops_sunbeam.test_utils as test_utils
 from ops.model import ActiveStatus, BlockedStatus, MaintenanceStatus
 from unit import testbase
 
 import charm
+import storage
+from storage import GiB
 
 
 class TestConfigDrivenStorage(testbase.TestBaseCharm):
@@ -117,6 +122,79 @@ class TestConfigDrivenStorage(testbase.TestBaseCharm):
         # Guard fired: it short-circuits before touching the (quorum-less) cluster.
         remove_osd.assert_not_called()
 
+    @patch("storage.ceph")
+    @patch("storage.microceph.list_disk_cmd")
+    def test_replace_osd_keeps_crush_position(self, list_disk_cmd, ceph):
+        """A destroyed OSD survives its storage detaching and its weight moves to the new OSD."""
+        self._setup_ready_charm()
+        list_disk_cmd.return_value = {"ConfiguredDisks": [{"osd": 5}], "AvailableDisks": []}
+        self.storage._stored.osd_data[5] = {"disk": "osd-standalone/3"}
+        ceph.get_osd_weight.return_value = 3.6
+
+        event = MagicMock()
+        event.params = {"osd-id": 5}
+        self.storage._replace_osd_action(event)
+        ceph.destroy_osd.assert_called_once_with(5)
+        event.fail.assert_not_called()
+
+        detaching = MagicMock()
+        detaching.storage.full_id = "osd-standalone/3"
+        with patch.object(self.storage, "remove_osd") as remove_osd:
+            self.storage._on_storage_detaching(detaching)
+        remove_osd.assert_not_called()
+        self.assertEqual(self.storage._pending_replacements(), [5])
+
+        def _enroll(disks):
+            self.storage._stored.osd_data[8] = {"disk": disks[0]}
+
+        with (
+            patch.object(self.storage, "_enroll_disks_in_batch", side_effect=_enroll),
+            patch("storage.microceph.remove_disk_cmd") as remove_disk_cmd,
+        ):
+            self.storage._enroll_replacements(["osd-standalone/4"])
+
+        ceph.osd_flags.assert_called_once_with("norebalance")
+        ceph.set_osd_crush_weight.assert_called_once_with(8, 3.6)
+        remove_disk_cmd.assert_called_once_with(5, force=True)
+        self.assertEqual(dict(self.storage._stored.osd_data[8]), {"disk": "osd-standalone/4"})
+        self.assertNotIn(5, self.storage._stored.osd_data)
+
+    @patch("storage.ceph")
+    @patch("storage.microceph.list_disk_cmd")
+    def test_replace_osd_resumes_after_failure(self, list_disk_cmd, ceph):
+        """A replacement failing after enrollment keeps its pairing and is resumed."""
+        self._setup_ready_charm()
+        list_disk_cmd.return_value = {"ConfiguredDisks": [{"osd": 5}], "AvailableDisks": []}
+        self.storage._stored.osd_data[5] = {"disk": None, "replacing": True, "weight": 3.6}
+
+        def _enroll(disks):
+            self.storage._stored.osd_data[8] = {"disk": disks[0]}
+
+        with (
+            patch.object(self.storage, "_enroll_disks_in_batch", side_effect=_enroll),
+            patch("storage.microceph.remove_disk_cmd") as remove_disk_cmd,
+        ):
+            remove_disk_cmd.side_effect = CalledProcessError(
+                returncode=1, cmd=["microceph"], stderr="timeout"
+            )
+            with self.assertRaises(storage.sunbeam_guard.BlockedExceptionError):
+                self.storage._enroll_replacements(["osd-standalone/4"])
+
+        # The destroyed OSD is not handed to the next disk.
+        self.assertEqual(self.storage._pending_replacements(), [])
+        self.assertEqual(self.storage._stored.osd_data[5]["replaced_by"], 8)
+
+        # The purge went through despite the error, only the weight is set again.
+        list_disk_cmd.return_value = {"ConfiguredDisks": [{"osd": 8}], "AvailableDisks": []}
+        ceph.set_osd_crush_weight.reset_mock()
+        with patch("storage.microceph.remove_disk_cmd") as remove_disk_cmd:
+            self.storage._on_update_status_replacements(MagicMock())
+
+        ceph.set_osd_crush_weight.assert_called_once_with(8, 3.6)
+        remove_disk_cmd.assert_not_called()
+        self.assertNotIn(5, self.storage._stored.osd_data)
+        self.assertIsInstance(self._storage_status(), ActiveStatus)
+
     def test_attached_storage_does_not_clobber_blocked_workload_status(self):
         """Storage attach should not clear unrelated workload failures."""
         self._setup_ready_charm()
@@ -385,6 +463,7 @@ class TestConfigDrivenStorage(testbase.TestBaseCharm):
             wal_encrypt=False,
             db_wipe=False,
             db_encrypt=False,
+            on_line=ANY,
         )
 
     @patch("storage.microceph.add_disk_match_cmd")
@@ -423,6 +502,7 @@ class TestConfigDrivenStorage(testbase.TestBaseCharm):
             wal_encrypt=True,
             db_wipe=True,
             db_encrypt=False,
+            on_line=ANY,
         )
         self.assertTrue(self.storage._stored.last_storage_config_signature)
         self.assertIsInstance(self._storage_config_status(), ActiveStatus)
@@ -441,6 +521,15 @@ class TestConfigDrivenStorage(testbase.TestBaseCharm):
             )
         )
 
+    def test_enroll_progress_counts_devices(self):
+        """Streamed disk add output is reported as OSD enrollment progress."""
+        on_line = self.storage._enroll_progress(expected=2)
+        on_line("Adding /dev/sdb")
+        on_line("Adding /dev/sdb: done")
+        self.assertEqual(self._storage_config_status().message, "Enrolling OSD 1/2")
+        on_line("Adding /dev/sdc")
+        self.assertEqual(self._storage_config_status().message, "Enrolling OSD 2/2")
+
     @patch("storage.microceph.add_disk_match_cmd")
     def test_no_devices_matched_stays_active(self, add_disk_match_cmd):
         """No matching OSD devices is treated as a no-op, not a failure."""
@@ -493,6 +582,7 @@ class TestConfigDrivenStorage(testbase.TestBaseCharm):
             wal_encrypt=False,
             db_wipe=False,
             db_encrypt=False,
+            on_line=ANY,
         )
         self.assertIsInstance(self._workload_status(), BlockedStatus)
         self.assertEqual(
@@ -526,6 +616,7 @@ class TestConfigDrivenStorage(testbase.TestBaseCharm):
             wal_encrypt=False,
             db_wipe=False,
             db_encrypt=False,
+            on_line=ANY,
         )
         self.assertTrue(self.storage._stored.last_storage_config_signature)
         self.assertIsInstance(self._workload_status(), BlockedStatus)
@@ -676,3 +767,316 @@ class TestConfigDrivenStorage(testbase.TestBaseCharm):
 
         self.assertIsInstance(self._storage_config_status(), BlockedStatus)
         self.assertIn("WAL carrier overlaps", self._storage_config_status().message)
+
+    @patch("storage.microceph.dm_crypt_ready_key", return_value="1234:boot-1:dm-crypt")
+    @patch("storage.microceph.add_disk_match_cmd")
+    def test_encrypted_apply_records_dm_crypt_readiness(self, add_disk_match_cmd, _ready_key):
+        """dm-crypt readiness is kept after an encrypted add and dropped on failure."""
+        self._setup_ready_charm()
+        add_disk_match_cmd.return_value = "configured"
+        self.harness.update_config(
+            {"osd-devices": "eq(@type,'nvme')", "device-add-flags": "encrypt:osd"}
+        )
+        self.assertEqual(self.storage._stored.dm_crypt_ready_key, "1234:boot-1:dm-crypt")
+
+        add_disk_match_cmd.side_effect = CalledProcessError(
+            returncode=1, cmd=["microceph"], stderr="cryptsetup failed"
+        )
+        with patch("storage.microceph.set_dm_crypt_ready_key") as set_ready_key:
+            self.harness.update_config({"osd-devices": "eq(@type,'ssd')"})
+        set_ready_key.assert_called_once_with("")
+
+    @patch("storage.device_inventory.fingerprint")
+    @patch("storage.microceph.add_disk_match_cmd")
+    def test_update_status_enrolls_hotplugged_devices(self, add_disk_match_cmd, fingerprint):
+        """A changed inventory dry-runs the match and enrolls new devices."""
+        self._setup_ready_charm()
+        fingerprint.return_value = "before"
+        add_disk_match_cmd.return_value = "configured"
+        self.harness.update_config({"osd-devices": "eq(@type,'nvme')"})
+        self.assertEqual(self.storage._stored.last_inventory_fingerprint, "before")
+        add_disk_match_cmd.reset_mock()
+
+        # Unchanged inventory, nothing to do.
+        self.storage._on_update_status_hotplug(MagicMock())
+        add_disk_match_cmd.assert_not_called()
+
+        # A disk was hot-plugged and matches.
+        fingerprint.return_value = "after"
+        add_disk_match_cmd.return_value = "/dev/nvme2n1 would be added"
+        self.storage._on_update_status_hotplug(MagicMock())
+
+        self.assertEqual(add_disk_match_cmd.call_count, 2)
+        self.assertTrue(add_disk_match_cmd.call_args_list[0].kwargs["dry_run"])
+        self.assertNotIn("dry_run", add_disk_match_cmd.call_args_list[1].kwargs)
+        self.assertEqual(self.storage._stored.last_inventory_fingerprint, "after")
+
+    @patch("storage.device_inventory.fingerprint")
+    @patch("storage.microceph.add_disk_match_cmd")
+    def test_hotplug_enrolls_after_admission(self, add_disk_match_cmd, fingerprint):
+        """A throttled hot-plug request is enrolled once the unit is admitted."""
+        self._setup_ready_charm()
+        self.harness.set_leader(False)
+        rel_id = self.harness.model.get_relation("peers").id
+        fingerprint.return_value = "before"
+        add_disk_match_cmd.return_value = "configured"
+        self.harness.update_config({"osd-devices": "eq(@type,'nvme')"})
+        self.harness.update_config({"osd-enroll-concurrency": 1})
+        add_disk_match_cmd.reset_mock()
+
+        fingerprint.return_value = "after"
+        add_disk_match_cmd.return_value = "/dev/nvme2n1 would be added"
+        self.storage._on_update_status_hotplug(MagicMock())
+
+        # Only the dry run ran, the request waits for a wave.
+        add_disk_match_cmd.assert_called_once()
+        self.assertTrue(add_disk_match_cmd.call_args.kwargs["dry_run"])
+        unit_data = self.harness.get_relation_data(rel_id, "microceph/0")
+        self.assertTrue(unit_data["osd-enroll-request"])
+        self.assertEqual(self.storage._stored.last_inventory_fingerprint, "before")
+
+        # Still waiting, the inventory is not matched again.
+        self.storage._on_update_status_hotplug(MagicMock())
+        add_disk_match_cmd.assert_called_once()
+
+        add_disk_match_cmd.reset_mock()
+        self.harness.update_relation_data(
+            rel_id,
+            "microceph",
+            {
+                "osd-enroll-wave": json.dumps(
+                    {"id": 1, "state": "enrolling", "units": ["microceph/0"], "flags": []}
+                )
+            },
+        )
+
+        add_disk_match_cmd.assert_called_once()
+        self.assertNotIn("dry_run", add_disk_match_cmd.call_args.kwargs)
+        self.assertEqual(self.storage._stored.last_inventory_fingerprint, "after")
+        self.assertEqual(self.storage._stored.pending_osd_enroll, "")
+        unit_data = self.harness.get_relation_data(rel_id, "microceph/0")
+        self.assertEqual(unit_data["osd-enroll-done"], "1")
+        self.assertEqual(unit_data.get("osd-enroll-request", ""), "")
+
+    @patch("storage.device_inventory.fingerprint")
+    @patch("storage.microceph.add_disk_match_cmd")
+    def test_update_status_no_new_matches(self, add_disk_match_cmd, fingerprint):
+        """A changed inventory without new matches only records the fingerprint."""
+        self._setup_ready_charm()
+        fingerprint.return_value = "before"
+        add_disk_match_cmd.return_value = "configured"
+        self.harness.update_config({"osd-devices": "eq(@type,'nvme')"})
+        add_disk_match_cmd.reset_mock()
+
+        fingerprint.return_value = "after"
+        add_disk_match_cmd.side_effect = CalledProcessError(
+            returncode=1, cmd=["microceph"], stderr="Error: no devices matched"
+        )
+        self.storage._on_update_status_hotplug(MagicMock())
+
+        add_disk_match_cmd.assert_called_once()
+        self.assertTrue(add_disk_match_cmd.call_args.kwargs["dry_run"])
+        self.assertEqual(self.storage._stored.last_inventory_fingerprint, "after")
+
+    @patch("storage.ceph.set_osd_crush_weight")
+    @patch("storage.ceph.get_osd_weight", return_value=2.0)
+    @patch("storage.ceph.osd_flags")
+    @patch("storage.microceph.list_disk_cmd")
+    @patch("storage.microceph.add_disk_match_cmd")
+    def test_weight_ramp_lowers_new_osds(
+        self, add_disk_match_cmd, list_disk_cmd, osd_flags, _get_weight, set_weight
+    ):
+        """New OSDs enrolled from osd-devices start at the first ramp step."""
+        self._setup_ready_charm()
+        self.harness.update_config({"osd-weight-ramp-step": 0.25})
+        list_disk_cmd.side_effect = [{"ConfiguredDisks": [{"osd": 0}]}] + [
+            {"ConfiguredDisks": [{"osd": 0}, {"osd": 1}, {"osd": 2}]}
+        ] * 3
+
+        self.harness.update_config({"osd-devices": "eq(@type,'nvme')"})
+
+        add_disk_match_cmd.assert_called_once()
+        osd_flags.assert_called_once_with("norebalance")
+        set_weight.assert_has_calls([call(1, 0.5), call(2, 0.5)])
+        self.assertEqual(dict(self.storage._stored.ramp_osd_weights), {1: 2.0, 2: 2.0})
+        self.assertEqual(
+            self.storage.ramp_status.status.message, "Ramping CRUSH weight of 2 OSDs: 25%"
+        )
+
+    @patch("storage.ceph.set_osd_crush_weight")
+    @patch("storage.ceph.get_osd_weight")
+    @patch("storage.ceph.get_misplaced_ratio")
+    def test_update_status_steps_weight_ramp(self, get_misplaced_ratio, get_weight, set_weight):
+        """Update-status steps ramping OSDs up while little data is misplaced."""
+        self._setup_ready_charm()
+        self.harness.update_config({"osd-weight-ramp-step": 0.25})
+        self.storage._stored.ramp_osd_weights = {1: 2.0}
+        get_weight.return_value = 1.5
+
+        get_misplaced_ratio.return_value = 0.2
+        self.storage._on_update_status_ramp(MagicMock())
+        set_weight.assert_not_called()
+        self.assertEqual(
+            self.storage.ramp_status.status.message, "OSD weight ramp paused: 20.0% misplaced"
+        )
+
+        get_misplaced_ratio.return_value = 0.01
+        self.storage._on_update_status_ramp(MagicMock())
+        set_weight.assert_called_once_with(1, 2.0)
+        self.assertEqual(dict(self.storage._stored.ramp_osd_weights), {})
+        self.assertEqual(self.storage.ramp_status.status.message, "")
+
+    @patch("storage.ceph.get_misplaced_ratio")
+    def test_update_status_weight_ramp_interval(self, get_misplaced_ratio):
+        """No step is taken before the ramp interval elapsed."""
+        self._setup_ready_charm()
+        self.harness.update_config({"osd-weight-ramp-interval": 3600})
+        self.storage._stored.ramp_osd_weights = {1: 2.0}
+        self.storage._stored.ramp_last_step = time.time()
+
+        self.storage._on_update_status_ramp(MagicMock())
+
+        get_misplaced_ratio.assert_not_called()
+
+    @patch("storage.microceph.add_disk_match_cmd")
+    @patch("storage.microceph._is_block_device_enrollable", return_value=True)
+    @patch("storage.device_inventory.get_inventory")
+    def test_plan_wal_db_action(self, get_inventory, _enrollable, add_disk_match_cmd):
+        """The plan is only reported unless apply is requested."""
+        self._setup_ready_charm()
+        get_inventory.return_value = storage.device_inventory.DeviceInventory(
+            [
+                {"path": "/dev/nvme0n1", "kname": "nvme0n1", "type": "disk", "size": 800 * GiB},
+                {
+                    "path": "/dev/sdb",
+                    "kname": "sdb",
+                    "type": "disk",
+                    "rota": True,
+                    "size": 1000 * GiB,
+                },
+                {
+                    "path": "/dev/sdc",
+                    "kname": "sdc",
+                    "type": "disk",
+                    "rota": True,
+                    "size": 1000 * GiB,
+                },
+            ]
+        )
+
+        event = MagicMock()
+        event.params = {}
+        self.storage._plan_wal_db_action(event)
+
+        add_disk_match_cmd.assert_not_called()
+        plan = event.set_results.call_args[0][0]
+        self.assertEqual(plan["fast-devices"][0]["osds"], ["/dev/sdb", "/dev/sdc"])
+        self.assertEqual(plan["fast-devices"][0]["db-size"], "40GiB")
+
+        event = MagicMock()
+        event.params = {"apply": True}
+        self.storage._plan_wal_db_action(event)
+
+        add_disk_match_cmd.assert_called_once_with(
+            osd_match="in(@devnode,'/dev/sdb','/dev/sdc')",
+            db_match="eq(@devnode,'/dev/nvme0n1')",
+            db_size="40GiB",
+            wipe=False,
+            db_wipe=False,
+        )
+        event.fail.assert_not_called()
+
+
+class TestWalDbPlanner(unittest.TestCase):
+    """Tests for the WAL/DB placement planner."""
+
+    def _disks(self, prefix, count, size, rota):
+        return [
+            {"path": f"/dev/{prefix}{i}", "kname": f"{prefix}{i}", "rota": rota, "size": size}
+            for i in range(count)
+        ]
+
+    def test_caps_hdds_per_nvme(self):
+        nvmes = self._disks("nvme", 2, 4000 * GiB, False)
+        hdds = self._disks("sd", 14, 1000 * GiB, True)
+
+        plan = storage.plan_waldb_placement(hdds, nvmes)
+
+        self.assertEqual([len(s["osds"]) for s in plan["fast-devices"]], [6, 6])
+        self.assertEqual(len(plan["unplaced"]), 2)
+
+    def test_balances_across_fast_devices(self):
+        nvmes = self._disks("nvme", 2, 4000 * GiB, False)
+        hdds = self._disks("sd", 5, 1000 * GiB, True)
+
+        plan = storage.plan_waldb_placement(hdds, nvmes)
+
+        self.assertEqual(sorted(len(s["osds"]) for s in plan["fast-devices"]), [2, 3])
+        self.assertEqual(plan["unplaced"], [])
+
+    def test_db_size_avoids_spillover(self):
+        # Each OSD needs 400GiB of DB, only 2 fit on the NVMe.
+        nvmes = self._disks("nvme", 1, 1000 * GiB, False)
+        hdds = self._disks("sd", 3, 10000 * GiB, True)
+
+        plan = storage.plan_waldb_placement(hdds, nvmes)
+
+        self.assertEqual(len(plan["fast-devices"][0]["osds"]), 2)
+        self.assertEqual(plan["fast-devices"][0]["db-size"], "400GiB")
+        self.assertEqual(len(plan["unplaced"]), 1)
+
+    def test_only_faster_devices_carry_db(self):
+        ssds = self._disks("sd", 2, 1000 * GiB, False)
+
+        plan = storage.plan_waldb_placement(ssds[:1], ssds[1:])
+
+        self.assertEqual(plan["fast-devices"], [])
+        self.assertEqual(plan["unplaced"], ["/dev/sd0"])
+
+    def test_devnode_match(self):
+        self.assertEqual(storage.devnode_match(["/dev/sdb"]), "eq(@devnode,'/dev/sdb')")
+        self.assertEqual(
+            storage.devnode_match(["/dev/sdb", "/dev/sdc"]),
+            "in(@devnode,'/dev/sdb','/dev/sdc')",
+        )
+
+
+class TestOsdBenchSummary(unittest.TestCase):
+    """Tests for the OSD benchmark aggregation."""
+
+    def _bench(self, osd, host, device_class, rate):
+        return {
+            "osd": osd,
+            "host": host,
+            "device-class": device_class,
+            "iops": rate / 4,
+            "mib-per-sec": rate,
+        }
+
+    def test_flags_slow_osds_per_class(self):
+        results = [
+            self._bench(0, "node-1", "hdd", 150.0),
+            self._bench(1, "node-1", "hdd", 160.0),
+            self._bench(2, "node-2", "hdd", 155.0),
+            self._bench(3, "node-2", "hdd", 60.0),
+            # Slow for an SSD, but the only one of its class.
+            self._bench(4, "node-2", "ssd", 140.0),
+        ]
+
+        summary = storage.summarize_osd_bench(results, 3.0)
+
+        self.assertEqual(summary["slow-osds"], [3])
+        hdd, ssd = summary["device-classes"]
+        self.assertEqual(hdd["device-class"], "hdd")
+        self.assertEqual(hdd["median-mib-per-sec"], 152.5)
+        self.assertEqual(hdd["mad-mib-per-sec"], 5.0)
+        self.assertEqual(ssd["osds"], 1)
+        self.assertEqual(
+            [(h["host"], h["osds"], h["total-mib-per-sec"]) for h in summary["hosts"]],
+            [("node-1", 2, 310.0), ("node-2", 3, 355.0)],
+        )
+
+    def test_uniform_class_has_no_outliers(self):
+        results = [self._bench(osd, "node-1", "ssd", 500.0) for osd in range(3)]
+
+        self.assertEqual(storage.summarize_osd_bench(results, 3.0)["slow-osds"], [])
@@ -0,0 +1,125 @@
+# Copyright 2025 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for upgrade timelines."""
+
+import unittest
+
+import upgrade_timeline
+
+
+def _stamps(start, prefetch=10, refresh=60, osds=20, health=30):
+    """Return the timestamps of a node upgrade starting at start."""
+    stamps = {"queued": start, "prefetched": start + prefetch}
+    t = stamps["prefetched"]
+    for phase, duration in (
+        ("refresh-start", 0),
+        ("refresh-end", refresh),
+        ("health-wait", osds),
+        ("done", health),
+    ):
+        t += duration
+        stamps[phase] = t
+    return stamps
+
+
+class TestTimeline(unittest.TestCase):
+
+    def test_record_round_trip(self):
+        value = upgrade_timeline.record(None, "n1", "queued", now=1000)
+        value = upgrade_timeline.record(value, "n1", "refresh-start", now=1042)
+        self.assertEqual(value, '["n1",1000,0,null,42,null,null,null]')
+        self.assertEqual(
+            upgrade_timeline.decode(value), ("n1", {"queued": 1000, "refresh-start": 1042})
+        )
+
+        # A new upgrade starts a new timeline.
+        value = upgrade_timeline.record(value, "n2", "queued", now=2000)
+        self.assertEqual(upgrade_timeline.decode(value), ("n2", {"queued": 2000}))
+
+    def test_merge(self):
+        peer = '["n1",1000,0,5,null,null,null,null]'
+        live = '["n1",1000,0,5,5,65,null,null]'
+        self.assertEqual(
+            upgrade_timeline.merge(peer, live),
+            (
+                "n1",
+                {"queued": 1000, "prefetched": 1005, "refresh-start": 1005, "refresh-end": 1065},
+            ),
+        )
+        # The upgrade which started last wins.
+        self.assertEqual(
+            upgrade_timeline.merge(live, '["n2",2000,0,null,null,null,null,null]', None),
+            ("n2", {"queued": 2000}),
+        )
+        self.assertEqual(upgrade_timeline.merge(None, ""), ("", {}))
+
+    def test_decode_malformed(self):
+        for value in (None, "", "{}", "42", "not json"):
+            self.assertEqual(upgrade_timeline.decode(value), ("", {}), value)
+
+    def test_node_report(self):
+        report = upgrade_timeline.node_report("microceph/1", _stamps(0, health=300))
+        self.assertEqual(
+            report,
+            {
+                "node": "microceph/1",
+                "phase": "done",
+                "prefetch": 10,
+                "refresh": 60,
+                "osds-up": 20,
+                "health-wait": 300,
+                "total": 380,
+            },
+        )
+
+    def test_critical_path_groups_concurrent_nodes(self):
+        timelines = {
+            "microceph/0": _stamps(0),
+            # Upgrade concurrently, microceph/2 is slower.
+            "microceph/1": _stamps(200),
+            "microceph/2": _stamps(205, health=500),
+            "microceph/3": _stamps(1000),
+        }
+        self.assertEqual(
+            upgrade_timeline.critical_path(timelines),
+            [
+                {"node": "microceph/0", "duration": 110, "slowest-phase": "refresh"},
+                {"node": "microceph/2", "duration": 585, "slowest-phase": "health-wait"},
+                {"node": "microceph/3", "duration": 110, "slowest-phase": "refresh"},
+            ],
+        )
+
+    def test_summarize_eta(self):
+        upgrade_info = {
+            "nonce": "n1",
+            "nodes": ["microceph/2", "microceph/3", "microceph/4"],
+            "batches": [["microceph/2"], ["microceph/3", "microceph/4"]],
+        }
+        timelines = {"microceph/0": _stamps(0), "microceph/1": _stamps(110)}
+        summary = upgrade_timeline.summarize(upgrade_info, timelines, now=300)
+
+        self.assertEqual(summary["state"], "upgrading")
+        self.assertEqual(summary["elapsed"], 300)
+        self.assertEqual(summary["eta"], 220)
+        self.assertEqual(summary["pending"], upgrade_info["nodes"])
+
+    def test_summarize_done(self):
+        summary = upgrade_timeline.summarize({}, {"microceph/0": _stamps(0)}, now=500)
+        self.assertEqual(summary["state"], "done")
+        self.assertEqual(summary["eta"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -15,6 +15,7 @@
 """Tests for utils module."""
 
 import subprocess
+import sys
 import unittest
 from unittest.mock import MagicMock, patch
 
@@ -60,6 +61,41 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(ctx.exception.returncode, 2)
 
 
+class TestStreamCmd(unittest.TestCase):
+    """Tests for the streaming command runner."""
+
+    def _python(self, code):
+        return [sys.executable, "-c", code]
+
+    def test_yields_lines_as_printed(self):
+        cmd = self._python("import sys; print('one'); sys.stderr.write('two\\n'); print('three')")
+        self.assertEqual(list(utils.stream_cmd(cmd)), ["one", "two", "three"])
+
+    def test_failure_keeps_bounded_tail(self):
+        cmd = self._python("import sys; [print(i) for i in range(100)]; sys.exit(3)")
+        lines = []
+        with self.assertRaises(subprocess.CalledProcessError) as ctx:
+            for line in utils.stream_cmd(cmd, tail_lines=5):
+                lines.append(line)
+        self.assertEqual(len(lines), 100)
+        self.assertEqual(ctx.exception.returncode, 3)
+        self.assertEqual(ctx.exception.stderr, "95\n96\n97\n98\n99")
+
+    def test_timeout_kills_command(self):
+        cmd = self._python("import time; print('started', flush=True); time.sleep(30)")
+        with self.assertRaises(subprocess.TimeoutExpired) as ctx:
+            list(utils.stream_cmd(cmd, timeout=0.5))
+        self.assertEqual(ctx.exception.output, "started")
+
+    def test_run_cmd_streaming_forwards_lines(self):
+        seen = []
+        output = utils.run_cmd_streaming(
+            self._python("print('a'); print('b')"), on_line=seen.append
+        )
+        self.assertEqual(seen, ["a", "b"])
+        self.assertEqual(output, "a\nb")
+
+
 class TestGetMonAddresses(unittest.TestCase):
     """get_mon_addresses must cross-check the live monmap to drop dead mons.
 